@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+# Micro-benchmark of Playbook construction cost.
+#
+#   python benchmarks/construction.py [number]
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dauber import Playbook
+import dauber.playbook as playbook
+
+
+def construct():
+    Playbook("some_playbook.yml", "some_inventory")
+
+
+def construct_with_env():
+    p = Playbook("some_playbook.yml", "some_inventory",
+                 env={"ANSIBLE_FORCE_COLOR": "0"})
+    p.set_host_key_checking(False)
+
+
+def construct_cold_cache():
+    playbook._executable_cache['path'] = None
+    Playbook("some_playbook.yml", "some_inventory")
+
+
+def main(number):
+    for func in (construct, construct_with_env, construct_cold_cache):
+        best = min(timeit.repeat(func, number=number, repeat=3))
+        print("{:<24} {:>10.2f} us per Playbook".format(
+            func.__name__, best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
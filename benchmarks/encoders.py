@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+# Cost of encoding real TaskResult objects (as the callback plugin receives
+# them) with the plugin's encoders,  compared with the isinstance scan over
+# the encoder table the plugin used to do for every object.
+#
+#   python benchmarks/encoders.py [number]
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import timeit
+
+import pkg_resources as pr
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Normally imported by ansible before it loads callback plugins
+import ansible.plugins.callback
+from ansible.executor.task_result import TaskResult
+from ansible.inventory.host import Host
+from ansible.playbook.task import Task
+
+import imp
+plugin = imp.load_source(
+    'dauber_zmq_callback',
+    pr.resource_filename('dauber', 'ansible/callback_plugins/zmq.py'))
+
+
+class ScanningEncoder(json.JSONEncoder):
+    def default(self, obj):
+        for cls, func in plugin.ENCODERS.items():
+            if isinstance(obj, cls):
+                return func(obj)
+
+        return json.JSONEncoder.default(self, obj)
+
+
+def task_result(i):
+    task = Task.load({'name': 'install httpd',
+                      'yum': {'name': 'httpd', 'state': 'present'}})
+    return TaskResult(Host('host%d' % i), task, {
+        "changed": i % 3 == 0,
+        "cmd": ["yum", "-y", "install", "httpd"],
+        "rc": 0,
+        "stdout": "Loaded plugins: fastestmirror\n" * 20,
+        "stdout_lines": ["Loaded plugins: fastestmirror"] * 20,
+        "invocation": {"module_args": {"name": ["httpd"],
+                                       "state": "present"},
+                       "module_name": "yum"},
+        "_ansible_no_log": False,
+        "results": [{"item": n, "ok": True} for n in range(10)]
+    })
+
+
+def measure(name, dumps, events, number):
+    seconds = min(timeit.repeat(
+        lambda: [dumps(e) for e in events], number=number, repeat=3))
+    print("{:<26} {:>9.0f} events/s".format(
+        name, number * len(events) / seconds))
+
+
+def main(number):
+    events = [(task_result(i),) for i in range(100)]
+
+    measure("json, isinstance scan",
+            lambda e: json.dumps(e, cls=ScanningEncoder), events, number)
+    measure("json, cached lookup", plugin.json_dumps, events, number)
+
+    if plugin.msgpack is not None:
+        scan = ScanningEncoder().default
+        measure("msgpack, isinstance scan",
+                lambda e: plugin.msgpack.packb(e, default=scan,
+                                               use_bin_type=False),
+                events, number)
+        measure("msgpack, cached lookup", plugin.msgpack_dumps, events, number)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
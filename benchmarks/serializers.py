@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+# Throughput of the callback plugin payload serializers on a verbose
+# TaskResult shaped event.
+#
+#   python benchmarks/serializers.py [number]
+
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dauber import wire
+
+
+def task_result(i):
+    return [{
+        "_result": {
+            "changed": i % 3 == 0,
+            "cmd": ["yum", "-y", "install", "httpd"],
+            "rc": 0,
+            "stdout": "Loaded plugins: fastestmirror\n" * 20,
+            "stdout_lines": ["Loaded plugins: fastestmirror"] * 20,
+            "invocation": {"module_args": {"name": ["httpd"],
+                                           "state": "present"},
+                           "module_name": "yum"},
+            "_ansible_no_log": False,
+            "results": [{"item": n, "ok": True} for n in range(10)]
+        },
+        "_task": {"action": "yum", "name": "install httpd",
+                  "tags": [], "when": [], "uuid": "%032x" % i,
+                  "args": {"name": "httpd", "state": "present"}}
+    }]
+
+
+def main(number):
+    events = [task_result(i) for i in range(100)]
+
+    for name in sorted(wire.SERIALIZERS):
+        s = wire.SERIALIZERS[name]
+        frames = [s.dumps(e) for e in events]
+        size = sum(len(f) for f in frames)
+
+        dumps = min(timeit.repeat(
+            lambda: [s.dumps(e) for e in events], number=number, repeat=3))
+        loads = min(timeit.repeat(
+            lambda: [s.loads(f) for f in frames], number=number, repeat=3))
+
+        n = number * len(events)
+        print("{:<8} {:>6} bytes/event  dumps {:>9.0f} events/s  "
+              "loads {:>9.0f} events/s".format(
+                  name, size // len(events), n / dumps, n / loads))
+
+    if wire.msgpack is None:
+        print("msgpack is not installed, only json was measured")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -0,0 +1,227 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import threading
+
+from timing import monotonic
+
+COUNTERS = ('ok', 'changed', 'failed', 'skipped', 'unreachable')
+
+# The fields of each hook's first argument the aggregator needs (see the
+# 'fields' argument of ZMQPlaybook.add_hook())
+TASK_FIELDS = ['_uuid', 'name', 'action']
+RESULT_FIELDS = ['_task._uuid', '_task.name', '_task.action']
+
+HOOK_FIELDS = {
+    'v2_playbook_on_play_start': ['name'],
+    'v2_playbook_on_task_start': TASK_FIELDS,
+    'v2_playbook_on_handler_task_start': TASK_FIELDS,
+    'v2_runner_on_ok': RESULT_FIELDS + ['_result.changed'],
+    'v2_runner_on_failed': RESULT_FIELDS,
+    'v2_runner_on_skipped': RESULT_FIELDS,
+    'v2_runner_on_unreachable': RESULT_FIELDS,
+    'v2_playbook_on_stats': []
+}
+
+
+def task_uuid(task):
+    # The projected fields,  or the full Task.serialize() of hooks someone
+    # else needs in full
+    return task.get('_uuid', task.get('uuid'))
+
+
+def task_name(task):
+    return task.get('name') or task.get('action')
+
+
+def _counters():
+    return dict.fromkeys(COUNTERS, 0)
+
+
+class RunAggregator(object):
+    '''
+    Keeps per host and per task counts of ok,  changed,  failed,  skipped
+    and unreachable results as the events of a ZMQPlaybook run arrive,
+    along with the task currently running. Counts follow ansible's recap:
+    'ok' includes changed results and failures with ignore_errors set.
+
+        aggregator = RunAggregator()
+        aggregator.attach(pb)
+
+    snapshot() may be called from any thread at any time. Each snapshot
+    only rebuilds the entries of the hosts and tasks that changed since the
+    previous one,  and returns the previous snapshot as is when nothing
+    changed,  so it can be polled often on large runs. Snapshots share
+    their entries and must be treated as read only.
+    '''
+
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self._totals = _counters()
+            self._hosts = {}
+            self._tasks = {}
+            self._task_order = []
+            self._host_tasks = {}
+            self._play = None
+            self._current = None
+            self._done = False
+            self._events = 0
+
+            self._dirty_hosts = set()
+            self._dirty_tasks = set()
+            self._snapshot = None
+
+    def attach(self, playbook):
+        '''
+        Register the aggregator's hooks on a ZMQPlaybook (or anything with
+        the same add_hook(),  e.g. a ShardedPlaybook).
+        '''
+        for hook, fields in HOOK_FIELDS.items():
+            playbook.add_hook(hook, getattr(self, '_' + hook), lazy=True,
+                              fields=fields)
+
+    ############
+    ## Hooks
+    ####
+
+    def _v2_playbook_on_play_start(self, event):
+        with self.lock:
+            self._events += 1
+            self._play = (event.result or {}).get('name')
+
+    def _v2_playbook_on_task_start(self, event):
+        task = event.result or {}
+        with self.lock:
+            self._events += 1
+            uuid = self._task(task)
+            self._current = uuid
+            self._tasks[uuid]['started'] = self.clock()
+            self._dirty_tasks.add(uuid)
+
+    _v2_playbook_on_handler_task_start = _v2_playbook_on_task_start
+
+    def _v2_runner_on_ok(self, event):
+        changed = (event.result or {}).get('_result', {}).get('changed')
+        self._count(event, ('ok', 'changed') if changed else ('ok',))
+
+    def _v2_runner_on_failed(self, event):
+        ignored = event.kwargs.get('ignore_errors')
+        self._count(event, ('ok',) if ignored else ('failed',))
+
+    def _v2_runner_on_skipped(self, event):
+        self._count(event, ('skipped',))
+
+    def _v2_runner_on_unreachable(self, event):
+        self._count(event, ('unreachable',))
+
+    def _v2_playbook_on_stats(self, event):
+        with self.lock:
+            self._events += 1
+            self._done = True
+            self._current = None
+
+    def _count(self, event, counters):
+        host = event.host
+        task = (event.result or {}).get('_task', {})
+        with self.lock:
+            self._events += 1
+            uuid = self._task(task)
+
+            host_counts = self._hosts.get(host)
+            if host_counts is None:
+                host_counts = self._hosts[host] = _counters()
+
+            task_counts = self._tasks[uuid]['counts']
+            for name in counters:
+                self._totals[name] += 1
+                host_counts[name] += 1
+                task_counts[name] += 1
+
+            self._host_tasks[host] = uuid
+            self._dirty_hosts.add(host)
+            self._dirty_tasks.add(uuid)
+
+    # Must hold self.lock
+    def _task(self, task):
+        uuid = task_uuid(task)
+        if uuid not in self._tasks:
+            self._tasks[uuid] = {'name': task_name(task),
+                                 'play': self._play,
+                                 'started': None,
+                                 'counts': _counters()}
+            self._task_order.append(uuid)
+        return uuid
+
+    ############
+    ## Snapshots
+    ####
+
+    def snapshot(self):
+        '''
+        Return a dict with the 'totals' of each counter,  the counters of
+        each host ('hosts',  with the 'task' it last reported a result
+        for),  the 'tasks' in the order they started (each with its 'uuid',
+        'name',  'play',  'started' time and 'counts'),  the 'current' task
+        (or None),  whether the run is 'done' and the number of 'events'
+        seen.
+        '''
+        with self.lock:
+            previous = self._snapshot
+            if previous is not None and previous['events'] == self._events:
+                return previous
+
+            if previous is None:
+                hosts, tasks = {}, {}
+                dirty_hosts, dirty_tasks = self._hosts, self._tasks
+            else:
+                hosts = previous['hosts'].copy()
+                tasks = dict((t['uuid'], t) for t in previous['tasks'])
+                dirty_hosts, dirty_tasks = self._dirty_hosts, self._dirty_tasks
+
+            for host in dirty_hosts:
+                entry = dict(self._hosts[host])
+                entry['task'] = self._host_tasks.get(host)
+                hosts[host] = entry
+
+            for uuid in dirty_tasks:
+                task = self._tasks[uuid]
+                tasks[uuid] = {'uuid': uuid,
+                               'name': task['name'],
+                               'play': task['play'],
+                               'started': task['started'],
+                               'counts': dict(task['counts'])}
+
+            current = tasks.get(self._current) \
+                if self._current is not None else None
+
+            self._snapshot = {
+                'totals': dict(self._totals),
+                'hosts': hosts,
+                'tasks': [tasks[uuid] for uuid in self._task_order],
+                'current': current,
+                'play': self._play,
+                'done': self._done,
+                'events': self._events
+            }
+            self._dirty_hosts = set()
+            self._dirty_tasks = set()
+
+            return self._snapshot
@@ -16,6 +16,18 @@ import json
 import uuid
 import os
 import time
+import atexit
+import struct
+import inspect
+import platform
+import importlib
+import threading
+import collections
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 HOOK_NAMES = [
     'v2_runner_on_failed',
@@ -46,25 +58,292 @@ def pluck(fields):
     return _serialize
 
 
+# Encoders for the types json and msgpack cannot serialize themselves,
+# keyed by class. An object is encoded by the encoder registered for the
+# nearest class in its MRO;  the lookup is cached per concrete type.
+#
+# Deployments can add encoders for their own types (e.g. HostVars) without
+# editing this plugin: list modules in DAUBER_ENCODERS (comma separated,  see
+# ZMQPlaybook's 'encoders' keyword) and define a register(register_encoder)
+# function in each,  which is called when the plugin loads.
+ENCODERS = {
+    uuid.UUID: str,
+    Playbook: pluck(['_file_name', '_basedir', '_entries']),
+    Task: Task.serialize,
+    Play: Play.serialize,
+    Block: Block.serialize,
+    TaskResult: pluck(['_result', '_task']),
+    AggregateStats: pluck(['ok', 'changed', 'failures', 'skipped', 'processed'])
+}
+
+_resolved = {}
+
+
+def register_encoder(cls, encoder):
+    """
+    Encode instances of cls (and its subclasses,  unless they have an
+    encoder of their own) as encoder(obj).
+    """
+    ENCODERS[cls] = encoder
+    _resolved.clear()
+
+
+def encoder_for(cls):
+    try:
+        return _resolved[cls]
+    except KeyError:
+        pass
+
+    encoder = None
+    for base in inspect.getmro(cls):
+        if base in ENCODERS:
+            encoder = ENCODERS[base]
+            break
+
+    _resolved[cls] = encoder
+    return encoder
+
+
+def load_encoders(modules):
+    for name in modules:
+        importlib.import_module(name).register(register_encoder)
+
+
 class CustomEncoder(json.JSONEncoder):
-    class_map = {
-        uuid.UUID: str,
-        Playbook: pluck(['_file_name', '_basedir', '_entries']),
-        Task: Task.serialize,
-        Play: Play.serialize,
-        Block: Block.serialize,
-        TaskResult: pluck(['_result', '_task']),
-        AggregateStats: pluck(['ok', 'changed', 'failures', 'skipped', 'processed'])
-    }
+    class_map = ENCODERS
 
     def default(self, obj):
-        for cls, func in self.class_map.items():
-            if isinstance(obj, cls):
-                return func(obj)
+        encoder = encoder_for(obj.__class__)
+        if encoder is not None:
+            return encoder(obj)
 
         return json.JSONEncoder.default(self, obj)
 
 
+_MISSING = object()
+
+
+def project(obj, paths):
+    '''
+    Build nested dicts holding only the dotted attribute (or key) paths of
+    obj listed in paths. Paths that do not resolve are left out.
+    '''
+    projection = {}
+    for path in paths:
+        parts = path.split('.')
+        value = obj
+        for part in parts:
+            value = value.get(part, _MISSING) if isinstance(value, dict) \
+                else getattr(value, part, _MISSING)
+            if value is _MISSING:
+                break
+        else:
+            target = projection
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = value
+
+    return projection
+
+
+# Payload encoders,  keyed by the names dauber asks for through
+# DAUBER_SERIALIZER (see dauber/wire.py for the decoding side).
+def json_dumps(obj):
+    return json.dumps(obj, cls=CustomEncoder)
+
+
+def msgpack_dumps(obj, _default=CustomEncoder().default):
+    return msgpack.packb(obj, default=_default, use_bin_type=False)
+
+
+SERIALIZERS = {'json': json_dumps}
+
+if msgpack is not None:
+    SERIALIZERS['msgpack'] = msgpack_dumps
+
+
+# Several events can be sent as one 'batch' message whose single frame holds
+# the frames of each event (topic, header, args, kwargs),  every one
+# prefixed with its length (see dauber/wire.py for the unpacking side).
+_LENGTH = struct.Struct('!I')
+
+
+def pack_frames(frames):
+    return b''.join(_LENGTH.pack(len(f)) + f for f in frames)
+
+
+POLICIES = ('block', 'drop', 'spill')
+
+# Seconds to wait at exit for messages still queued on the socket under
+# the 'drop' policy,  which must not hold up ansible-playbook
+DROP_LINGER = 0.5
+
+
+class Publisher(object):
+    """
+    Sends messages on the XPUB socket. What happens when dauber falls
+    behind and the socket's send high-water mark is reached depends on the
+    policy:
+
+      'block'  wait for room,  which holds up ansible's strategy loop.
+      'drop'   discard the message.
+      'spill'  keep the message in memory (up to spill_limit messages,
+               after which messages are dropped) and send it,  in order,
+               as soon as there is room.
+
+    'sent',  'dropped' and 'spilled' count events (a batch counts as the
+    events it holds); spilled events are also counted as sent once they
+    are.
+    """
+
+    def __init__(self, socket, policy='drop', spill_limit=100000):
+        if policy not in POLICIES:
+            policy = 'drop'
+
+        self.socket = socket
+        self.policy = policy
+        self.spill_limit = spill_limit
+        self.spill = collections.deque()
+        self.counters = {'sent': 0, 'dropped': 0, 'spilled': 0}
+        self.lock = threading.Lock()
+
+        # Make the socket report a full queue instead of silently
+        # discarding the message
+        self.socket.setsockopt(zmq.XPUB_NODROP, 1)
+
+    def send(self, frames, events=1):
+        with self.lock:
+            if self.policy == 'block':
+                self.socket.send_multipart(frames)
+                self.counters['sent'] += events
+                return
+
+            # Spilled messages go first
+            if self.spill and not self._send_spill():
+                self._spill(frames, events)
+                return
+
+            try:
+                self.socket.send_multipart(frames, zmq.NOBLOCK)
+                self.counters['sent'] += events
+            except zmq.Again:
+                if self.policy == 'spill':
+                    self._spill(frames, events)
+                else:
+                    self.counters['dropped'] += events
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+    def close(self, timeout):
+        # Wait up to timeout seconds for each spilled message
+        with self.lock:
+            self.socket.setsockopt(zmq.SNDTIMEO, int(timeout * 1000))
+            while self.spill:
+                frames, events = self.spill.popleft()
+                try:
+                    self.socket.send_multipart(frames)
+                    self.counters['sent'] += events
+                except zmq.Again:
+                    self.counters['dropped'] += events + sum(
+                        e for _, e in self.spill)
+                    self.spill.clear()
+
+    # Must hold self.lock
+    def _spill(self, frames, events):
+        if len(self.spill) >= self.spill_limit:
+            self.counters['dropped'] += events
+        else:
+            self.spill.append((frames, events))
+            self.counters['spilled'] += events
+
+    # Must hold self.lock
+    def _send_spill(self):
+        while self.spill:
+            frames, events = self.spill[0]
+            try:
+                self.socket.send_multipart(frames, zmq.NOBLOCK)
+            except zmq.Again:
+                return False
+            self.spill.popleft()
+            self.counters['sent'] += events
+        return True
+
+
+class Batcher(object):
+    """
+    Buffers events and publishes them as 'batch' messages once 'size'
+    events are buffered,  the oldest buffered event is 'interval' seconds
+    old or flush() is called. The interval is kept by a background thread;
+    all sends on the socket go through the lock.
+    """
+
+    def __init__(self, publisher, size, interval, prefix=''):
+        self.publisher = publisher
+        self.prefix = prefix
+        self.size = size
+        self.interval = interval
+
+        self.frames = []
+        self.count = 0
+        self.first = None
+        self.closed = False
+
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._flush_on_interval)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, frames, flush=False):
+        with self.cond:
+            if not self.frames:
+                self.first = time.time()
+                self.cond.notify()
+
+            self.frames.extend(frames)
+            self.count += 1
+
+            if flush or self.count >= self.size:
+                self._flush()
+
+    def flush(self):
+        with self.cond:
+            self._flush()
+
+    def close(self):
+        # Flush and stop the thread before the interpreter starts tearing
+        # down the modules it uses
+        with self.cond:
+            if self.closed:
+                return
+            self._flush()
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+
+    # Must hold self.cond
+    def _flush(self):
+        if self.frames:
+            self.publisher.send([self.prefix + 'batch',
+                                 pack_frames(self.frames)], self.count)
+            self.frames = []
+            self.count = 0
+
+    def _flush_on_interval(self):
+        with self.cond:
+            while not self.closed:
+                if not self.frames:
+                    self.cond.wait()
+                    continue
+
+                remaining = self.first + self.interval - time.time()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                else:
+                    self._flush()
+
+
 class CallbackModule(ansible.plugins.callback.CallbackBase):
     """
     This is a callback designed to create a local IPC based zmq socket
@@ -86,55 +365,155 @@ class CallbackModule(ansible.plugins.callback.CallbackBase):
         self.publish('v2_playbook_on_start', playbook)
 
 
-    # See: http://zguide.zeromq.org/page:all#toc47
-    def _wait_for_goahead(self):
-        control_socket = self.context.socket(zmq.REP)
-        control_socket.bind(os.environ['DAUBER_CONTROL_SOCKET_URI'])
+    # Solves the late joiner problem (see:
+    # http://zguide.zeromq.org/page:all#toc47). dauber binds a SUB socket and
+    # we connect an XPUB socket to it,  which hands us a message for each of
+    # dauber's subscriptions. Once all of the topics dauber listens to are
+    # subscribed nothing we publish can be lost,  so we say hello (naming our
+    # serializer) and carry on.
+    #
+    # Runs on a dauber EventBus share its socket. Their topics are prefixed
+    # with the run ID,  so we wait for (and only receive events for) our own
+    # run's subscriptions.
+    def _wait_for_subscribers(self, timeout):
+        expected = set(['hello'])
+        if self.topics is not None:
+            expected.update(self.topics)
+        if os.environ.get('DAUBER_BATCH_SIZE'):
+            expected.add('batch')
+        expected.add('bye')
+        expected = set(self.prefix + topic for topic in expected)
 
-        poller = zmq.Poller()
-        poller.register(control_socket)
+        deadline = time.time() + timeout
+        while expected:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not self.socket.poll(remaining * 1000):
+                raise RuntimeError(
+                    "Timed out after {} seconds waiting for dauber to "
+                    "subscribe on {}".format(
+                        timeout, os.environ.get('DAUBER_SOCKET_URI')))
 
-        timeout = 500
-        t_last = time.time()
-        while (time.time() - t_last) < timeout:
-            ready = dict(poller.poll(10))
-            if ready.get(control_socket):
-                control_socket.recv()
+            message = self.socket.recv()
+            if message[:1] == b'\x01':
+                expected.discard(message[1:])
 
-                control_socket.send(b'')
+        self.socket.send_multipart([self.prefix + 'hello', self.serializer])
 
-                break
+    def __init__(self, *args, **kwargs):
+        # Fall back to json if the requested serializer is not available
+        self.serializer = os.environ.get('DAUBER_SERIALIZER', 'json')
+        if self.serializer not in SERIALIZERS:
+            self.serializer = 'json'
+        self.dumps = SERIALIZERS[self.serializer]
 
-            self.socket.send_multipart(['hello', b''])
-            t_last = time.time()
+        if os.environ.get('DAUBER_ENCODERS'):
+            load_encoders(os.environ['DAUBER_ENCODERS'].split(','))
 
-        assert (time.time() - t_last) < timeout, \
-            "Timed out before recieving a signal to continue"
+        # Per hook lists of the fields dauber needs from the first argument
+        self.fields = json.loads(os.environ.get('DAUBER_FIELDS', '{}'))
 
-        del control_socket
+        # The hooks dauber listens to,  events for other hooks are not sent
+        # at all. Everything is sent if dauber does not say.
+        self.topics = os.environ.get('DAUBER_TOPICS')
+        if self.topics is not None:
+            self.topics = set(t for t in self.topics.split(',') if t)
 
+        # Set when dauber's socket is shared by several runs
+        run_id = os.environ.get('DAUBER_RUN_ID')
+        self.prefix = run_id + '/' if run_id else ''
+
+        # Every event says which controller (node) and run it comes from,
+        # so events collected from several controllers can be told apart
+        self.tags = {'node': os.environ.get('DAUBER_NODE') or platform.node()}
+        if run_id:
+            self.tags['run'] = run_id
 
-    def __init__(self, *args, **kwargs):
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.PUB)
+        self.socket = self.context.socket(zmq.XPUB)
+        if os.environ.get('DAUBER_SNDHWM'):
+            self.socket.setsockopt(zmq.SNDHWM,
+                                   int(os.environ['DAUBER_SNDHWM']))
         try:
-            self.socket.bind(os.environ['DAUBER_SOCKET_URI'])
-
-            # Slow joiner problem
-            # time.sleep(0.2)
+            self.socket.connect(os.environ['DAUBER_SOCKET_URI'])
         except KeyError:
             # What do now?
             pass
 
-        # Make sure we've got the go-ahead from the subscriber before
-        # we start publishing data (solves late joiner problem more
-        # robustly than by just 'sleeping'
-        self._wait_for_goahead()
+        # Make sure dauber is listening before we start publishing data
+        self.timeout = float(os.environ.get('DAUBER_HANDSHAKE_TIMEOUT', '60'))
+        self._wait_for_subscribers(self.timeout)
+
+        self.publisher = Publisher(
+            self.socket, os.environ.get('DAUBER_PUBLISH_POLICY', 'drop'),
+            int(os.environ.get('DAUBER_SPILL_LIMIT', '100000')))
+
+        self.batcher = None
+        if os.environ.get('DAUBER_BATCH_SIZE'):
+            self.batcher = Batcher(
+                self.publisher, int(os.environ['DAUBER_BATCH_SIZE']),
+                float(os.environ.get('DAUBER_BATCH_INTERVAL', '0.1')),
+                self.prefix)
+
+        atexit.register(self.close)
+
+    # Tell dauber that nothing else is coming,  once anything still buffered
+    # has been sent. dauber keeps reading until it sees this,  so events
+    # sent just before ansible-playbook exits (e.g. the stats) are not lost.
+    # The 'bye' carries the final publishing counters. Under the 'drop'
+    # policy neither sending it nor delivering what is still queued may
+    # keep ansible-playbook waiting for long;  'block' and 'spill' wait up
+    # to the handshake timeout for each.
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+        self.publisher.close(self.timeout)
+
+        drop = self.publisher.policy == 'drop'
+        try:
+            self.socket.send_multipart(
+                [self.prefix + 'bye', self.dumps(self.publisher.stats())],
+                zmq.NOBLOCK if drop else 0)
+        except zmq.Again:
+            pass
+
+        # Give up on delivering if dauber has gone away
+        linger = DROP_LINGER if drop else self.timeout
+        self.socket.setsockopt(zmq.LINGER, int(linger * 1000))
+        self.socket.close()
+        self.context.term()
+
+    # The header is a small frame with what consumers most often filter
+    # on,  so dauber can read it without decoding the full payload. 'time'
+    # is when the event happened,  before any batching or queueing.
+    def header(self, args):
+        header = dict(self.tags, time=time.time())
+        for arg in args:
+            if isinstance(arg, TaskResult):
+                header['host'] = arg._host.get_name()
+                break
+        return header
 
     def publish(self, topic, *args, **kwargs):
-        self.socket.send_multipart(
-            [topic, json.dumps(args, cls=CustomEncoder),
-             json.dumps(kwargs, cls=CustomEncoder)])
+        if self.topics is not None and topic not in self.topics:
+            return
+
+        header = self.header(args)
+        if topic == 'v2_playbook_on_stats':
+            # As they stand before the stats themselves are sent
+            header['publish'] = self.publisher.stats()
+
+        if topic in self.fields and args:
+            args = (project(args[0], self.fields[topic]),) + args[1:]
+
+        frames = [topic, self.dumps(header), self.dumps(args),
+                  self.dumps(kwargs)]
+
+        if self.batcher is not None:
+            # Stats are the last event of a run,  send them right away
+            self.batcher.add(frames, flush=topic == 'v2_playbook_on_stats')
+        else:
+            frames[0] = self.prefix + topic
+            self.publisher.send(frames)
 
 
 # Proxy through all hooks to publish
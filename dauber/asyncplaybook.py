@@ -0,0 +1,225 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+
+from playbook import Playbook
+from zmqplaybook import ZMQPlaybook
+from output import LineReader
+from loop import EventLoop, PlaybookRun
+from timing import RunTimings
+
+
+class AsyncPlaybook(Playbook):
+    '''
+    A Playbook whose run() returns a PlaybookRun handle immediately rather
+    than blocking until ansible-playbook exits. Runs are driven by an
+    EventLoop (the process wide EventLoop.instance() unless one is passed
+    as the 'loop' keyword) so any number of them can make progress on a
+    single thread. Like Playbook,  an instance supports one run at a time.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        self.loop = kwargs.pop("loop", None) or EventLoop.instance()
+        super(AsyncPlaybook, self).__init__(*args, **kwargs)
+        self._readers = {}
+        self._current = None
+
+    @classmethod
+    def from_playbook(cls, playbook, loop=None):
+        '''
+        Build an instance that shares the configuration of an existing
+        Playbook (command line options,  environment and logger) without
+        running the constructor again.
+        '''
+        new = cls.__new__(cls)
+        new.__dict__.update(playbook.__dict__)
+        new._env = playbook._env.copy()
+        new._extra_vars = list(playbook._extra_vars)
+        new._metrics_hooks = list(playbook._metrics_hooks)
+        new._inventory_path = None
+        new._inventory_pipe = None
+        new.loop = loop or EventLoop.instance()
+        new._readers = {}
+        new._current = None
+        return new
+
+    def run(self, inventory=None):
+        if inventory is not None:
+            self.inventory = inventory
+
+        run = PlaybookRun(self.loop)
+        self._launch(run)
+        return run
+
+    def _launch(self, run):
+        run.playbook = self
+        self._timings = RunTimings()
+        try:
+            with self._timings.phase('render'):
+                self._render_inventory()
+            self._start(run)
+        except Exception as e:
+            self.cleanup()
+            run.set_exception(e)
+
+    def _start(self, run):
+        self._current = run
+        run.process = self._spawn()
+
+        for pipe, handler in ((run.process.stdout, self._handle_stdout),
+                              (run.process.stderr, self._handle_stderr)):
+            reader = LineReader(pipe)
+            self._readers[reader.fd] = (reader, handler)
+            self.loop.add_reader(reader.fd, self._on_readable)
+
+        self.loop.add_process(run.process, self._on_exit)
+
+    def _on_readable(self, fd):
+        reader, handler = self._readers[fd]
+        for line in reader.read():
+            handler(line)
+
+        if reader.closed:
+            self.loop.remove_reader(fd)
+            del self._readers[fd]
+
+    def _drain(self):
+        for fd, (reader, handler) in list(self._readers.items()):
+            for line in reader.drain():
+                handler(line)
+            self.loop.remove_reader(fd)
+        self._readers = {}
+
+    def _on_exit(self, process):
+        self._timings.mark('exit')
+        self._complete(process)
+
+    def _complete(self, process):
+        run, self._current = self._current, None
+        try:
+            self._drain()
+            self._flush_sinks()
+            result = self._make_result(process.wait())
+        except Exception as e:
+            self.cleanup()
+            run.set_exception(e)
+        else:
+            with self._timings.phase('cleanup'):
+                self.cleanup()
+            self._report_metrics(result)
+            run.set_result(result)
+
+
+class AsyncZMQPlaybook(AsyncPlaybook, ZMQPlaybook):
+    '''
+    The EventLoop driven sibling of ZMQPlaybook. Hooks registered with
+    add_hook() are called from the loop as events arrive. The wait for the
+    callback plugin to connect is timed by the loop as well rather than by
+    blocking in ZMQPlaybook._connect();  if it times out the process is
+    terminated and the run fails with a RuntimeError.
+
+    Concurrent runs can share one socket by passing the same
+    dauber.bus.EventBus as the 'bus' keyword;  they then run on the bus's
+    EventLoop.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        bus = kwargs.get("bus")
+        if bus is not None:
+            if kwargs.setdefault("loop", bus.loop) is not bus.loop:
+                raise ValueError("An EventBus can only be used by runs on "
+                                 "the EventLoop it reads from")
+        super(AsyncZMQPlaybook, self).__init__(*args, **kwargs)
+        self._handshake_timer = None
+        self._exited = None
+
+    def _start(self, run):
+        self._bind()
+        self._connected = False
+        self._finished = False
+        self._exited = None
+        self._handshake_error = None
+        self.publish_stats = None
+        super(AsyncZMQPlaybook, self)._start(run)
+
+        # Only once ansible-playbook is running,  so a failed spawn leaves
+        # nothing on the loop. Messages wait on the socket until then.
+        if self.bus is None:
+            self.loop.add_reader(self.socket, self._on_socket)
+
+        self._timings.begin('connect')
+        self._handshake_timer = self.loop.call_later(
+            self.handshake_timeout, self._on_handshake_timeout)
+
+    def _on_socket(self, socket):
+        self._zmq_socket_handler(socket)
+
+    def _on_hello(self, serializer):
+        super(AsyncZMQPlaybook, self)._on_hello(serializer)
+        self._timings.end('connect')
+        if self._handshake_timer is not None:
+            self.loop.cancel_call(self._handshake_timer)
+
+    # Events may still be in flight when ansible-playbook exits (typically
+    # the stats),  so the run is completed once the plugin says 'bye' or
+    # drain_timeout passes. A process killed by a signal never says 'bye'.
+    def _complete(self, process):
+        if self._connected and not self._finished \
+                and process.returncode >= 0:
+            self._exited = process
+            self._drain_timer = self.loop.call_later(
+                self.drain_timeout, self._on_drain_timeout)
+        else:
+            super(AsyncZMQPlaybook, self)._complete(process)
+
+    def _on_bye(self, data):
+        super(AsyncZMQPlaybook, self)._on_bye(data)
+        if self._exited is not None:
+            self.loop.cancel_call(self._drain_timer)
+            self._complete_exited()
+
+    def _on_drain_timeout(self):
+        self.logger.warning("The dauber callback plugin did not end its "
+                            "event stream within {} seconds"
+                            .format(self.drain_timeout))
+        self._complete_exited()
+
+    def _complete_exited(self):
+        process, self._exited = self._exited, None
+        super(AsyncZMQPlaybook, self)._complete(process)
+
+    def _on_handshake_timeout(self):
+        process = self._current.process if self._current is not None else None
+        if not self._connected and process is not None \
+           and process.poll() is None:
+            self._handshake_error = RuntimeError(
+                self._handshake_error_message())
+            process.terminate()
+
+    def _drain(self):
+        super(AsyncZMQPlaybook, self)._drain()
+        if self.bus is not None:
+            self.bus.poll()
+        else:
+            self._on_socket(self.socket)
+            self.loop.remove_reader(self.socket)
+        self.loop.cancel_call(self._handshake_timer)
+        self._join_dispatcher()
+
+    def _make_result(self, returncode):
+        if self._handshake_error is not None:
+            raise self._handshake_error
+        return super(AsyncZMQPlaybook, self)._make_result(returncode)
@@ -0,0 +1,114 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import itertools
+
+import zmq
+
+from loop import EventLoop
+import transport
+
+
+class EventBus(object):
+    '''
+    One SUB socket,  bound once and read from an EventLoop,  shared by any
+    number of concurrent AsyncZMQPlaybook runs (pass it as the 'bus'
+    keyword). Each run registers for a run ID which the callback plugin
+    puts in front of its topics ("<run id>/<topic>",  see DAUBER_RUN_ID),
+    so subscriptions stay per run and messages are routed to the run they
+    belong to by the topic frame alone. Messages for runs that are no longer
+    registered are dropped.
+
+    The socket is bound to 'endpoint' (e.g. "tcp://*:5555") if given,  or
+    else to an ipc socket in a new temporary directory.
+    '''
+
+    def __init__(self, loop=None, context=None, rcvhwm=None, endpoint=None):
+        self.loop = loop if loop is not None else EventLoop.instance()
+        self.context = context if context is not None \
+            else zmq.Context.instance()
+
+        self.socket = self.context.socket(zmq.SUB)
+        if rcvhwm is not None:
+            self.socket.setsockopt(zmq.RCVHWM, rcvhwm)
+        self.uri, self.socket_dir = transport.bind(self.socket, endpoint)
+
+        self._runs = {}
+        self._run_ids = itertools.count()
+
+        self.loop.add_reader(self.socket, self._on_socket)
+
+    def register(self, playbook, topics=()):
+        '''
+        Route messages for a new run ID to playbook._dispatch_frames() and
+        subscribe to topics for it. Returns the run ID.
+        '''
+        run_id = str(next(self._run_ids))
+        self._runs[run_id] = (playbook, set())
+        for topic in topics:
+            self.subscribe(run_id, topic)
+        return run_id
+
+    def unregister(self, run_id):
+        _, topics = self._runs.pop(run_id, (None, ()))
+        for topic in topics:
+            self.socket.setsockopt(zmq.UNSUBSCRIBE,
+                                   "{}/{}".format(run_id, topic))
+
+    def subscribe(self, run_id, topic):
+        topics = self._runs[run_id][1]
+        if topic not in topics:
+            topics.add(topic)
+            self.socket.setsockopt(zmq.SUBSCRIBE,
+                                   "{}/{}".format(run_id, topic))
+
+    def unsubscribe(self, run_id, topic):
+        topics = self._runs[run_id][1]
+        if topic in topics:
+            topics.discard(topic)
+            self.socket.setsockopt(zmq.UNSUBSCRIBE,
+                                   "{}/{}".format(run_id, topic))
+
+    def poll(self):
+        '''
+        Dispatch every message already queued on the socket.
+        '''
+        self._on_socket(self.socket)
+
+    def _on_socket(self, socket):
+        while True:
+            try:
+                frames = socket.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+
+            run_id, _, frames[0] = frames[0].partition('/')
+            run = self._runs.get(run_id)
+            if run is not None:
+                run[0]._dispatch_frames(frames)
+
+    def close(self):
+        self.loop.remove_reader(self.socket)
+        transport.unbind(self.socket, self.uri, self.socket_dir)
+        self.socket.close(linger=0)
+        self._runs = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,145 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+from __future__ import print_function
+
+import argparse
+import threading
+
+import zmq
+
+import transport
+
+# Seconds between checks of whether the collector has been stopped
+POLL_INTERVAL = 0.1
+
+
+class Collector(object):
+    '''
+    Relays events from the callback plugins of any number of controllers to
+    any number of consumers. Plugins connect to 'listen' (set
+    DAUBER_SOCKET_URI to it,  or pass ZMQPlaybook(collector=(listen,
+    publish))) and consumers subscribe at 'publish';  both are endpoints to
+    bind,  e.g. "tcp://*:5555". Subscriptions are passed upstream to every
+    plugin,  so the plugins' handshake works as it does when they connect
+    to dauber directly and they only send what somebody subscribed to.
+
+    Events are relayed unchanged: their topics are prefixed with the run ID
+    (DAUBER_RUN_ID) and their headers carry the 'node' and 'run' they come
+    from. Subscribing to '' gets the events of every run.
+
+    Endpoints may also be inproc://,  for consumers in the same process
+    that share 'context'.
+    '''
+
+    def __init__(self, listen, publish, context=None):
+        self.context = context if context is not None \
+            else zmq.Context.instance()
+
+        self.frontend = self.context.socket(zmq.XSUB)
+        self.backend = self.context.socket(zmq.XPUB)
+        self.listen, _ = transport.bind(self.frontend, listen)
+        self.publish, _ = transport.bind(self.backend, publish)
+
+        self.poller = zmq.Poller()
+        self.poller.register(self.frontend, zmq.POLLIN)
+        self.poller.register(self.backend, zmq.POLLIN)
+
+        # Messages relayed from plugins to consumers
+        self.forwarded = 0
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def poll(self, timeout):
+        '''
+        Relay whatever arrives within timeout seconds.
+        '''
+        for socket, _ in self.poller.poll(timeout * 1000):
+            if socket is self.frontend:
+                self.forwarded += self._relay(self.frontend, self.backend)
+            else:
+                self._relay(self.backend, self.frontend)
+
+    def _relay(self, source, destination):
+        count = 0
+        while True:
+            try:
+                frames = source.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return count
+            destination.send_multipart(frames)
+            count += 1
+
+    def run(self):
+        '''
+        Relay until stop() is called.
+        '''
+        while not self._stopped.is_set():
+            self.poll(POLL_INTERVAL)
+
+    def start(self):
+        '''
+        Run in a background thread.
+        '''
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.frontend.close(linger=0)
+        self.backend.close(linger=0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Relay dauber events from the callback plugins of "
+        "several ansible controllers to the processes consuming them.")
+    parser.add_argument('--listen', default='tcp://*:5555',
+                        help="endpoint callback plugins connect to "
+                        "(default: %(default)s)")
+    parser.add_argument('--publish', default='tcp://*:5556',
+                        help="endpoint consumers subscribe at "
+                        "(default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    collector = Collector(args.listen, args.publish)
+    print("Collecting on {}, publishing on {}".format(
+        collector.listen, collector.publish))
+    try:
+        collector.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import logging
+import threading
+import collections
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+COALESCE = 'coalesce'
+
+POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+# Marks the queue entries of a _Barrier
+_BARRIER = object()
+
+
+class _Barrier(object):
+    '''
+    A call queued on every worker. Each worker stops when it reaches the
+    barrier;  the last one to arrive makes the call and then releases the
+    others, so the call runs after everything queued before it and before
+    anything queued after it.
+    '''
+
+    def __init__(self, parties, fn, args):
+        self.remaining = parties
+        self.fn = fn
+        self.args = args
+        self.done = False
+        self.cond = threading.Condition()
+
+    def arrive(self, dispatcher):
+        with self.cond:
+            self.remaining -= 1
+            if self.remaining:
+                while not self.done:
+                    self.cond.wait()
+                return
+
+        try:
+            dispatcher._call(self.fn, self.args)
+        finally:
+            dispatcher.counters.depth(-1)
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+
+
+class _Worker(object):
+    '''
+    One thread and its queue. Entries are [coalesce_key, fn, args] lists;
+    a coalesced entry is emptied in place (fn set to None) and skipped.
+    Barriers are queued as [_BARRIER, barrier, None] and are not counted
+    against maxsize,  dropped or coalesced.
+    '''
+
+    def __init__(self, dispatcher, maxsize):
+        self.dispatcher = dispatcher
+        self.maxsize = maxsize
+
+        self.queue = collections.deque()
+        self.pending = {}
+        self.live = 0
+        self.barriers = 0
+        self.busy = False
+        self.closed = False
+
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, coalesce_key, fn, args):
+        policy = self.dispatcher.policy
+        counters = self.dispatcher.counters
+
+        with self.cond:
+            if policy == COALESCE and coalesce_key in self.pending:
+                # Drop the queued entry and queue this one at the back,
+                # keeping the order of the latest events
+                self.pending.pop(coalesce_key)[1] = None
+                self.live -= 1
+                counters.increment('coalesced')
+                counters.depth(-1)
+
+            while self.live >= self.maxsize:
+                if policy == DROP_OLDEST:
+                    self._drop_oldest()
+                    counters.increment('dropped')
+                else:
+                    self.cond.wait()
+
+            entry = [coalesce_key, fn, args]
+            self.queue.append(entry)
+            if policy == COALESCE:
+                self.pending[coalesce_key] = entry
+            self.live += 1
+            counters.increment('submitted')
+            counters.depth(+1)
+
+            self.cond.notify_all()
+
+    def put_barrier(self, barrier):
+        with self.cond:
+            self.queue.append([_BARRIER, barrier, None])
+            self.barriers += 1
+            self.cond.notify_all()
+
+    # Must hold self.cond
+    def _drop_oldest(self):
+        for i, entry in enumerate(self.queue):
+            if entry[0] is not _BARRIER and entry[1] is not None:
+                del self.queue[i]
+                self.pending.pop(entry[0], None)
+                self.live -= 1
+                self.dispatcher.counters.depth(-1)
+                return
+
+    def _work(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue:
+                    return
+
+                entry = self.queue.popleft()
+                if entry[1] is None:
+                    continue
+
+                barrier = entry[0] is _BARRIER
+                if not barrier:
+                    if self.pending.get(entry[0]) is entry:
+                        del self.pending[entry[0]]
+                    self.live -= 1
+                self.busy = True
+                self.cond.notify_all()
+
+            try:
+                if barrier:
+                    entry[1].arrive(self.dispatcher)
+                else:
+                    self.dispatcher._call(entry[1], entry[2])
+            finally:
+                if not barrier:
+                    self.dispatcher.counters.depth(-1)
+                with self.cond:
+                    if barrier:
+                        self.barriers -= 1
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def join(self):
+        with self.cond:
+            while self.live or self.barriers or self.busy:
+                self.cond.wait()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class _Counters(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = dict.fromkeys(
+            ('submitted', 'completed', 'dropped', 'coalesced', 'errors',
+             'depth', 'max_depth'), 0)
+
+    def increment(self, name):
+        with self.lock:
+            self.values[name] += 1
+
+    def depth(self, delta):
+        with self.lock:
+            self.values['depth'] += delta
+            self.values['max_depth'] = max(self.values['max_depth'],
+                                           self.values['depth'])
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+class HookDispatcher(object):
+    '''
+    Runs hook callbacks on a pool of worker threads so that slow callbacks
+    do not hold up reading ansible's events and output.
+
+    Calls are spread over the workers by key (the host of a runner event),
+    so the calls for one host run one at a time and in the order they were
+    submitted. Calls that are not about a host (key None,  e.g. the start
+    of a task or the final stats) are barriers:  they run once every call
+    submitted before them has completed and before any call submitted
+    after them starts,  so they are never reordered with the per host
+    calls around them. submit() does not wait for them,  and they are
+    never dropped or coalesced.
+
+    Each worker has a queue of at most maxsize // workers calls.
+    When a queue is full the policy decides what happens:
+
+      'block'        submit() waits for room. This pushes back on the
+                     socket and eventually on ansible itself.
+      'drop-oldest'  the oldest queued call is discarded.
+      'coalesce'     a queued call for the same hook and host is replaced
+                     by the new one whether or not the queue is full (only
+                     the latest event of each kind per host is delivered);
+                     otherwise as 'block'.
+
+    stats() returns the number of calls submitted,  completed,  dropped,
+    coalesced and failed (errors) along with the current and maximum queue
+    depth.
+    '''
+
+    def __init__(self, workers=4, maxsize=1000, policy=BLOCK, logger=None):
+        if policy not in POLICIES:
+            raise ValueError("Unknown policy '%s', expected one of: %s"
+                             % (policy, ", ".join(POLICIES)))
+
+        self.policy = policy
+        self.logger = logger if logger is not None \
+            else logging.getLogger(self.__class__.__name__)
+        self.counters = _Counters()
+
+        self._workers = [_Worker(self, max(1, maxsize // workers))
+                         for _ in range(workers)]
+
+    def submit(self, key, hook, fn, *args):
+        if key is None:
+            barrier = _Barrier(len(self._workers), fn, args)
+            self.counters.increment('submitted')
+            self.counters.depth(+1)
+            for worker in self._workers:
+                worker.put_barrier(barrier)
+            return
+
+        worker = self._workers[hash(key) % len(self._workers)]
+        worker.put((hook, key), fn, args)
+
+    def _call(self, fn, args):
+        try:
+            fn(*args)
+        except Exception:
+            self.counters.increment('errors')
+            self.logger.exception("Hook callback raised an exception")
+        finally:
+            self.counters.increment('completed')
+
+    def join(self):
+        '''
+        Wait until every submitted call has completed.
+        '''
+        for worker in self._workers:
+            worker.join()
+
+    def close(self, wait=True):
+        '''
+        Stop the workers once their queues are empty,  waiting for that to
+        happen if 'wait' is True.
+        '''
+        for worker in self._workers:
+            worker.close()
+        if wait:
+            for worker in self._workers:
+                worker.thread.join()
+
+    def stats(self):
+        return self.counters.snapshot()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
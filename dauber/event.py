@@ -0,0 +1,101 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+_UNDECODED = object()
+
+
+class Event(object):
+    '''
+    One message from the zmq callback plugin. The event keeps the raw
+    frames and decodes each one (the small header,  the positional and the
+    keyword arguments of the hook) the first time it is accessed,  so a
+    callback that only looks at the topic or the host never pays for
+    decoding the full result.
+    '''
+    __slots__ = ('topic', 'raw_header', 'raw_args', 'raw_kwargs',
+                 'serializer', '_header', '_args', '_kwargs')
+
+    def __init__(self, topic, header, args, kwargs, serializer):
+        self.topic = topic
+        self.raw_header = header
+        self.raw_args = args
+        self.raw_kwargs = kwargs
+        self.serializer = serializer
+
+        self._header = self._args = self._kwargs = _UNDECODED
+
+    @property
+    def header(self):
+        if self._header is _UNDECODED:
+            self._header = self.serializer.loads(self.raw_header) \
+                if self.raw_header else {}
+        return self._header
+
+    @property
+    def host(self):
+        '''
+        Name of the host a runner event is about (None for playbook level
+        events).
+        '''
+        return self.header.get('host')
+
+    @property
+    def time(self):
+        '''
+        When the callback plugin saw the event (seconds since the epoch on
+        the ansible controller),  or None for plugins that do not say.
+        '''
+        return self.header.get('time')
+
+    @property
+    def node(self):
+        '''
+        The controller that ran ansible-playbook (DAUBER_NODE,  or its host
+        name),  or None for plugins that do not say.
+        '''
+        return self.header.get('node')
+
+    @property
+    def run(self):
+        '''
+        The run ID of runs sharing a socket (see dauber.bus and
+        dauber.collector),  otherwise None.
+        '''
+        return self.header.get('run')
+
+    @property
+    def args(self):
+        if self._args is _UNDECODED:
+            self._args = self.serializer.loads(self.raw_args)
+        return self._args
+
+    @property
+    def kwargs(self):
+        if self._kwargs is _UNDECODED:
+            self._kwargs = self.serializer.loads(self.raw_kwargs)
+        return self._kwargs
+
+    @property
+    def result(self):
+        '''
+        The first positional argument of the hook,  e.g. the TaskResult of
+        a v2_runner_on_* event or the AggregateStats of v2_playbook_on_stats.
+        '''
+        args = self.args
+        return args[0] if args else None
+
+    def __repr__(self):
+        return "<Event %s host=%s>" % (self.topic, self.host)
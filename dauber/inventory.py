@@ -15,11 +15,56 @@
 ###############################################################################
 
 import re
+import string
 import tempfile
 import os
 import json
 from contextlib import contextmanager
 
+# A host range,  e.g. the '[01:50]' of 'www[01:50].example.com' or the
+# '[a:f:2]' of 'db-[a:f:2]' (see ansible's inventory/expand_hosts.py)
+HOST_RANGE = re.compile(r'\[([a-zA-Z0-9]*):([a-zA-Z0-9]+)(?::(\d+))?\]')
+
+
+def expand_host_pattern(pattern):
+    '''
+    The host names a host line stands for,  expanding ranges the way
+    ansible does for ini inventories. A name without ranges stands for
+    itself.
+    '''
+    m = HOST_RANGE.search(pattern)
+    if m is None:
+        return [pattern]
+
+    head, tail = pattern[:m.start()], pattern[m.end():]
+    beg, end, step = m.groups()
+    beg = beg or '0'
+    step = int(step) if step else 1
+
+    if beg[0] == '0' and len(beg) > 1:
+        if len(beg) != len(end):
+            raise ValueError("Host range %s must have begin and end of "
+                             "equal length" % m.group(0))
+        fill = lambda i: str(i).zfill(len(beg))
+    else:
+        fill = str
+
+    if beg.isdigit() and end.isdigit():
+        seq = range(int(beg), int(end) + 1, step)
+    elif len(beg) == len(end) == 1 and beg.isalpha() and end.isalpha():
+        i_beg = string.ascii_letters.index(beg)
+        i_end = string.ascii_letters.index(end)
+        if i_beg > i_end:
+            raise ValueError("Host range %s is backwards" % m.group(0))
+        seq = string.ascii_letters[i_beg:i_end + 1:step]
+    else:
+        raise ValueError("Could not parse host range %s" % m.group(0))
+
+    hosts = []
+    for i in seq:
+        hosts.extend(expand_host_pattern(head + fill(i) + tail))
+    return hosts
+
 
 class InventoryHost(object):
     '''
@@ -61,6 +106,13 @@ class InventoryHost(object):
                                    (part, host))
         return InventoryHost(host, **kwargs)
 
+    @property
+    def names(self):
+        '''
+        The host names this line stands for (see expand_host_pattern).
+        '''
+        return expand_host_pattern(self.host)
+
     def __eq__(self, other):
         return self.host == other.host and self.variables == other.variables
 
@@ -245,21 +297,35 @@ class Inventory(object):
 
         return Inventory(global_hosts, sections)
 
-    def to_json(self, with_meta=True):
+    # with_ungrouped lists the global hosts in ansible's implicit 'ungrouped'
+    # group. Without it global hosts that are not in any group (and have no
+    # variables) do not appear in the output at all.
+    #
+    # Dynamic inventories do not expand host ranges,  so host lines such as
+    # 'www[01:50].example.com' are listed as the hosts they stand for.
+    def to_json(self, with_meta=True, with_ungrouped=False):
         d = {'_meta': {'hostvars': {}}} if with_meta else {}
         for host in self.global_hosts:
             if with_meta and host.variables:
-                d['_meta']['hostvars'][host.host] = host.variables
+                for name in host.names:
+                    # Copied so merging group variables below does not
+                    # modify the host itself
+                    d['_meta']['hostvars'][name] = dict(host.variables)
+
+        if with_ungrouped:
+            d['ungrouped'] = [name for host in self.global_hosts
+                              for name in host.names]
 
         for sec in self.sections:
             d[sec.name] = []
             if isinstance(sec, InventoryGroup):
-                for host in sec.items:
+                for host, name in [(h, n) for h in sec.items
+                                   for n in h.names]:
                     # Note: Ignores variables here
                     #       just appends the host name
-                    d[sec.name].append(host.host)
+                    d[sec.name].append(name)
                     if with_meta:
-                        if host.host in d['_meta']['hostvars']:
+                        if name in d['_meta']['hostvars']:
                             # Its not clear whether this should be an update
                             # or an overwrite from the ansible documentation.
                             # It doesn't appear that the dynamic inventory
@@ -287,13 +353,75 @@ class Inventory(object):
                             # strategy (because it is easy to implement), the
                             # 'correct' strategy is unclear when generating
                             # dynamic inventories.
-                            d['_meta']['hostvars'][host.host].update(
+                            d['_meta']['hostvars'][name].update(
                                 host.variables)
                         else:
-                            d['_meta']['hostvars'][host.host] = host.variables
+                            d['_meta']['hostvars'][name] = \
+                                dict(host.variables)
 
         return json.dumps(d)
 
+    @property
+    def hosts(self):
+        '''
+        Names of every host line in the inventory, global hosts first,
+        in order of first appearance.
+        '''
+        seen = set()
+        names = []
+        for host in self.global_hosts + [h for sec in self.sections
+                                         for h in sec.items]:
+            if host.host not in seen:
+                seen.add(host.host)
+                names.append(host.host)
+        return names
+
+    def shard(self, n):
+        '''
+        Split the inventory into (at most) n inventories with disjoint
+        hosts. Hosts are dealt out round robin in order of appearance.
+        Each shard keeps the global host lines and the group membership
+        of its own hosts;  every group heading is kept in every shard so
+        plays that target a group still resolve it (possibly to no hosts).
+
+        Host lines that use a range (e.g. www[01:50].example.com) are
+        expanded (see expand_host_pattern),  so their hosts are spread
+        over the shards as one line per host with the line's variables.
+        '''
+        names = []
+        seen = set()
+        for host in self.global_hosts + [h for sec in self.sections
+                                         for h in sec.items]:
+            for name in host.names:
+                if name not in seen:
+                    seen.add(name)
+                    names.append(name)
+
+        n = max(1, min(n, len(names)))
+        assignment = {name: i % n for i, name in enumerate(names)}
+
+        def lines(hosts, i):
+            result = []
+            for host in hosts:
+                expanded = host.names
+                if expanded == [host.host]:
+                    if assignment[host.host] == i:
+                        result.append(host)
+                else:
+                    result.extend(InventoryHost(name, **host.variables)
+                                  for name in expanded
+                                  if assignment[name] == i)
+            return result
+
+        shards = []
+        for i in range(n):
+            shards.append(Inventory(
+                lines(self.global_hosts, i),
+                sections=[sec.__class__(sec.heading, lines(sec.items, i))
+                          for sec in self.sections]))
+
+        return shards
+
     @contextmanager
     def to_tempfile(self):
         _, path = tempfile.mkstemp()
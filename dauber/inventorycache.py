@@ -0,0 +1,162 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import os
+import stat
+import shutil
+import hashlib
+import tempfile
+import threading
+import collections
+
+
+class _Entry(object):
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.refs = 0
+
+
+class InventoryCache(object):
+    '''
+    Content addressed cache of rendered inventory files. Runs that use
+    inventories with the same content share one read-only file instead of
+    each writing and removing a temporary file of their own.
+
+    acquire() returns the path of the file for an inventory and takes a
+    reference on it,  release() drops the reference. Files that are no
+    longer referenced stay in the cache for later runs until the cache
+    holds more than max_entries files or max_bytes bytes,  at which point
+    the least recently used unreferenced files are removed.
+    '''
+
+    def __init__(self, directory=None, max_entries=64, max_bytes=None):
+        self.directory = directory if directory is not None \
+            else tempfile.mkdtemp(prefix='dauber-inventory-')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = collections.OrderedDict()
+        self._paths = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(content):
+        return hashlib.sha1(content).hexdigest()
+
+    def acquire(self, inventory):
+        content = inventory.to_string()
+        key = self.fingerprint(content)
+
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                entry.refs += 1
+                return entry.path
+
+        path = self._write(key, content)
+
+        with self._lock:
+            # Another thread may have rendered the same content meanwhile
+            entry = self._lookup(key)
+            if entry is None:
+                entry = _Entry(path, len(content))
+                self._entries[key] = entry
+                self._paths[path] = key
+                self._bytes += entry.size
+
+            entry.refs += 1
+            self._evict()
+
+            return entry.path
+
+    def release(self, path):
+        with self._lock:
+            key = self._paths.get(path)
+            if key is None:
+                return
+
+            entry = self._entries[key]
+            entry.refs = max(0, entry.refs - 1)
+            self._evict()
+
+    def clear(self):
+        '''
+        Remove every unreferenced file from the cache.
+        '''
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if not e.refs]:
+                self._remove(key)
+
+    def close(self):
+        with self._lock:
+            self._entries.clear()
+            self._paths.clear()
+            self._bytes = 0
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    # Must hold self._lock
+    def _lookup(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            # Re-insert to mark as most recently used
+            self._entries[key] = entry
+        return entry
+
+    # Must hold self._lock
+    def _evict(self):
+        for key in [k for k, e in self._entries.items() if not e.refs]:
+            if not self._over_limit():
+                break
+            self._remove(key)
+
+    def _over_limit(self):
+        return (self.max_entries is not None and
+                len(self._entries) > self.max_entries) or \
+            (self.max_bytes is not None and self._bytes > self.max_bytes)
+
+    # Must hold self._lock
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        del self._paths[entry.path]
+        self._bytes -= entry.size
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+    def _write(self, key, content):
+        # Write under a private name and rename so that a reader never
+        # sees a partially written file.
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(content)
+            os.fchmod(fh.fileno(), stat.S_IRUSR)
+
+        path = os.path.join(self.directory, key)
+        os.rename(tmp, path)
+        return path
@@ -0,0 +1,182 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import time
+import heapq
+import itertools
+
+import zmq
+
+from timing import monotonic
+
+# Seconds between checks for exited processes when nothing else wakes
+# the loop up.
+POLL_INTERVAL = 0.05
+
+
+class PlaybookRun(object):
+    '''
+    A handle on a playbook run driven by an EventLoop. It follows the
+    shape of concurrent.futures.Future: result() blocks (by driving the
+    loop) until the run is complete and returns its PlaybookResult.
+    '''
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.playbook = None
+        self.process = None
+        self._result = None
+        self._exception = None
+        self._done = False
+        self._callbacks = []
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        if not self._done:
+            self.loop.run_until_complete(self)
+
+        if self._exception is not None:
+            raise self._exception
+
+        return self._result
+
+    def exception(self):
+        if not self._done:
+            self.loop.run_until_complete(self)
+
+        return self._exception
+
+    def add_done_callback(self, fn):
+        if self._done:
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    def cancel(self):
+        '''
+        Terminate the underlying ansible-playbook process. The run is
+        completed through the normal exit path once the process is gone.
+        '''
+        if self._done or self.process is None:
+            return False
+
+        if self.process.poll() is None:
+            self.process.terminate()
+
+        return True
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        self._done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+
+class EventLoop(object):
+    '''
+    Single threaded loop that multiplexes the pipes and zmq sockets of any
+    number of playbook runs over one zmq.Poller. Readers are file
+    descriptors or zmq sockets with a callback that is called with the
+    reader whenever it becomes readable. Processes are watched for exit.
+    Callbacks can also be scheduled to run after a delay with call_later().
+    '''
+
+    _instance = None
+
+    @classmethod
+    def instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.poller = zmq.Poller()
+        self._readers = {}
+        self._processes = {}
+        self._timers = []
+        self._timer_ids = itertools.count()
+
+    def add_reader(self, reader, callback):
+        self.poller.register(reader, zmq.POLLIN)
+        self._readers[reader] = callback
+
+    def remove_reader(self, reader):
+        if reader in self._readers:
+            self.poller.unregister(reader)
+            del self._readers[reader]
+
+    def add_process(self, process, callback):
+        self._processes[process] = callback
+
+    def remove_process(self, process):
+        self._processes.pop(process, None)
+
+    def call_later(self, delay, callback):
+        '''
+        Call callback() once,  no sooner than delay seconds from now. Returns
+        a handle for cancel_call().
+        '''
+        timer = [monotonic() + delay, next(self._timer_ids), callback]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def cancel_call(self, timer):
+        # Left in the heap and skipped when it comes due
+        timer[2] = None
+
+    def run_once(self, timeout=None):
+        timeout = self.poll_interval if timeout is None else timeout
+        if self._timers:
+            timeout = max(0, min(timeout, self._timers[0][0] - monotonic()))
+
+        if self._readers:
+            ready = self.poller.poll(timeout * 1000)
+        else:
+            # zmq.Poller returns at once when nothing is registered
+            time.sleep(timeout)
+            ready = []
+
+        for reader, _ in ready:
+            # A callback may have removed a reader that was also ready
+            callback = self._readers.get(reader)
+            if callback is not None:
+                callback(reader)
+
+        for process, callback in list(self._processes.items()):
+            if process.poll() is not None:
+                del self._processes[process]
+                callback(process)
+
+        now = monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            callback = heapq.heappop(self._timers)[2]
+            if callback is not None:
+                callback()
+
+    def run_until_complete(self, *runs):
+        while not all(run.done() for run in runs):
+            self.run_once()
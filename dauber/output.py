@@ -0,0 +1,190 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import os
+import errno
+import select
+import collections
+
+# Size of the chunks requested from the operating system on each read. This
+# is large enough that verbose playbooks are pulled out of the pipe in a few
+# syscalls rather than one per line.
+CHUNK_SIZE = 65536
+
+
+class LineReader(object):
+    '''
+    Incrementally reads a pipe in whole chunks and splits the data into
+    lines. Unlike file.readline() a read never blocks waiting for a
+    newline;  partial lines are buffered until the rest of the line (or
+    the end of the stream) arrives.
+    '''
+
+    def __init__(self, pipe, chunk_size=CHUNK_SIZE):
+        self.pipe = pipe
+        self.fd = pipe if isinstance(pipe, int) else pipe.fileno()
+        self.chunk_size = chunk_size
+        self.closed = False
+        # The pieces of the current partial line,  joined only once its
+        # newline (or the end of the stream) arrives so that a long line
+        # costs time linear in its length
+        self._partial = []
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        '''
+        Read one chunk from the pipe and return a list of the complete
+        lines it contained (without trailing newlines).  This should only
+        be called when the pipe is known to be readable.  Once the end of
+        the stream is reached any buffered partial line is returned and
+        `closed` is set.
+        '''
+        try:
+            chunk = os.read(self.fd, self.chunk_size)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+
+        if not chunk:
+            self.closed = True
+            tail, self._partial = ''.join(self._partial), []
+            return [tail.rstrip('\r')] if tail else []
+
+        lines = chunk.split('\n')
+        tail = lines.pop()
+        if not lines:
+            self._partial.append(tail)
+            return []
+
+        if self._partial:
+            self._partial.append(lines[0])
+            lines[0] = ''.join(self._partial)
+        self._partial = [tail] if tail else []
+
+        return [line.rstrip('\r') for line in lines]
+
+    def drain(self):
+        '''
+        Read everything that is immediately available on the pipe without
+        waiting for more to arrive and return the lines. Used once the
+        writing process has exited.
+        '''
+        # poll() rather than select(),  which cannot watch descriptors
+        # numbered FD_SETSIZE (1024) or above
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+
+        lines = []
+        while not self.closed and poller.poll(0):
+            lines.extend(self.read())
+        return lines
+
+
+############
+## Output sinks
+####
+# A sink receives every line a playbook run writes to stdout or stderr
+# through write(stream, line),  where stream is 'stdout' or 'stderr'.
+# flush() is called when the run is complete.
+
+class LoggingSink(object):
+    '''
+    Sends output lines to a logger. stdout lines are logged at INFO,
+    except for lines that look like ansible failures,  which are logged
+    (along with everything on stderr) at ERROR. Only the streams listed in
+    'streams' are logged.
+    '''
+
+    def __init__(self, logger, streams=('stdout', 'stderr')):
+        self.logger = logger
+        self.streams = streams
+
+    def write(self, stream, line):
+        if stream not in self.streams:
+            return
+
+        msg = line.strip()
+
+        # Try to capture ansible FAILED messages
+        # and log them as errors, this is brittle.
+        if stream == 'stderr' or "FAILED!" in msg:
+            self.logger.error(msg)
+        else:
+            self.logger.info(msg)
+
+    def flush(self):
+        pass
+
+
+class RingBufferSink(object):
+    '''
+    Keeps the last maxlen lines of each stream (all of them if maxlen is
+    None). The tails are attached to the PlaybookResult of the run.
+    '''
+
+    def __init__(self, maxlen=1000):
+        self.maxlen = maxlen
+        self.buffers = {'stdout': collections.deque(maxlen=maxlen),
+                        'stderr': collections.deque(maxlen=maxlen)}
+
+    def write(self, stream, line):
+        self.buffers[stream].append(line)
+
+    def tail(self, stream):
+        return list(self.buffers[stream])
+
+    def clear(self):
+        for buf in self.buffers.values():
+            buf.clear()
+
+    def flush(self):
+        pass
+
+
+class FileSink(object):
+    '''
+    Appends output lines to a file,  given as a path or an open file
+    object. Only the streams listed in 'streams' are written.
+    '''
+
+    def __init__(self, f, streams=('stdout', 'stderr')):
+        self.fh = open(f, 'ab') if isinstance(f, basestring) else f
+        self.streams = streams
+
+    def write(self, stream, line):
+        if stream in self.streams:
+            self.fh.write(line + '\n')
+
+    def flush(self):
+        self.fh.flush()
+
+    def close(self):
+        self.fh.close()
+
+
+class DiscardSink(object):
+    '''
+    Throws all output away.
+    '''
+
+    def write(self, stream, line):
+        pass
+
+    def flush(self):
+        pass
@@ -0,0 +1,212 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import re
+import json
+
+# The hooks OutputParser can produce,  named after the callback plugin
+# hooks they correspond to (see zmqplaybook.ANSIBLE_HOOK_TOPICS).
+PARSER_HOOK_TOPICS = [
+    'v2_playbook_on_play_start',
+    'v2_playbook_on_task_start',
+    'v2_playbook_on_handler_task_start',
+    'v2_runner_on_ok',
+    'v2_runner_on_failed',
+    'v2_runner_on_skipped',
+    'v2_runner_on_unreachable',
+    'v2_playbook_on_no_hosts_remaining',
+    'v2_playbook_on_stats'
+]
+
+STATUS_HOOKS = {
+    'ok': 'v2_runner_on_ok',
+    'changed': 'v2_runner_on_ok',
+    'failed': 'v2_runner_on_failed',
+    'fatal': 'v2_runner_on_failed',
+    'skipping': 'v2_runner_on_skipped',
+    'unreachable': 'v2_runner_on_unreachable'
+}
+
+# e.g. "TASK [debug] *******"
+BANNER = re.compile(r'^(PLAY RECAP|PLAY|TASK|RUNNING HANDLER|NO MORE HOSTS LEFT)'
+                    r'(?: \[(.*)\])? \*+$')
+
+# e.g. "ok: [localhost]",  "changed: [web -> db] => (item=foo) => {...}",
+#      "failed: [localhost] (item=foo) => {...}"
+#      or "fatal: [localhost]: UNREACHABLE! => {...}"
+RESULT = re.compile(r'^(ok|changed|failed|fatal|skipping|unreachable): '
+                    r'\[([^\]]*)\](?:: (?:FAILED|(UNREACHABLE))!)?'
+                    r'(?:(?: =>)? \(item=(.*?)\))?'
+                    r'(?: => (.*))?$')
+
+# e.g. "localhost                  : ok=2    changed=0    unreachable=0"
+RECAP = re.compile(r'^(\S+)\s+: (.*)$')
+COUNTER = re.compile(r'(\w+)=(\d+)')
+
+# Lines that may start a banner or a result,  checked before any regular
+# expression is applied so that the bulk of verbose output is skipped cheaply.
+PREFIXES = ('PLAY', 'TASK', 'RUNNING HANDLER', 'NO MORE HOSTS LEFT',
+            'ok: ', 'changed: ', 'failed: ', 'fatal: ', 'skipping: ',
+            'unreachable: ')
+
+
+class OutputParser(object):
+    '''
+    Incrementally parses the output of ansible-playbook's default stdout
+    callback and calls hooks with structured events as lines arrive. This
+    gives per host results for runs where the dauber callback plugin is not
+    available.  An OutputParser is an output sink,  so it can be passed to
+    Playbook(sinks=[...]) directly.
+
+    Hooks are called with a single dict. Result hooks receive the 'play',
+    'task',  'host',  'status' (as printed,  e.g. 'changed' or 'fatal'),
+    'item' and 'result' (the decoded JSON after '=>',  if any) of each
+    result line;  the status of an unreachable host is always
+    'unreachable'. v2_playbook_on_stats receives the PLAY RECAP as
+    {host: {counter: count}}.
+
+    Only the lines of the result currently being read are kept in memory.
+    '''
+
+    def __init__(self):
+        self._hooks = {}
+
+        self.play = None
+        self.task = None
+        self.stats = {}
+
+        self._pending = None
+        self._in_recap = False
+
+    def add_hook(self, hook, callback):
+        assert hook in PARSER_HOOK_TOPICS, \
+            "%s is not defined in PARSER_HOOK_TOPICS" % hook
+        self._hooks.setdefault(hook, []).append(callback)
+
+    def _call(self, hook, event):
+        for callback in self._hooks.get(hook, []):
+            callback(event)
+
+    ############
+    ## Sink interface
+    ####
+
+    def write(self, stream, line):
+        if stream == 'stdout':
+            self.feed(line)
+
+    def flush(self):
+        self._finish_pending()
+
+        if self._in_recap:
+            self._in_recap = False
+            self._call('v2_playbook_on_stats', self.stats)
+
+    ############
+    ## Parsing
+    ####
+
+    def feed(self, line):
+        # Continuation of a result whose JSON is pretty printed over
+        # several lines,  ended by a closing brace in the first column.
+        if self._pending is not None:
+            if line[:1] in (' ', '\t', '}', ']') or not line:
+                self._pending[1].append(line)
+                if line in ('}', ']'):
+                    self._finish_pending()
+                return
+            self._finish_pending()
+
+        if self._in_recap:
+            m = RECAP.match(line)
+            if m is not None:
+                self.stats[m.group(1)] = dict(
+                    (k, int(v)) for k, v in COUNTER.findall(m.group(2)))
+                return
+            elif line.strip():
+                self._in_recap = False
+                self._call('v2_playbook_on_stats', self.stats)
+
+        if not line.startswith(PREFIXES):
+            return
+
+        m = BANNER.match(line)
+        if m is not None:
+            self._banner(*m.groups())
+            return
+
+        m = RESULT.match(line)
+        if m is not None:
+            self._result(*m.groups())
+
+    def _banner(self, kind, name):
+        if kind == 'PLAY':
+            self.play = name
+            self.task = None
+            self._call('v2_playbook_on_play_start', {'play': name})
+
+        elif kind == 'TASK':
+            self.task = name
+            self._call('v2_playbook_on_task_start',
+                       {'play': self.play, 'task': name})
+
+        elif kind == 'RUNNING HANDLER':
+            self.task = name
+            self._call('v2_playbook_on_handler_task_start',
+                       {'play': self.play, 'task': name})
+
+        elif kind == 'NO MORE HOSTS LEFT':
+            self._call('v2_playbook_on_no_hosts_remaining',
+                       {'play': self.play})
+
+        elif kind == 'PLAY RECAP':
+            self.stats = {}
+            self._in_recap = True
+
+    def _result(self, status, host, unreachable, item, data):
+        if unreachable:
+            status = 'unreachable'
+
+        event = {
+            'play': self.play,
+            'task': self.task,
+            # Delegated tasks print as "host -> delegate"
+            'host': host.split(' -> ')[0],
+            'status': status,
+            'item': item,
+            'result': None
+        }
+
+        if data in ('{', '['):
+            self._pending = (event, [data])
+        else:
+            if data is not None:
+                event['result'] = self._decode(data)
+            self._call(STATUS_HOOKS[status], event)
+
+    def _finish_pending(self):
+        if self._pending is not None:
+            event, lines = self._pending
+            self._pending = None
+
+            event['result'] = self._decode('\n'.join(lines))
+            self._call(STATUS_HOOKS[event['status']], event)
+
+    def _decode(self, data):
+        try:
+            return json.loads(data)
+        except ValueError:
+            return data
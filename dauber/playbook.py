@@ -21,15 +21,204 @@ import logging
 import tempfile
 import json
 import select
+import collections
+import fcntl
+import threading
+import pkg_resources as pr
 
 from inventory import Inventory
+from output import LineReader, LoggingSink, RingBufferSink
+from timing import RunTimings
+
+# Seconds to wait on the output pipes before checking whether the
+# ansible-playbook process has exited.
+POLL_INTERVAL = 0.5
+
+
+# Process wide cache of executable lookups. It is only valid for the
+# PATH it was built against and is thrown away when PATH changes.
+_executable_cache = {'path': None, 'entries': {}}
+
+
+def find_executable(name, path=None):
+    '''
+    Resolve an executable the way the shell would,  without forking
+    'which'. Names containing a '/' are checked as given,  anything else
+    is searched for on path (os.environ['PATH'] by default). Returns the
+    full path or None. Lookups are cached until PATH changes.
+    '''
+    path = os.environ.get('PATH', os.defpath) if path is None else path
+
+    if _executable_cache['path'] != path:
+        _executable_cache['path'] = path
+        _executable_cache['entries'] = {}
+
+    entries = _executable_cache['entries']
+    if name not in entries:
+        if os.path.dirname(name):
+            candidates = [name]
+        else:
+            candidates = [os.path.join(d or os.curdir, name)
+                          for d in path.split(os.pathsep)]
+
+        entries[name] = next((c for c in candidates
+                              if os.path.isfile(c) and
+                              os.access(c, os.X_OK)), None)
+
+    return entries[name]
+
+
+class CopyOnWriteEnv(collections.MutableMapping):
+    '''
+    An environment mapping over a base mapping (os.environ by default)
+    that records writes and deletions in a private overlay. Creating one
+    does not copy the environment:  the base is read through until the
+    first write,  deletion or to_dict() (i.e. the spawn of a run),  when a
+    snapshot of it is taken. From then on,  as with a copy,  later changes
+    to the base are not seen. Copies share the snapshot.
+    '''
+
+    def __init__(self, base=None, overrides=None):
+        self._base = os.environ if base is None else base
+        self._snapshot = False
+        self._overrides = {}
+        self._deleted = set()
+        self.update(overrides if overrides is not None else {})
+
+    def _take_snapshot(self):
+        if not self._snapshot:
+            self._base = dict(self._base)
+            self._snapshot = True
+
+    def __getitem__(self, key):
+        if key in self._overrides:
+            return self._overrides[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        return self._base[key]
+
+    def __setitem__(self, key, value):
+        self._take_snapshot()
+        self._overrides[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._take_snapshot()
+        self._overrides.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        return key in self._overrides or \
+            (key not in self._deleted and key in self._base)
+
+    def __iter__(self):
+        for key in self._overrides:
+            yield key
+        for key in self._base:
+            if key not in self._overrides and key not in self._deleted:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self):
+        new = CopyOnWriteEnv(self._base)
+        new._snapshot = self._snapshot
+        new._overrides = dict(self._overrides)
+        new._deleted = set(self._deleted)
+        return new
+
+    def to_dict(self):
+        self._take_snapshot()
+        env = dict(self._base)
+        for key in self._deleted:
+            env.pop(key, None)
+        env.update(self._overrides)
+        return env
+
+
+class InventoryPipe(object):
+    '''
+    Hands an inventory to ansible-playbook without touching disk. The
+    inventory is rendered as dynamic inventory JSON and written from a
+    background thread into a pipe. The read end is inherited by
+    ansible-playbook and read by the dauber_inventory.sh dynamic inventory
+    script,  which finds it through DAUBER_INVENTORY_FD.
+    '''
+
+    script = pr.resource_filename(__name__,
+                                  'ansible/inventory/dauber_inventory.sh')
+
+    def __init__(self, inventory):
+        self.data = inventory.to_json(with_ungrouped=True)
+        self.read_fd, self.write_fd = os.pipe()
+
+        # Only the read end may leak into ansible-playbook,  otherwise the
+        # inventory script never sees the end of the data.
+        flags = fcntl.fcntl(self.write_fd, fcntl.F_GETFD)
+        fcntl.fcntl(self.write_fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+        self._thread = None
+
+    def start(self):
+        '''
+        Called once ansible-playbook has been spawned (and so holds its
+        own copy of the read end).
+        '''
+        self._close('read_fd')
+        self._thread = threading.Thread(target=self._write)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _write(self):
+        data = self.data
+        try:
+            while data:
+                data = data[os.write(self.write_fd, data):]
+        except OSError:
+            # ansible-playbook went away without reading the inventory
+            pass
+        finally:
+            self._close('write_fd')
+
+    def _close(self, attr):
+        fd = getattr(self, attr)
+        if fd is not None:
+            setattr(self, attr, None)
+            os.close(fd)
+
+    def close(self):
+        self._close('read_fd')
+        if self._thread is None:
+            self._close('write_fd')
+
+
+class PlaybookResult(object):
+    '''
+    The outcome of a single ansible-playbook run. stdout and stderr hold
+    the captured output lines where the runner captured them,  timings the
+    RunTimings of the run. For ZMQ runs publish_stats holds the callback
+    plugin's counters of sent,  dropped and spilled events.
+    '''
+    def __init__(self, returncode, stdout=None, stderr=None, timings=None):
+        self.returncode = returncode
+        self.stdout = stdout if stdout is not None else []
+        self.stderr = stderr if stderr is not None else []
+        self.timings = timings
+        self.publish_stats = None
+
+    def __repr__(self):
+        return "<PlaybookResult returncode=%s>" % self.returncode
 
 
 class Playbook(object):
 
     def __init__(self, playbook, inventory=None, env=None, extra_vars=None,
                  tags=None, verbosity=None, logger=None,
-                 ansible_playbook_bin="ansible-playbook"):
+                 ansible_playbook_bin="ansible-playbook",
+                 diskless_inventory=False, inventory_cache=None, sinks=None):
 
         self.playbook = playbook
 
@@ -45,8 +234,7 @@ class Playbook(object):
 
         self.inventory = inventory
 
-        self._env = os.environ.copy()
-        self._env.update(env if env is not None else {})
+        self._env = CopyOnWriteEnv(overrides=env)
 
         self._extra_vars = [extra_vars] if extra_vars else []
 
@@ -55,63 +243,183 @@ class Playbook(object):
 
         self.ansible_playbook_bin = ansible_playbook_bin
 
-        with open(os.devnull, 'w') as fnull:
-            if subprocess.call(["which", self.ansible_playbook_bin],
-                               stdout=fnull, stderr=fnull) != 0:
-                self.logger.error("Could not locate '{}' script"
-                                  .format(self.ansible_playbook_bin))
+        if find_executable(self.ansible_playbook_bin) is None:
+            self.logger.error("Could not locate '{}' script"
+                              .format(self.ansible_playbook_bin))
+
+        # Deliver Inventory objects through an InventoryPipe rather than
+        # a temporary file
+        self.diskless_inventory = diskless_inventory
+
+        # Share rendered Inventory files through an InventoryCache rather
+        # than writing a temporary file for each run
+        self.inventory_cache = inventory_cache
 
         self._inventory_path = None
+        self._inventory_pipe = None
 
-    def _run(self):
-        self.logger.debug(self.cmd)
-        p = subprocess.Popen(self.cmd, env=self._env, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
-        while True:
-            reads = [p.stdout.fileno(), p.stderr.fileno()]
-            ret = select.select(reads, [], [])
+        # Output sinks (see dauber.output) that receive every line
+        # ansible-playbook writes. By default output is logged through
+        # self.logger.
+        self.sinks = sinks
+        self._sinks = []
+
+        # PlaybookResult of the last blocking run()
+        self.result = None
 
-            for fd in ret[0]:
-                if fd == p.stdout.fileno():
-                    msg = p.stdout.readline().strip()
+        self._timings = RunTimings()
+        self._metrics_hooks = []
 
-                    # Try to capture ansible FAILED messages
-                    # and log them as errors, this is brittle.
-                    if "FAILED!" in msg:
-                        self.logger.error(msg)
-                    else:
-                        self.logger.info(msg)
+    def _handle_stdout(self, line):
+        for sink in self._sinks:
+            sink.write('stdout', line)
 
-                if fd == p.stderr.fileno():
-                    self.logger.error(p.stderr.readline().strip())
+    def _handle_stderr(self, line):
+        for sink in self._sinks:
+            sink.write('stderr', line)
+
+    def _open_sinks(self):
+        # Resolved when the run starts so the default sink follows
+        # self.logger if it is replaced after construction.
+        self._sinks = list(self.sinks) if self.sinks is not None \
+            else [LoggingSink(self.logger)]
+
+    def _flush_sinks(self):
+        for sink in self._sinks:
+            sink.flush()
+
+    def _spawn(self):
+        self._open_sinks()
+
+        self.logger.debug(self.cmd)
+        with self._timings.phase('spawn'):
+            p = subprocess.Popen(self.cmd, env=self._env.to_dict(),
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
 
-                if p.poll() is not None:
-                    return p.wait()
+        if self._inventory_pipe is not None:
+            self._inventory_pipe.start()
+
+        return p
+
+    def _run(self):
+        p = self._spawn()
+
+        readers = {
+            p.stdout.fileno(): (LineReader(p.stdout), self._handle_stdout),
+            p.stderr.fileno(): (LineReader(p.stderr), self._handle_stderr)
+        }
+
+        # Once the process has exited everything it wrote is already
+        # sitting in the pipes,  so stop waiting and only drain what is
+        # immediately readable. This guards against grandchildren
+        # (e.g. ssh control masters) that hold the pipes open.
+        poller = select.poll()
+        for fd in readers:
+            poller.register(fd, select.POLLIN)
+
+        exited = False
+        while readers:
+            ready = [fd for fd, _ in poller.poll(
+                0 if exited else POLL_INTERVAL * 1000)]
+
+            if not ready and exited:
+                break
+
+            for fd in ready:
+                reader, handler = readers[fd]
+                for line in reader.read():
+                    handler(line)
+
+                if reader.closed:
+                    poller.unregister(fd)
+                    del readers[fd]
+
+            if not exited and p.poll() is not None:
+                exited = True
+                self._timings.mark('exit')
+
+        self._flush_sinks()
+
+        returncode = p.wait()
+        # Both pipes may close before the exit is seen above
+        if not exited:
+            self._timings.mark('exit')
+        return returncode
 
     def run(self, inventory=None):
 
         if inventory is not None:
             self.inventory = inventory
 
+        self._timings = RunTimings()
         try:
-            if isinstance(self.inventory, Inventory):
-                self.inventory.to_file(self.inventory_path)
-                self.logger.debug("Saved inventory file to %s" % self.inventory_path)
+            with self._timings.phase('render'):
+                self._render_inventory()
 
-            return self._run()
+            returncode = self._run()
+            self.result = self._make_result(returncode)
 
         finally:
-            self.cleanup()
+            with self._timings.phase('cleanup'):
+                self.cleanup()
 
-    def cleanup(self):
+        self._report_metrics(self.result)
+
+        return returncode
+
+    def _make_result(self, returncode):
+        # Attach the output tails kept by the first RingBufferSink (if any)
+        for sink in self._sinks:
+            if isinstance(sink, RingBufferSink):
+                return PlaybookResult(returncode, sink.tail('stdout'),
+                                      sink.tail('stderr'), self._timings)
+
+        return PlaybookResult(returncode, timings=self._timings)
+
+    def add_metrics_hook(self, callback):
+        '''
+        Register a callback that is called with the PlaybookResult of each
+        completed run,  once cleanup has finished. The run's phase timings
+        are in result.timings.
+        '''
+        self._metrics_hooks.append(callback)
+
+    def _report_metrics(self, result):
+        for callback in self._metrics_hooks:
+            callback(result)
+
+    def _render_inventory(self):
         if isinstance(self.inventory, Inventory):
+            if self.diskless_inventory:
+                self._inventory_pipe = InventoryPipe(self.inventory)
+                self._env['DAUBER_INVENTORY_FD'] = \
+                    str(self._inventory_pipe.read_fd)
+            elif self.inventory_cache is not None:
+                self.logger.debug("Using cached inventory file %s" % self.inventory_path)
+            else:
+                self.inventory.to_file(self.inventory_path)
+                self.logger.debug("Saved inventory file to %s" % self.inventory_path)
+
+    def cleanup(self):
+        if self._inventory_pipe is not None:
+            self._inventory_pipe.close()
+            self._inventory_pipe = None
+            del self._env['DAUBER_INVENTORY_FD']
+
+        elif self.inventory_cache is not None:
+            if isinstance(self.inventory, Inventory) and \
+               self._inventory_path is not None:
+                self.inventory_cache.release(self._inventory_path)
+
+        elif isinstance(self.inventory, Inventory):
             try:
                 os.remove(self.inventory_path)
                 self.logger.debug("Cleaned up %s" % self.inventory_path)
-            except IOError:
+            except (IOError, OSError):
                 pass
 
-            self._inventory_path = None
+        self._inventory_path = None
 
 
     def __call__(self, playbook, **kwargs):
@@ -144,7 +452,13 @@ class Playbook(object):
             if isinstance(self.inventory, basestring):
                 self._inventory_path = self.inventory
             elif isinstance(self.inventory, Inventory):
-                _, self._inventory_path  = tempfile.mkstemp()
+                if self.diskless_inventory:
+                    self._inventory_path = InventoryPipe.script
+                elif self.inventory_cache is not None:
+                    self._inventory_path = \
+                        self.inventory_cache.acquire(self.inventory)
+                else:
+                    _, self._inventory_path = tempfile.mkstemp()
 
         return self._inventory_path
 
@@ -0,0 +1,153 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import collections
+import multiprocessing
+
+from playbook import PlaybookResult
+from zmqplaybook import ZMQPlaybook
+from asyncplaybook import AsyncPlaybook
+from loop import EventLoop, PlaybookRun
+from output import RingBufferSink
+
+
+class _PoolPlaybook(AsyncPlaybook):
+    '''
+    A private copy of a submitted Playbook that captures the tail of its
+    output so it can be returned with the PlaybookResult.
+    '''
+
+    capture_lines = None
+
+    def _open_sinks(self):
+        super(_PoolPlaybook, self)._open_sinks()
+        self._capture = RingBufferSink(self.capture_lines)
+        self._sinks.append(self._capture)
+
+    def _make_result(self, returncode):
+        return PlaybookResult(returncode, self._capture.tail('stdout'),
+                              self._capture.tail('stderr'), self._timings)
+
+
+class PlaybookPool(object):
+    '''
+    Runs many (Playbook, Inventory) jobs with at most max_workers
+    ansible-playbook processes alive at any one time. The API follows
+    concurrent.futures.Executor:  submit() returns a PlaybookRun whose
+    result() is a PlaybookResult with the return code and the last
+    capture_lines lines of output (all of it if capture_lines is None).
+
+    Each job runs on a private copy of the submitted Playbook,  so one
+    Playbook may be submitted any number of times with different
+    inventories. All jobs are driven from a single EventLoop;  no threads
+    are involved.
+    '''
+
+    def __init__(self, max_workers=None, loop=None, capture_lines=10000):
+        self.max_workers = max_workers if max_workers is not None \
+            else multiprocessing.cpu_count()
+        self.loop = loop if loop is not None else EventLoop()
+        self.capture_lines = capture_lines
+
+        self._queue = collections.deque()
+        self._active = set()
+        self._outstanding = set()
+        self._starting = False
+
+    def submit(self, playbook, inventory=None):
+        if isinstance(playbook, ZMQPlaybook):
+            raise TypeError("PlaybookPool does not support ZMQPlaybook jobs, "
+                            "drive AsyncZMQPlaybook runs on an EventLoop "
+                            "instead.")
+
+        job = _PoolPlaybook.from_playbook(playbook, self.loop)
+        job.capture_lines = self.capture_lines
+        if inventory is not None:
+            job.inventory = inventory
+
+        run = PlaybookRun(self.loop)
+        run.add_done_callback(self._job_done)
+        self._outstanding.add(run)
+        self._queue.append((job, run))
+        self._start_jobs()
+
+        return run
+
+    def map(self, jobs):
+        '''
+        Submit an iterable of (playbook, inventory) pairs and return an
+        iterator over their results in submission order.
+        '''
+        runs = [self.submit(playbook, inventory)
+                for playbook, inventory in jobs]
+        return (run.result() for run in runs)
+
+    def as_completed(self, runs=None):
+        '''
+        Yield runs (all outstanding runs by default) as they complete,
+        driving the loop while waiting.
+        '''
+        runs = list(self._outstanding if runs is None else runs)
+        finished = collections.deque()
+        for run in runs:
+            run.add_done_callback(finished.append)
+
+        for _ in range(len(runs)):
+            while not finished:
+                self.loop.run_once()
+            yield finished.popleft()
+
+    def wait(self):
+        self.loop.run_until_complete(*list(self._outstanding))
+
+    def shutdown(self, wait=True, cancel=False):
+        if cancel:
+            queued = list(self._queue)
+            self._queue.clear()
+            for job, run in queued:
+                run.set_exception(RuntimeError("Cancelled by shutdown"))
+            for run in list(self._outstanding):
+                run.cancel()
+
+        if wait:
+            self.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown(wait=True)
+        return False
+
+    # A job that fails to launch completes (and calls _job_done) from
+    # within _launch(),  the loop below picks up after it rather than
+    # recursing once per failed job.
+    def _start_jobs(self):
+        if self._starting:
+            return
+        self._starting = True
+        try:
+            while self._queue and len(self._active) < self.max_workers:
+                job, run = self._queue.popleft()
+                self._active.add(run)
+                job._launch(run)
+        finally:
+            self._starting = False
+
+    def _job_done(self, run):
+        self._outstanding.discard(run)
+        self._active.discard(run)
+        self._start_jobs()
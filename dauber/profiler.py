@@ -0,0 +1,249 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import json
+import math
+import threading
+
+from timing import monotonic
+from aggregate import TASK_FIELDS, RESULT_FIELDS, task_uuid, task_name
+
+RESULT_HOOKS = ('v2_runner_on_ok', 'v2_runner_on_failed',
+                'v2_runner_on_skipped', 'v2_runner_on_unreachable')
+
+# Upper bounds,  in seconds,  of the buckets of latency histograms
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100,
+           250, 500, 1000)
+
+
+def percentile(values, p):
+    '''
+    The p-th percentile (0-100) of a sorted list of values,  interpolating
+    linearly between the closest ranks.
+    '''
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100.0
+    low = int(math.floor(rank))
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+class TaskProfile(object):
+    '''
+    How long one task took on each host: from the task starting to the
+    host's result. Under the linear strategy this includes the time a host
+    waited for a free fork.
+    '''
+
+    def __init__(self, uuid, name, play, started, durations):
+        self.uuid = uuid
+        self.name = name
+        self.play = play
+        self.started = started
+        self.durations = durations
+        self._sorted = sorted(durations.values())
+
+    @property
+    def count(self):
+        return len(self._sorted)
+
+    @property
+    def slowest(self):
+        '''
+        The (host, seconds) of the host that took longest,  or None.
+        '''
+        if not self.durations:
+            return None
+        host = max(self.durations, key=self.durations.get)
+        return host, self.durations[host]
+
+    def percentile(self, p):
+        return percentile(self._sorted, p)
+
+    def percentiles(self, ps=(50, 90, 95, 99, 100)):
+        return dict((p, self.percentile(p)) for p in ps)
+
+    def histogram(self, buckets=BUCKETS):
+        '''
+        A list of [upper bound,  count] for each bucket,  ending with
+        [None,  count] for durations above the last bound.
+        '''
+        counts = [0] * (len(buckets) + 1)
+        i = 0
+        for value in self._sorted:
+            while i < len(buckets) and value > buckets[i]:
+                i += 1
+            counts[i] += 1
+        return [[bound, count] for bound, count
+                in zip(list(buckets) + [None], counts)]
+
+    def to_dict(self):
+        slowest = self.slowest
+        return {'uuid': self.uuid,
+                'name': self.name,
+                'play': self.play,
+                'started': self.started,
+                'count': self.count,
+                'percentiles': dict((str(p), v) for p, v
+                                    in self.percentiles().items()),
+                'histogram': self.histogram(),
+                'slowest': list(slowest) if slowest else None}
+
+
+class ProfileReport(object):
+    '''
+    The task latencies of a run,  as collected by a TaskProfiler. tasks
+    holds a TaskProfile for each task in the order the tasks started.
+    '''
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+
+    def host_totals(self):
+        '''
+        The seconds each host spent on tasks,  summed over all tasks.
+        '''
+        totals = {}
+        for task in self.tasks:
+            for host, seconds in task.durations.items():
+                totals[host] = totals.get(host, 0) + seconds
+        return totals
+
+    def slowest_hosts(self, n=10):
+        '''
+        The n hosts that spent the most time on tasks,  as (host,  seconds)
+        pairs,  slowest first.
+        '''
+        totals = self.host_totals()
+        return sorted(totals.items(), key=lambda t: (-t[1], t[0]))[:n]
+
+    def slowest_tasks(self, n=10):
+        '''
+        The n tasks whose slowest host took the longest,  slowest first.
+        '''
+        tasks = [t for t in self.tasks if t.durations]
+        return sorted(tasks, key=lambda t: -t.slowest[1])[:n]
+
+    def critical_path(self):
+        '''
+        An estimate of the critical path: each task ends when its slowest
+        host is done (as under the linear strategy),  so the path runs
+        through the slowest host of every task. Returns the total seconds
+        and a list of (task name,  host,  seconds).
+        '''
+        path = [(t.name,) + t.slowest for t in self.tasks if t.durations]
+        return sum(seconds for _, _, seconds in path), path
+
+    def to_dict(self):
+        total, path = self.critical_path()
+        return {'tasks': [t.to_dict() for t in self.tasks],
+                'slowest_hosts': [list(h) for h in self.slowest_hosts()],
+                'critical_path': {'seconds': total,
+                                  'tasks': [list(p) for p in path]}}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+class TaskProfiler(object):
+    '''
+    Pairs each v2_playbook_on_task_start with the v2_runner_on_* results
+    that follow to time every task on every host. Times come from the
+    callback plugin's event headers,  so they are not skewed by batching or
+    queueing (or by replaying a recording);  events without one are timed
+    when they arrive.
+
+        profiler = TaskProfiler()
+        profiler.attach(pb)
+        pb.run()
+        print(profiler.report().to_json())
+
+    report() may be called from any thread,  including during a run.
+    '''
+
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self._play = None
+            self._tasks = {}
+            self._order = []
+
+    def attach(self, playbook):
+        '''
+        Register the profiler's hooks on a ZMQPlaybook (or anything with
+        the same add_hook()).
+        '''
+        playbook.add_hook('v2_playbook_on_play_start', self._on_play_start,
+                          lazy=True, fields=['name'])
+        for hook in ('v2_playbook_on_task_start',
+                     'v2_playbook_on_handler_task_start'):
+            playbook.add_hook(hook, self._on_task_start, lazy=True,
+                              fields=TASK_FIELDS)
+        for hook in RESULT_HOOKS:
+            playbook.add_hook(hook, self._on_result, lazy=True,
+                              fields=RESULT_FIELDS)
+
+    def _time(self, event):
+        t = event.time
+        return t if t is not None else self.clock()
+
+    def _on_play_start(self, event):
+        with self.lock:
+            self._play = (event.result or {}).get('name')
+
+    def _on_task_start(self, event):
+        task = event.result or {}
+        started = self._time(event)
+        with self.lock:
+            entry = self._task(task)
+            entry['started'] = started
+
+    def _on_result(self, event):
+        task = (event.result or {}).get('_task', {})
+        finished = self._time(event)
+        with self.lock:
+            entry = self._task(task)
+            # Results for a task whose start was not seen are not timed
+            if entry['started'] is not None:
+                entry['durations'][event.host] = finished - entry['started']
+
+    # Must hold self.lock
+    def _task(self, task):
+        uuid = task_uuid(task)
+        entry = self._tasks.get(uuid)
+        if entry is None:
+            entry = self._tasks[uuid] = {
+                'name': task_name(task),
+                'play': self._play,
+                'started': None,
+                'durations': {}}
+            self._order.append(uuid)
+        return entry
+
+    def report(self):
+        with self.lock:
+            tasks = [(uuid, dict(self._tasks[uuid])) for uuid in self._order]
+            for _, entry in tasks:
+                entry['durations'] = dict(entry['durations'])
+
+        return ProfileReport([TaskProfile(uuid, e['name'], e['play'],
+                                          e['started'], e['durations'])
+                              for uuid, e in tasks])
@@ -0,0 +1,110 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+# Recordings of the messages ZMQPlaybook receives from the callback plugin,
+# for replaying real runs through hooks without running ansible.
+#
+# A recording starts with MAGIC and is followed by one record per message:
+# the offset in seconds from the start of the recording (a network order
+# double) and the length of the message's frames,  packed as in a batch
+# (see dauber.wire),  as a network order unsigned 32 bit integer. Records
+# are only ever appended;  a record cut short (e.g. by a crash) ends the
+# recording.
+
+import time
+import struct
+
+import wire
+from timing import monotonic
+
+MAGIC = b'DAUBER-RECORDING-1\n'
+
+_RECORD = struct.Struct('!dI')
+
+
+class Recorder(object):
+    '''
+    Appends messages to a recording,  given as a path or a file object
+    opened in binary mode.
+    '''
+
+    def __init__(self, f, clock=monotonic):
+        self._owns_file = not hasattr(f, 'write')
+        self.file = open(f, 'ab') if self._owns_file else f
+        self.clock = clock
+        self.started = clock()
+
+        self.file.seek(0, 2)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+
+    def write(self, frames):
+        data = wire.pack_frames(frames)
+        self.file.write(_RECORD.pack(self.clock() - self.started, len(data)))
+        self.file.write(data)
+
+    def close(self):
+        if self._owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def read_recording(f):
+    '''
+    Yield the (offset, frames) of each message of a recording,  given as a
+    path or a file object opened in binary mode.
+    '''
+    if not hasattr(f, 'read'):
+        with open(f, 'rb') as fp:
+            for record in read_recording(fp):
+                yield record
+        return
+
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a dauber recording")
+
+    while True:
+        head = f.read(_RECORD.size)
+        if len(head) < _RECORD.size:
+            return
+        offset, length = _RECORD.unpack(head)
+
+        data = f.read(length)
+        if len(data) < length:
+            return
+        yield offset, wire.unpack_frames(data)
+
+
+def replay(f, playbook, speed=None, clock=monotonic, sleep=time.sleep):
+    '''
+    Feed a recording through the hooks of a ZMQPlaybook (see
+    ZMQPlaybook.replay()) as fast as possible,  or if 'speed' is given at
+    that multiple of the original pace. Returns the number of messages
+    replayed.
+    '''
+    started = clock()
+    count = 0
+    for offset, frames in read_recording(f):
+        if speed is not None:
+            delay = started + offset / speed - clock()
+            if delay > 0:
+                sleep(delay)
+
+        playbook._dispatch_frames(frames)
+        count += 1
+
+    return count
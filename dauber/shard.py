@@ -0,0 +1,113 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import multiprocessing
+
+from playbook import PlaybookResult
+from inventory import Inventory
+from asyncplaybook import AsyncZMQPlaybook
+from loop import EventLoop
+from bus import EventBus
+
+
+def merge_stats(stats):
+    '''
+    Merge a list of v2_playbook_on_stats payloads (dicts of
+    {counter: {host: count}}) into one by summing the per host counts.
+    '''
+    merged = {}
+    for s in stats:
+        for counter, hosts in s.items():
+            target = merged.setdefault(counter, {})
+            for host, count in hosts.items():
+                target[host] = target.get(host, 0) + count
+    return merged
+
+
+class ShardedResult(PlaybookResult):
+    '''
+    The outcome of a sharded run. returncode is the first non-zero shard
+    return code (or 0),  results holds the PlaybookResult of each shard
+    and stats the merged v2_playbook_on_stats of all shards.
+    '''
+    def __init__(self, results, stats):
+        codes = [r.returncode for r in results if r.returncode != 0]
+        super(ShardedResult, self).__init__(codes[0] if codes else 0)
+        self.results = results
+        self.stats = stats
+
+
+class ShardedPlaybook(object):
+    '''
+    Runs one playbook against an Inventory split into host shards,  with
+    one ansible-playbook process per shard,  so a large fleet is spread
+    over all controller cores. All shards are driven from a single
+    EventLoop and share one EventBus socket (a new one per run unless one
+    is passed as the 'bus' keyword). Hooks added with add_hook() are
+    registered on every shard;  the v2_playbook_on_stats of the shards are
+    merged into one summary.
+
+    Remaining keyword arguments are passed to each shard's
+    AsyncZMQPlaybook.
+    '''
+
+    def __init__(self, playbook, inventory=None, shards=None, loop=None,
+                 **kwargs):
+        self.playbook = playbook
+        self.inventory = inventory
+        self.shards = shards if shards is not None \
+            else multiprocessing.cpu_count()
+        self.loop = loop if loop is not None else EventLoop()
+        self.kwargs = kwargs
+
+        self._hooks = []
+
+    def add_hook(self, hook, callback, lazy=False, fields=None):
+        self._hooks.append((hook, callback, lazy, fields))
+
+    def run(self, inventory=None):
+        if inventory is not None:
+            self.inventory = inventory
+
+        if not isinstance(self.inventory, Inventory):
+            raise TypeError("ShardedPlaybook needs an Inventory object "
+                            "to split into shards")
+
+        kwargs = dict(self.kwargs)
+        bus = kwargs.pop('bus', None)
+        owns_bus = bus is None
+        if owns_bus:
+            bus = EventBus(self.loop)
+
+        stats = []
+        runs = []
+        try:
+            for shard in self.inventory.shard(self.shards):
+                pb = AsyncZMQPlaybook(self.playbook, loop=self.loop, bus=bus,
+                                      **kwargs)
+                for hook, callback, lazy, fields in self._hooks:
+                    pb.add_hook(hook, callback, lazy, fields)
+                pb.add_hook('v2_playbook_on_stats', stats.append)
+
+                runs.append(pb.run(shard))
+
+            self.loop.run_until_complete(*runs)
+        finally:
+            if owns_bus:
+                bus.close()
+
+        return ShardedResult([run.result() for run in runs],
+                             merge_stats(stats))
@@ -0,0 +1,111 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+import os
+import time
+import ctypes
+import ctypes.util
+from contextlib import contextmanager
+
+
+def _clock_gettime_monotonic():
+    # Python 2 has no time.monotonic(),  call clock_gettime(2) directly.
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    librt = ctypes.CDLL(ctypes.util.find_library('rt') or
+                        ctypes.util.find_library('c'), use_errno=True)
+    clock_gettime = librt.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    CLOCK_MONOTONIC = 1
+    ts = timespec()
+
+    def monotonic():
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    monotonic()
+    return monotonic
+
+
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    try:
+        monotonic = _clock_gettime_monotonic()
+    except (OSError, AttributeError, TypeError):
+        # No clock_gettime (e.g. OS X before 10.12),  fall back to the wall
+        # clock which may jump if the system time is changed.
+        monotonic = time.time
+
+
+class RunTimings(object):
+    '''
+    Monotonic timings of the phases of one playbook run. 'marks' holds the
+    offset in seconds from the start of the run at which each phase began
+    (or,  for instants such as 'first_event',  occurred);  'durations'
+    holds how long each phase with an extent took.
+
+    Phases recorded by dauber are 'render' (inventory rendering),  'spawn'
+    (starting ansible-playbook),  'connect' (the ZMQ hello handshake),
+    'first_event' and 'last_event' (callback plugin events),  'exit' (the
+    process exit being noticed) and 'cleanup'.
+    '''
+
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.marks = {}
+        self.durations = {}
+
+    def mark(self, name):
+        self.marks[name] = self.clock() - self.started
+
+    def begin(self, name):
+        self.mark(name)
+
+    def end(self, name):
+        if name in self.marks:
+            self.durations[name] = \
+                self.clock() - self.started - self.marks[name]
+
+    @contextmanager
+    def phase(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def event(self):
+        offset = self.clock() - self.started
+        self.marks.setdefault('first_event', offset)
+        self.marks['last_event'] = offset
+
+    @property
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def to_dict(self):
+        return {'marks': dict(self.marks),
+                'durations': dict(self.durations)}
+
+    def __repr__(self):
+        return "<RunTimings %s>" % ", ".join(
+            "%s=%.6f" % (k, v) for k, v in sorted(self.durations.items()))
@@ -0,0 +1,65 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+# Endpoints of the sockets the callback plugin publishes to. By default a
+# socket is bound to an ipc:// endpoint in a new temporary directory;  any
+# endpoint zmq supports (e.g. "tcp://127.0.0.1:*" or "inproc://events") can
+# be given instead.
+
+import os
+import uuid
+import shutil
+import platform
+import tempfile
+
+import zmq
+
+
+def bind(socket, endpoint=None):
+    '''
+    Bind socket to endpoint,  or to an ipc socket in a new temporary
+    directory if endpoint is None. Returns the endpoint actually bound,
+    with wildcards (e.g. a tcp port of '*') resolved,  and the temporary
+    directory (or None).
+    '''
+    directory = None
+    if endpoint is None:
+        directory = tempfile.mkdtemp()
+        endpoint = "ipc://{}/dauber.socket".format(directory)
+
+    socket.bind(endpoint)
+    return socket.getsockopt(zmq.LAST_ENDPOINT).decode('utf-8'), directory
+
+
+def unbind(socket, endpoint, directory=None):
+    socket.unbind(endpoint)
+    if directory is not None:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def node_name():
+    '''
+    The name events from this controller are tagged with,  DAUBER_NODE or
+    else the host name.
+    '''
+    return os.environ.get('DAUBER_NODE') or platform.node()
+
+
+def new_run_id(node=None):
+    '''
+    A run ID that is unique across controllers.
+    '''
+    return "{}-{}".format(node or node_name(), uuid.uuid4().hex[:12])
@@ -0,0 +1,114 @@
+###############################################################################
+#  Copyright 2016 Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+###############################################################################
+
+# Serializers for the payload frames published by the zmq callback plugin,
+# and the framing of batches of events.
+#
+# ZMQPlaybook asks for a serializer by name through the DAUBER_SERIALIZER
+# environment variable. The plugin uses it if it can (msgpack may not be
+# importable by the python ansible runs under) and otherwise falls back to
+# json; either way it names the serializer it actually uses in its 'hello'
+# message and ZMQPlaybook decodes with that one. The plugin carries its own
+# copy of the encoding side, keep the two in step.
+
+import json
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class JSONSerializer(object):
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class MsgpackSerializer(object):
+    '''
+    msgpack is smaller and considerably cheaper to encode and decode than
+    json. Strings are decoded to unicode,  as they are with json.
+    '''
+    name = 'msgpack'
+
+    def dumps(self, obj):
+        return msgpack.packb(obj, use_bin_type=False)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+SERIALIZERS = {JSONSerializer.name: JSONSerializer()}
+
+if msgpack is not None:
+    SERIALIZERS[MsgpackSerializer.name] = MsgpackSerializer()
+
+DEFAULT_SERIALIZER = 'msgpack' if msgpack is not None else 'json'
+
+
+def get_serializer(name):
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        if name == MsgpackSerializer.name:
+            raise RuntimeError("The msgpack serializer needs the msgpack "
+                               "package, which is not installed.")
+        raise RuntimeError("Unknown serializer '%s', expected one of: %s"
+                           % (name, ", ".join(sorted(SERIALIZERS))))
+
+
+############
+## Batches
+####
+# The plugin can send several events as one 'batch' message. Its single
+# frame holds the frames of each event,  every one prefixed with its length
+# as a network order unsigned 32 bit integer.
+
+# The frames of one event: topic,  header,  args,  kwargs
+EVENT_FRAMES = 4
+
+_LENGTH = struct.Struct('!I')
+
+
+def pack_frames(frames):
+    return b''.join(_LENGTH.pack(len(f)) + f for f in frames)
+
+
+def unpack_frames(data):
+    frames = []
+    offset, end = 0, len(data)
+    while offset < end:
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        frames.append(data[offset:offset + length])
+        offset += length
+    return frames
+
+
+def unpack_batch(data):
+    '''
+    Split a batch into the frames of each event,  in the order they were
+    published.
+    '''
+    frames = unpack_frames(data)
+    return [frames[i:i + EVENT_FRAMES]
+            for i in range(0, len(frames), EVENT_FRAMES)]
@@ -1,13 +1,26 @@
 from __future__ import print_function
-from playbook import Playbook
+from playbook import Playbook, POLL_INTERVAL
+from output import LineReader, LoggingSink
+from timing import monotonic, RunTimings
+from event import Event
+from record import Recorder
+from aggregate import RunAggregator
+from profiler import TaskProfiler
+import record
+import transport
+import wire
 import zmq
 import json
-import subprocess
 import logging
-import tempfile
-import shutil
+import threading
 import pkg_resources as pr
-import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+PUBLISH_POLICIES = ('drop', 'block', 'spill')
 
 ANSIBLE_HOOK_TOPICS = [
     'v2_runner_on_failed',                # def v2_runner_on_failed(result, ignore_errors):
@@ -34,21 +47,155 @@ ANSIBLE_HOOK_TOPICS = [
 class ZMQPlaybook(Playbook):
 
     def __init__(self, *args, **kwargs):
+        serializer = kwargs.pop("serializer", None)
+        batch_size = kwargs.pop("batch_size", None)
+        batch_interval = kwargs.pop("batch_interval", 0.1)
+        handshake_timeout = kwargs.pop("handshake_timeout", 60)
+        drain_timeout = kwargs.pop("drain_timeout", 5)
+        dispatcher = kwargs.pop("dispatcher", None)
+        bus = kwargs.pop("bus", None)
+        recording = kwargs.pop("record", None)
+        encoders = kwargs.pop("encoders", None)
+        sndhwm = kwargs.pop("sndhwm", None)
+        rcvhwm = kwargs.pop("rcvhwm", None)
+        publish_policy = kwargs.pop("publish_policy", None)
+        spill_limit = kwargs.pop("spill_limit", None)
+        endpoint = kwargs.pop("endpoint", None)
+        collector = kwargs.pop("collector", None)
+        node = kwargs.pop("node", None)
         super(ZMQPlaybook, self).__init__(*args, **kwargs)
-        self._sockets = []
+        self._handlers = {}
         self._hooks = {}
-
-        self.context = kwargs.get("context", zmq.Context.instance())
-        self.socket = self.context.socket(zmq.SUB)
-
-        self.socket_dir = tempfile.mkdtemp()
-        self._env['DAUBER_SOCKET_URI'] = "ipc://{}/dauber.socket".format(self.socket_dir)
-        self.socket.connect(self._env['DAUBER_SOCKET_URI'])
-
-        self._env['DAUBER_CONTROL_SOCKET_URI'] = "ipc://{}/control.socket".format(self.socket_dir)
+        self._fields = {}
+        self._topics = set()
+
+        # Runs on a shared dauber.bus.EventBus use its socket and register
+        # with it for a run ID while they run,  rather than binding their own
+        self.bus = bus
+        self.run_id = None
+        if bus is not None:
+            self.context = bus.context
+            self.socket = None
+            self._env['DAUBER_SOCKET_URI'] = bus.uri
+        else:
+            self.context = kwargs.get("context", zmq.Context.instance())
+            self.socket = self.context.socket(zmq.SUB)
+            # Applies to connections accepted after the socket is bound
+            if rcvhwm is not None:
+                self.socket.setsockopt(zmq.RCVHWM, rcvhwm)
+
+        # The name events are tagged with (see dauber.event.Event.node),
+        # the host name unless given
+        if node is not None:
+            self._env['DAUBER_NODE'] = node
+
+        # Runs reporting to a dauber.collector.Collector ('collector' is the
+        # (listen,  publish) pair of endpoints it is bound to) have the
+        # plugin publish to the collector,  which may be on another machine,
+        # and read their events back from its feed. A run ID unique across
+        # controllers prefixes the topics (see DAUBER_RUN_ID) so that each
+        # ZMQPlaybook only subscribes to its own.
+        self.collector = collector
+        self._prefix = ''
+        if collector is not None:
+            if bus is not None:
+                raise ValueError("A ZMQPlaybook cannot use both a bus and "
+                                 "a collector")
+            listen, publish = collector
+            self._prefix = transport.new_run_id(node) + '/'
+            self._env['DAUBER_RUN_ID'] = self._prefix[:-1]
+            self._env['DAUBER_SOCKET_URI'] = listen
+            self.socket.connect(publish)
+
+        # Otherwise we bind and the callback plugin connects,  so the plugin
+        # finds the socket in place as soon as it starts (see _connect()).
+        # 'endpoint' is any endpoint zmq can bind (e.g. "tcp://*:5555",  a
+        # port of '*' picks a free one);  by default an ipc socket in a new
+        # temporary directory.
+        self.endpoint = endpoint
+        self.socket_dir = None
+        self._bound = None
+        self._bind()
+
+        # The plugin always sends a 'hello' as its first message and a 'bye'
+        # as its last
+        self._subscribe('hello')
+        self._subscribe('bye')
+        self._connected = False
+        self._finished = False
+
+        # Seconds to wait for the callback plugin to connect, used by both
+        # sides of the handshake.
+        self.handshake_timeout = handshake_timeout
+        self._env['DAUBER_HANDSHAKE_TIMEOUT'] = str(handshake_timeout)
+
+        # Seconds to keep reading after ansible-playbook exits while the
+        # plugin has not said 'bye' (e.g. because it was killed)
+        self.drain_timeout = drain_timeout
+
+        # Ask the callback plugin for a serializer (see dauber.wire), the
+        # 'serializer' keyword takes precedence over DAUBER_SERIALIZER from
+        # the environment.
+        if serializer is None:
+            serializer = self._env.get('DAUBER_SERIALIZER',
+                                       wire.DEFAULT_SERIALIZER)
+        self._serializer = wire.get_serializer(serializer)
+        self._env['DAUBER_SERIALIZER'] = self._serializer.name
+
+        # Opt in to having the plugin send events in batches of up to
+        # batch_size events,  sent at the latest batch_interval seconds after
+        # the first event of the batch. Batches are unpacked transparently.
+        if batch_size is not None:
+            self._env['DAUBER_BATCH_SIZE'] = str(batch_size)
+            self._env['DAUBER_BATCH_INTERVAL'] = str(batch_interval)
+            self._subscribe('batch')
+
+        # How the callback plugin publishes when we fall behind: its send
+        # high-water mark and the policy once that is reached,  'drop'
+        # (the default),  'block' or 'spill' (see Publisher in the plugin).
+        # The plugin's counters of sent,  dropped and spilled events end up
+        # in publish_stats and the PlaybookResult.
+        if sndhwm is not None:
+            # The plugin's socket reports a full queue rather than dropping
+            # (XPUB_NODROP),  with room for a single message every send
+            # after the handshake would find it full
+            if sndhwm < 2:
+                raise ValueError("sndhwm must be at least 2, got %s" % sndhwm)
+            self._env['DAUBER_SNDHWM'] = str(sndhwm)
+        if publish_policy is not None:
+            if publish_policy not in PUBLISH_POLICIES:
+                raise ValueError("Unknown publish policy '%s', expected one "
+                                 "of: %s" % (publish_policy,
+                                             ", ".join(PUBLISH_POLICIES)))
+            self._env['DAUBER_PUBLISH_POLICY'] = publish_policy
+        if spill_limit is not None:
+            self._env['DAUBER_SPILL_LIMIT'] = str(spill_limit)
+        self.publish_stats = None
+
+        # The ansible-playbook process of the current (or last) run
+        self._process = None
+
+        # Modules,  importable by the python ansible runs under,  that
+        # register encoders for more types with the callback plugin (see
+        # register_encoder() in callback_plugins/zmq.py)
+        if encoders:
+            self._env['DAUBER_ENCODERS'] = ",".join(encoders)
+
+        # A dauber.dispatch.HookDispatcher to run hook callbacks on,  rather
+        # than calling them from the loop that reads the socket. Events
+        # without a host are barriers there,  so hooks still see a task's
+        # start before its results.
+        self.dispatcher = dispatcher
+
+        # A path (or binary file object) to append the messages of each run
+        # to,  for replay() (see dauber.record)
+        self.record = recording
+        self._recorder = None
 
         self.poller = zmq.Poller()
-        self._register_socket(self.socket, self.__class__._zmq_socket_handler)
+        if self.socket is not None:
+            self._register_socket(self.socket,
+                                  self.__class__._zmq_socket_handler)
 
         self.add_callback_plugin_dir(
             pr.resource_filename(__name__, 'ansible/callback_plugins'))
@@ -57,104 +204,395 @@ class ZMQPlaybook(Playbook):
 
         self.verbosity = 4
 
-    def add_hook(self, hook, callback):
+    # Callbacks added with lazy=True are called with a single dauber.event.Event
+    # rather than the decoded arguments of the hook, so they only pay for
+    # decoding what they use.
+    #
+    # 'fields' lists the dotted attribute paths of the hook's first argument
+    # the callback needs (e.g. ['_result.changed', '_host.name']). The callback
+    # plugin then only serializes those,  and the callback receives nested
+    # dicts holding just them. Unless every callback of a hook declares its
+    # fields the full argument is sent.
+    def add_hook(self, hook, callback, lazy=False, fields=None):
         assert hook in ANSIBLE_HOOK_TOPICS, \
             "%s is not defined in ANSIBLE_HOOK_TOPICS" % hook
         if hook not in self._hooks:
             self._hooks[hook] = []
+            self._subscribe(hook)
+
+        self._hooks[hook].append((callback, lazy, fields))
+        self._update_hook_env()
+
+    def remove_hook(self, hook, callback):
+        hooks = [h for h in self._hooks.get(hook, []) if h[0] != callback]
+        if hooks:
+            self._hooks[hook] = hooks
+        elif hook in self._hooks:
+            del self._hooks[hook]
+            self._unsubscribe(hook)
+        self._update_hook_env()
+
+    def _update_hook_env(self):
+        self._fields = {}
+        for hook, hooks in self._hooks.items():
+            if all(fields is not None for _, _, fields in hooks):
+                self._fields[hook] = set().union(
+                    *[fields for _, _, fields in hooks])
+
+        self._env['DAUBER_FIELDS'] = json.dumps(
+            {h: sorted(f) for h, f in self._fields.items()})
+
+        # The plugin does not send events for hooks nobody listens to. With
+        # no hooks at all it is only asked for its hello and bye.
+        if self._hooks:
+            self._env['DAUBER_TOPICS'] = ",".join(sorted(self._hooks))
+        else:
+            self._env.pop('DAUBER_TOPICS', None)
+
+    def events(self, inventory=None, topics=None, maxsize=1000):
+        '''
+        Run the playbook in a background thread and yield a
+        dauber.event.Event for each event on 'topics' (every hook but
+        v2_on_any by default) as it arrives. At most maxsize events are
+        buffered;  while the buffer is full reading from the callback
+        plugin waits,  which pushes back on the plugin (see
+        publish_policy). Stopping early (break,  or close() on the
+        generator) terminates ansible-playbook. An exception raised by the
+        run is raised once the events before it have been consumed. The
+        PlaybookResult is in self.result afterwards.
+        '''
+        if topics is None:
+            topics = [t for t in ANSIBLE_HOOK_TOPICS if t != 'v2_on_any']
+
+        buf = queue.Queue(maxsize)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    buf.put(item, timeout=POLL_INTERVAL)
+                    return
+                except queue.Full:
+                    pass
+
+        def push(event):
+            put(('event', event))
+
+        def run():
+            try:
+                self.run(inventory)
+            except Exception as e:
+                put(('error', e))
+            else:
+                put(('end', None))
+
+        for topic in topics:
+            self.add_hook(topic, push, lazy=True)
+
+        self._process = None
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
 
-        self.socket.setsockopt(zmq.SUBSCRIBE, hook)
-
-        self._hooks[hook].append(callback)
-
-    # This is a "private" API for registering sockets on the the polling loop
+        try:
+            while True:
+                kind, value = buf.get()
+                if kind == 'event':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            stopped.set()
+            while thread.is_alive():
+                if self._process is not None and self._process.poll() is None:
+                    self._process.terminate()
+                thread.join(POLL_INTERVAL)
+
+            for topic in topics:
+                self.remove_hook(topic, push)
+
+    def add_aggregator(self, aggregator=None):
+        '''
+        Attach a dauber.aggregate.RunAggregator (a new one unless one is
+        given) whose snapshot() shows the progress of runs as they happen.
+        Returns the aggregator.
+        '''
+        if aggregator is None:
+            aggregator = RunAggregator()
+        aggregator.attach(self)
+        return aggregator
+
+    def add_profiler(self, profiler=None):
+        '''
+        Attach a dauber.profiler.TaskProfiler (a new one unless one is
+        given) that times every task on every host. Returns the profiler.
+        '''
+        if profiler is None:
+            profiler = TaskProfiler()
+        profiler.attach(self)
+        return profiler
+
+    # This is a "private" API for registering sockets on the the polling loop.
+    # callback is called as callback(self, socket) when socket is readable.
+    # Handlers are kept in a table keyed the way zmq.Poller reports ready
+    # items,  zmq sockets by themselves and anything else by file
+    # descriptor,  so each wakeup only touches what is ready.
     def _register_socket(self, socket, callback, opt=zmq.POLLIN):
         self.poller.register(socket, opt)
-        self._sockets.append((socket, callback, opt))
+        self._handlers[self._poll_key(socket)] = (socket, callback)
+
+    def _unregister_socket(self, socket):
+        if self._handlers.pop(self._poll_key(socket), None) is not None:
+            self.poller.unregister(socket)
+
+    def _poll_key(self, socket):
+        if isinstance(socket, (zmq.Socket, int)):
+            return socket
+        return socket.fileno()
+
+    def _poll(self, timeout):
+        for key, _ in self.poller.poll(timeout * 1000):
+            # A handler may have unregistered another ready item
+            handler = self._handlers.get(key)
+            if handler is not None:
+                socket, callback = handler
+                callback(self, socket)
 
     def _zmq_socket_handler(self, socket):
-        topic, args, kwargs = socket.recv_multipart()
+        while True:
+            try:
+                frames = socket.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            if self._prefix:
+                frames[0] = frames[0][len(self._prefix):]
+            self._dispatch_frames(frames)
+
+    def _subscribe(self, topic):
+        self._topics.add(topic)
+        if self.bus is None:
+            self.socket.setsockopt(zmq.SUBSCRIBE, self._prefix + topic)
+        elif self.run_id is not None:
+            self.bus.subscribe(self.run_id, topic)
+
+    def _unsubscribe(self, topic):
+        self._topics.discard(topic)
+        if self.bus is None:
+            self.socket.setsockopt(zmq.UNSUBSCRIBE, self._prefix + topic)
+        elif self.run_id is not None:
+            self.bus.unsubscribe(self.run_id, topic)
+
+    def _bind(self):
+        if self.bus is not None:
+            if self.run_id is None:
+                self.run_id = self.bus.register(self, self._topics)
+                self._env['DAUBER_RUN_ID'] = self.run_id
+        elif self.collector is None and self._bound is None:
+            self._bound, self.socket_dir = \
+                transport.bind(self.socket, self.endpoint)
+            self._env['DAUBER_SOCKET_URI'] = self._bound
+
+    def _spawn(self):
+        if self.record is not None:
+            self._recorder = Recorder(self.record)
+        return super(ZMQPlaybook, self)._spawn()
+
+    def replay(self, recording, speed=None):
+        '''
+        Call the hooks with the messages of a recording (see the 'record'
+        keyword) without running ansible,  as fast as possible or at 'speed'
+        times the pace they were recorded at. Returns the number of messages
+        replayed.
+        '''
+        self._timings = RunTimings()
+        count = record.replay(recording, self, speed)
+        self._join_dispatcher()
+        return count
+
+    def _dispatch_frames(self, frames):
+        if self._recorder is not None:
+            self._recorder.write(frames)
+
+        if frames[0] == 'hello':
+            self._on_hello(frames[1])
+        elif frames[0] == 'bye':
+            self._on_bye(frames[1])
+        elif frames[0] == 'batch':
+            for event in wire.unpack_batch(frames[1]):
+                self._dispatch(*event)
+        else:
+            self._dispatch(*frames)
 
+    def _dispatch(self, topic, header, args, kwargs):
+        self._timings.event()
         self.logger.debug("Recieved notification on topic: {}".format(topic))
-        args = json.loads(args)
-        kwargs = json.loads(kwargs)
 
-        if topic not in self._hooks or not self._hooks[topic]:
+        hooks = self._hooks.get(topic)
+        if not hooks:
             self.logger.warn("Listening on {}, but no topic hook is defined. "
                              "Doing nothing.".format(topic))
-        else:
-            for callback in self._hooks[topic]:
-                callback(*args, **kwargs)
-
-
-    def _ansible_stdout_handler(self, stdout):
-        #        self.logger.info(stdout.readline().strip())
-        pass
-
-    def _ansible_stderr_handler(self, stderr):
-        self.logger.error(stderr.readline().strip())
-
-    # see: http://zguide.zeromq.org/page:all#toc47
-    def _connect(self):
-        # Subscribe to the hello topic - once we recieve a hello we'll send a request
-        # for real data.  The callback plugin will effectively block execution until we
-        # Send this request
-        self.socket.setsockopt(zmq.SUBSCRIBE, 'hello')
-
-        # Define the control socket for responding to the 'hello' topic
-        control_socket = self.context.socket(zmq.REQ)
-        control_socket.connect(self._env['DAUBER_CONTROL_SOCKET_URI'])
-        timeout = 500
-        t_last = time.time()
-        while (time.time() - t_last) < timeout:
-            ready = dict(self.poller.poll())
-            if ready.get(self.socket):
-                topic, _ = self.socket.recv_multipart()
-                if topic == 'hello':
-                    # Signal that we've connected and we're ready to recieve data
-                    control_socket.send(b'')
-                    control_socket.recv()
-                    break
-
-        assert (time.time() - t_last) < timeout, \
-            "Timed out before recieving a hello topic message from the publisher."
-
-        del control_socket
-        self.socket.setsockopt(zmq.UNSUBSCRIBE, 'hello')
-
+            return
 
+        # Nothing is decoded until a callback asks for it
+        event = Event(topic, header, args, kwargs, self._serializer)
+        if self.dispatcher is not None:
+            self.dispatcher.submit(event.host, topic, self._call_hooks,
+                                   hooks, event)
+        else:
+            self._call_hooks(hooks, event)
+
+    def _call_hooks(self, hooks, event):
+        for callback, lazy, _ in hooks:
+            if lazy:
+                callback(event)
+            else:
+                callback(*event.args, **event.kwargs)
+
+    def _join_dispatcher(self):
+        # Hooks have seen every event by the time a run completes
+        if self.dispatcher is not None:
+            self.dispatcher.join()
+
+    # Results arrive through the callback plugin,  so by default only stderr
+    # is logged.
+    def _open_sinks(self):
+        super(ZMQPlaybook, self)._open_sinks()
+        if self.sinks is None:
+            self._sinks = [LoggingSink(self.logger, streams=('stderr',))]
+
+    def _ansible_stdout_handler(self, reader):
+        for line in reader.read():
+            self._handle_stdout(line)
+        if reader.closed:
+            self._unregister_socket(reader)
+
+    def _ansible_stderr_handler(self, reader):
+        for line in reader.read():
+            self._handle_stderr(line)
+        if reader.closed:
+            self._unregister_socket(reader)
+
+    # The late joiner problem (see: http://zguide.zeromq.org/page:all#toc47)
+    # is solved on the plugin's side: it publishes through an XPUB socket and
+    # waits for our subscriptions to arrive before it sends anything. Here we
+    # only wait for the 'hello' that follows,  without busy polling,  until the
+    # process exits or handshake_timeout expires.
+    def _connect(self, process):
+        deadline = monotonic() + self.handshake_timeout
+        while not self._connected:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                if process.poll() is None:
+                    process.terminate()
+                raise RuntimeError(self._handshake_error_message())
+
+            if self.socket.poll(min(remaining, POLL_INTERVAL) * 1000):
+                self._zmq_socket_handler(self.socket)
+            elif process.poll() is not None:
+                # Exited before loading callback plugins (e.g. a syntax
+                # error in the playbook)
+                return
+
+    def _handshake_error_message(self):
+        return ("The dauber callback plugin did not connect to {} within {} "
+                "seconds. Check that ansible-playbook loads callback plugins "
+                "from ANSIBLE_CALLBACK_PLUGINS ({}) and can import zmq."
+                .format(self._env['DAUBER_SOCKET_URI'], self.handshake_timeout,
+                        self._env.get('ANSIBLE_CALLBACK_PLUGINS')))
+
+    def _on_hello(self, serializer):
+        self._connected = True
+        self._set_serializer(serializer)
+
+    def _on_bye(self, data):
+        self._finished = True
+        # Plugins that predate publishing counters send nothing
+        self.publish_stats = self._serializer.loads(data) if data else None
+        if self.publish_stats and self.publish_stats.get('dropped'):
+            self.logger.warning("The dauber callback plugin dropped {} "
+                                "events".format(self.publish_stats['dropped']))
+
+    def _make_result(self, returncode):
+        result = super(ZMQPlaybook, self)._make_result(returncode)
+        result.publish_stats = self.publish_stats
+        return result
+
+    def _set_serializer(self, name):
+        # The serializer the plugin settled on. Plugins that predate
+        # serializer negotiation send an empty name and always use json.
+        self._serializer = wire.get_serializer(name or 'json')
+        if self._serializer.name != self._env['DAUBER_SERIALIZER']:
+            self.logger.info("Callback plugin uses the {} serializer"
+                             .format(self._serializer.name))
 
     def _run(self):
-        self.logger.debug(self.cmd)
-        p = subprocess.Popen(self.cmd, env=self._env, stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
+        if self.bus is not None:
+            raise RuntimeError("Runs on an EventBus are driven by its "
+                               "EventLoop,  use AsyncZMQPlaybook")
 
-        # This function negotiates the late joiner problem
-        self._connect()
+        self._bind()
+        self._connected = False
+        self._finished = False
+        self.publish_stats = None
+        p = self._process = self._spawn()
 
-        self._register_socket(p.stdout, self.__class__._ansible_stdout_handler)
-        self._register_socket(p.stderr, self.__class__._ansible_stderr_handler)
+        with self._timings.phase('connect'):
+            self._connect(p)
 
-        while True:
-            ready = dict(self.poller.poll())
-
-            for socket, callback, opt in self._sockets:
-                try:
-                    if socket.fileno() in ready and ready[socket.fileno()] == zmq.POLLIN:
-                        callback(self, socket)
-                except AttributeError:
-                    if socket in ready and ready[socket] == zmq.POLLIN:
-                        callback(self, socket)
-
-            if p.poll() is not None:
-                break
+        stdout, stderr = LineReader(p.stdout), LineReader(p.stderr)
+        self._register_socket(stdout, self.__class__._ansible_stdout_handler)
+        self._register_socket(stderr, self.__class__._ansible_stderr_handler)
 
+        try:
+            while p.poll() is None:
+                self._poll(POLL_INTERVAL)
+            self._timings.mark('exit')
+
+            # Once the process has exited everything it wrote is sitting in
+            # the pipes,  so only read what is immediately available there
+            # (grandchildren such as ssh control masters may hold them open)
+            for line in stdout.drain():
+                self._handle_stdout(line)
+            for line in stderr.drain():
+                self._handle_stderr(line)
+
+            self._drain_socket(p)
+        finally:
+            self._unregister_socket(stdout)
+            self._unregister_socket(stderr)
+
+        self._flush_sinks()
+        self._join_dispatcher()
 
         return p.wait()
 
+    # Events may still be in flight when ansible-playbook exits (typically
+    # the stats),  keep reading until the plugin says 'bye' or drain_timeout
+    # passes. A process killed by a signal never says 'bye'.
+    def _drain_socket(self, process):
+        deadline = monotonic() + self.drain_timeout
+        while self._connected and not self._finished \
+                and process.returncode >= 0:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                self.logger.warning("The dauber callback plugin did not end "
+                                    "its event stream within {} seconds"
+                                    .format(self.drain_timeout))
+                break
+            if self.socket.poll(min(remaining, POLL_INTERVAL) * 1000):
+                self._zmq_socket_handler(self.socket)
+
     def cleanup(self):
         super(ZMQPlaybook, self).cleanup()
-        try:
-            shutil.rmtree(self.socket_dir)
-        except OSError:
-            pass
+        if self.run_id is not None:
+            self.bus.unregister(self.run_id)
+            self.run_id = None
+            del self._env['DAUBER_RUN_ID']
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+        if self._bound is not None:
+            transport.unbind(self.socket, self._bound, self.socket_dir)
+            self._bound = self.socket_dir = None
@@ -27,9 +27,13 @@ setup(name='dauber',
       author_email='chris.kotfila@kitware.com',
       url='http://www.kitware.com',
       packages=['dauber'],
-      package_data={'dauber': ['ansible/callback_plugins/*.py']},
+      package_data={'dauber': ['ansible/callback_plugins/*.py',
+                               'ansible/inventory/*.sh']},
       test_suite="tests.test_suite",
       install_requires=[],
+      extras_require={'msgpack': ['msgpack>=0.5.2']},
+      entry_points={'console_scripts': [
+          'dauber-collector = dauber.collector:main']},
       license='Apache 2.0',
       zip_safe=False,
       keywords='ansible',
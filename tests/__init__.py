@@ -1,13 +1,43 @@
 import unittest
+import aggregate_test
+import asyncplaybook_test
+import bus_test
+import collector_test
+import dispatch_test
+import event_test
 import inventory_test
+import inventorycache_test
+import output_test
+import parser_test
 import playbook_test
+import pool_test
+import profiler_test
+import record_test
+import shard_test
+import timing_test
+import wire_test
 import zmqplaybook_test
 
 def test_suite():
     loader = unittest.TestLoader()
 
     suite = loader.loadTestsFromModule(inventory_test)
+    suite.addTests(loader.loadTestsFromModule(dispatch_test))
+    suite.addTests(loader.loadTestsFromModule(event_test))
+    suite.addTests(loader.loadTestsFromModule(inventorycache_test))
+    suite.addTests(loader.loadTestsFromModule(output_test))
+    suite.addTests(loader.loadTestsFromModule(parser_test))
     suite.addTests(loader.loadTestsFromModule(playbook_test))
     suite.addTests(loader.loadTestsFromModule(zmqplaybook_test))
+    suite.addTests(loader.loadTestsFromModule(aggregate_test))
+    suite.addTests(loader.loadTestsFromModule(asyncplaybook_test))
+    suite.addTests(loader.loadTestsFromModule(bus_test))
+    suite.addTests(loader.loadTestsFromModule(collector_test))
+    suite.addTests(loader.loadTestsFromModule(pool_test))
+    suite.addTests(loader.loadTestsFromModule(profiler_test))
+    suite.addTests(loader.loadTestsFromModule(record_test))
+    suite.addTests(loader.loadTestsFromModule(shard_test))
+    suite.addTests(loader.loadTestsFromModule(timing_test))
+    suite.addTests(loader.loadTestsFromModule(wire_test))
 
     return suite
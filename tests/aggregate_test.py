@@ -0,0 +1,111 @@
+import unittest
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from dauber.aggregate import RunAggregator
+from dauber.zmqplaybook import ZMQPlaybook
+from dauber import Inventory
+from fixtures import event, task, result
+
+class RunAggregatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.aggregator = RunAggregator(clock=lambda: 42.0)
+
+    def feed(self, topic, host=None, result=None, **kwargs):
+        header = {'host': host} if host else {}
+        getattr(self.aggregator, '_' + topic)(
+            event(topic, header, [result], kwargs))
+
+    def test_counts(self):
+        self.feed('v2_playbook_on_play_start', result={'name': 'site'})
+        self.feed('v2_playbook_on_task_start', result=task('t1', 'install'))
+        self.feed('v2_runner_on_ok', 'web1', result('t1', 'install', changed=True))
+        self.feed('v2_runner_on_ok', 'web2', result('t1', 'install'))
+        self.feed('v2_runner_on_failed', 'db1', result('t1', 'install'))
+        self.feed('v2_runner_on_failed', 'db2', result('t1', 'install'),
+                  ignore_errors=True)
+        self.feed('v2_runner_on_unreachable', 'db3', result('t1', 'install'))
+
+        snapshot = self.aggregator.snapshot()
+        self.assertEquals(snapshot['totals'],
+                          {'ok': 3, 'changed': 1, 'failed': 1, 'skipped': 0,
+                           'unreachable': 1})
+        self.assertEquals(snapshot['hosts']['web1'],
+                          {'ok': 1, 'changed': 1, 'failed': 0, 'skipped': 0,
+                           'unreachable': 0, 'task': 't1'})
+        self.assertEquals(snapshot['current']['name'], 'install')
+        self.assertEquals(snapshot['current']['play'], 'site')
+        self.assertEquals(snapshot['current']['started'], 42.0)
+        self.assertEquals(snapshot['current']['counts']['ok'], 3)
+        self.assertFalse(snapshot['done'])
+
+        self.feed('v2_playbook_on_stats', result={})
+        snapshot = self.aggregator.snapshot()
+        self.assertTrue(snapshot['done'])
+        self.assertIsNone(snapshot['current'])
+
+    def test_snapshots_are_incremental(self):
+        self.feed('v2_playbook_on_task_start', result=task('t1', 'a'))
+        self.feed('v2_runner_on_ok', 'web1', result('t1', 'a'))
+        self.feed('v2_runner_on_ok', 'web2', result('t1', 'a'))
+        first = self.aggregator.snapshot()
+
+        # Nothing changed
+        self.assertIs(self.aggregator.snapshot(), first)
+
+        self.feed('v2_playbook_on_task_start', result=task('t2', 'b'))
+        self.feed('v2_runner_on_skipped', 'web2', result('t2', 'b'))
+        second = self.aggregator.snapshot()
+
+        # Unchanged entries are shared,  earlier snapshots are left alone
+        self.assertIs(second['hosts']['web1'], first['hosts']['web1'])
+        self.assertIs(second['tasks'][0], first['tasks'][0])
+        self.assertEquals(first['hosts']['web2']['skipped'], 0)
+        self.assertEquals(second['hosts']['web2']['skipped'], 1)
+        self.assertEquals([t['name'] for t in second['tasks']], ['a', 'b'])
+
+    def test_full_task_payload(self):
+        self.feed('v2_runner_on_ok', 'web1',
+                  {'_task': {'uuid': 't1', 'name': '', 'action': 'ping'},
+                   '_result': {}})
+        snapshot = self.aggregator.snapshot()
+        self.assertEquals(snapshot['tasks'][0]['name'], 'ping')
+
+    def test_snapshot_from_other_thread(self):
+        done = threading.Event()
+        snapshots = []
+
+        def poll():
+            while not done.is_set():
+                snapshots.append(self.aggregator.snapshot())
+
+        poller = threading.Thread(target=poll)
+        poller.start()
+        try:
+            for i in range(2000):
+                self.feed('v2_runner_on_ok', 'host%d' % (i % 100),
+                          result('t1', 'a'))
+        finally:
+            done.set()
+            poller.join()
+
+        snapshot = self.aggregator.snapshot()
+        self.assertEquals(snapshot['totals']['ok'], 2000)
+        self.assertEquals(sum(h['ok'] for h in snapshot['hosts'].values()),
+                          2000)
+
+    def test_attached_to_playbook(self):
+        p = ZMQPlaybook(os.path.join(os.path.dirname(
+            os.path.realpath(__file__)), "playbooks", "zmq_runner_on_ok.yml"))
+        aggregator = p.add_aggregator()
+        p.run(Inventory(["localhost"]))
+
+        snapshot = aggregator.snapshot()
+        self.assertTrue(snapshot['done'])
+        self.assertEquals(snapshot['hosts']['localhost']['ok'], 2)
+        self.assertEquals([t['name'] for t in snapshot['tasks']],
+                          ['setup', 'debug'])
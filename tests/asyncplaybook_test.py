@@ -0,0 +1,166 @@
+import unittest
+import mock
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.asyncplaybook as playbook
+from dauber import Inventory
+from dauber.loop import EventLoop
+
+class AsyncPlaybookTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = EventLoop()
+
+    def tearDown(self):
+        pass
+
+    def get_playbook_path(self, f):
+        return os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            "playbooks", f)
+
+    def get_bin_path(self, f):
+        return os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            "bin", f)
+
+    def test_async_playbook_run_returns_immediately(self):
+        p = playbook.AsyncPlaybook(self.get_playbook_path("successful.yml"),
+                                   loop=self.loop)
+        run = p.run(Inventory(["localhost"]))
+        self.assertFalse(run.done())
+        self.assertEquals(run.result().returncode, 0)
+        self.assertTrue(run.done())
+
+    def test_async_playbook_failure_code(self):
+        p = playbook.AsyncPlaybook(self.get_playbook_path("missing_variable.yml"),
+                                   loop=self.loop)
+        p.logger = mock.MagicMock(return_value=None)
+        run = p.run(Inventory(["localhost"]))
+        self.assertNotEquals(run.result().returncode, 0)
+
+    def test_async_playbook_concurrent_runs(self):
+        runs = []
+        loggers = []
+        for _ in range(5):
+            p = playbook.AsyncPlaybook(
+                "some_playbook.yml", "some_inventory", loop=self.loop,
+                ansible_playbook_bin=self.get_bin_path("chatty-ansible-playbook"))
+            p.logger = mock.MagicMock(return_value=None)
+            loggers.append(p.logger)
+            runs.append(p.run())
+
+        self.loop.run_until_complete(*runs)
+
+        for run, logger in zip(runs, loggers):
+            self.assertEquals(run.result().returncode, 0)
+            self.assertEquals(logger.info.call_count, 5001)
+            logger.info.assert_called_with("last line without newline")
+
+    def test_async_playbook_done_callback(self):
+        p = playbook.AsyncPlaybook(self.get_playbook_path("successful.yml"),
+                                   loop=self.loop)
+        m = mock.Mock()
+        run = p.run(Inventory(["localhost"]))
+        run.add_done_callback(m)
+        run.result()
+        m.assert_called_once_with(run)
+
+    def test_async_playbook_cleans_up_inventory(self):
+        p = playbook.AsyncPlaybook(self.get_playbook_path("successful.yml"),
+                                   loop=self.loop)
+        run = p.run(Inventory(["localhost"]))
+        path = p.inventory_path
+        self.assertTrue(os.path.exists(path))
+        run.result()
+        self.assertFalse(os.path.exists(path))
+
+    def test_async_zmq_playbook_hooks(self):
+        m = mock.Mock()
+        runs = []
+        for _ in range(3):
+            p = playbook.AsyncZMQPlaybook(
+                self.get_playbook_path("zmq_runner_on_ok.yml"), loop=self.loop)
+            p.add_hook('v2_runner_on_ok', m)
+            runs.append(p.run(Inventory(["localhost"])))
+
+        self.loop.run_until_complete(*runs)
+
+        for run in runs:
+            self.assertEquals(run.result().returncode, 0)
+        self.assertEquals(m.call_count, 6)
+
+    def test_async_zmq_playbook_timings(self):
+        p = playbook.AsyncZMQPlaybook(
+            self.get_playbook_path("zmq_runner_on_ok.yml"), loop=self.loop)
+        p.add_hook('v2_runner_on_ok', mock.Mock())
+        m = mock.Mock()
+        p.add_metrics_hook(m)
+        result = p.run(Inventory(["localhost"])).result()
+
+        m.assert_called_once_with(result)
+        self.assertIn('connect', result.timings.durations)
+        self.assertIn('cleanup', result.timings.durations)
+        self.assertLessEqual(result.timings.marks['first_event'],
+                             result.timings.marks['exit'])
+
+    def test_async_zmq_playbook_handshake_timeout(self):
+        p = playbook.AsyncZMQPlaybook(
+            "some_playbook.yml", "some_inventory", loop=self.loop,
+            handshake_timeout=0.2,
+            ansible_playbook_bin=self.get_bin_path("silent-ansible-playbook"))
+        p.logger = mock.MagicMock(return_value=None)
+        run = p.run()
+
+        self.assertIsInstance(run.exception(), RuntimeError)
+        self.assertIsNotNone(run.process.poll())
+
+    def test_async_zmq_playbook_failed_spawn_leaves_loop_clean(self):
+        p = playbook.AsyncZMQPlaybook(
+            "some_playbook.yml", "some_inventory", loop=self.loop,
+            ansible_playbook_bin="/nonexistent/ansible-playbook")
+        p.logger = mock.MagicMock(return_value=None)
+        run = p.run()
+
+        self.assertIsInstance(run.exception(), OSError)
+        self.assertNotIn(p.socket, self.loop._readers)
+        self.assertEquals(self.loop._readers, {})
+
+    def test_async_zmq_playbook_receives_final_stats(self):
+        runs = []
+        stats = []
+        for _ in range(3):
+            p = playbook.AsyncZMQPlaybook(
+                self.get_playbook_path("zmq_runner_on_ok.yml"), loop=self.loop)
+            p.add_hook('v2_playbook_on_stats', stats.append)
+            runs.append(p.run(Inventory(["localhost"])))
+
+        self.loop.run_until_complete(*runs)
+        self.assertEquals(len(stats), 3)
+
+    def test_async_zmq_playbook_drain_timeout(self):
+        p = playbook.AsyncZMQPlaybook(
+            self.get_playbook_path("zmq_runner_on_ok.yml"), loop=self.loop,
+            drain_timeout=0.1)
+        p.logger = mock.MagicMock(return_value=None)
+        # As if the plugin never said 'bye'
+        p._on_bye = mock.Mock()
+        result = p.run(Inventory(["localhost"])).result()
+
+        self.assertEquals(result.returncode, 0)
+        self.assertTrue(p.logger.warning.called)
+
+    def test_event_loop_call_later(self):
+        calls = []
+        self.loop.call_later(0.02, lambda: calls.append('second'))
+        self.loop.call_later(0.01, lambda: calls.append('first'))
+        cancelled = self.loop.call_later(0, lambda: calls.append('cancelled'))
+        self.loop.cancel_call(cancelled)
+
+        for _ in range(20):
+            self.loop.run_once(0.01)
+
+        self.assertEquals(calls, ['first', 'second'])
@@ -0,0 +1,90 @@
+import unittest
+import mock
+import os
+import sys
+import zmq
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from dauber import Inventory
+from dauber.asyncplaybook import AsyncZMQPlaybook
+from dauber.bus import EventBus
+from dauber.loop import EventLoop
+
+class EventBusTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = EventLoop()
+        self.bus = EventBus(self.loop)
+
+    def tearDown(self):
+        self.bus.close()
+
+    def get_playbook_path(self, f):
+        return os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            "playbooks", f)
+
+    def test_bus_concurrent_runs_receive_their_own_events(self):
+        runs = []
+        calls = []
+        for name in ("zmq_runner_on_ok.yml", "zmq_runner_on_failed.yml"):
+            p = AsyncZMQPlaybook(self.get_playbook_path(name), bus=self.bus)
+            p.logger = mock.MagicMock(return_value=None)
+            ok, failed = mock.Mock(), mock.Mock()
+            p.add_hook('v2_runner_on_ok', ok)
+            p.add_hook('v2_runner_on_failed', failed)
+            calls.append((ok, failed))
+            runs.append(p.run(Inventory(["localhost"])))
+
+        self.loop.run_until_complete(*runs)
+
+        (ok1, failed1), (ok2, failed2) = calls
+        # Both gather facts,  only the first one's debug task succeeds
+        self.assertEquals(ok1.call_count, ok2.call_count + 1)
+        self.assertEquals(failed1.call_count, 0)
+        self.assertEquals(failed2.call_count, 1)
+
+    def test_bus_shares_one_socket(self):
+        p1 = AsyncZMQPlaybook(self.get_playbook_path("successful.yml"),
+                              bus=self.bus)
+        p2 = AsyncZMQPlaybook(self.get_playbook_path("successful.yml"),
+                              bus=self.bus)
+        self.assertIs(p1.loop, self.loop)
+        self.assertIsNone(p1.socket)
+        self.assertEquals(p1._env['DAUBER_SOCKET_URI'], self.bus.uri)
+        self.assertEquals(p2._env['DAUBER_SOCKET_URI'], self.bus.uri)
+        self.assertNotEquals(p1.run_id, p2.run_id)
+
+    def test_bus_unregisters_after_run(self):
+        p = AsyncZMQPlaybook(self.get_playbook_path("successful.yml"),
+                             bus=self.bus)
+        run_id = p.run_id
+        self.assertIn(run_id, self.bus._runs)
+        p.run(Inventory(["localhost"])).result()
+        self.assertNotIn(run_id, self.bus._runs)
+        self.assertNotIn('DAUBER_RUN_ID', p._env)
+
+    def test_bus_routes_by_run_id(self):
+        p = mock.Mock()
+        run_id = self.bus.register(p, ['hello'])
+        socket = mock.Mock()
+        socket.recv_multipart.side_effect = [
+            ["{}/v2_runner_on_ok".format(run_id), 'h', 'a', 'k'],
+            ["unknown/v2_runner_on_ok", 'h', 'a', 'k'],
+            zmq.Again()]
+        self.bus._on_socket(socket)
+        p._dispatch_frames.assert_called_once_with(
+            ['v2_runner_on_ok', 'h', 'a', 'k'])
+
+    def test_bus_rejects_other_loop(self):
+        with self.assertRaises(ValueError):
+            AsyncZMQPlaybook(self.get_playbook_path("successful.yml"),
+                             bus=self.bus, loop=EventLoop())
+
+    def test_bus_blocking_run_raises(self):
+        from dauber.zmqplaybook import ZMQPlaybook
+        p = ZMQPlaybook(self.get_playbook_path("successful.yml"),
+                        bus=self.bus)
+        with self.assertRaises(RuntimeError):
+            p.run(Inventory(["localhost"]))
@@ -0,0 +1,121 @@
+import unittest
+import mock
+import os
+import sys
+import threading
+import zmq
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from dauber import Inventory
+from dauber.zmqplaybook import ZMQPlaybook
+from dauber.collector import Collector
+import dauber.transport as transport
+
+class CollectorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.collector = Collector('tcp://127.0.0.1:*', 'tcp://127.0.0.1:*')
+        self.collector.start()
+
+    def tearDown(self):
+        self.collector.close()
+
+    def get_playbook_path(self, f):
+        return os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            "playbooks", f)
+
+    def test_collector_resolves_endpoints(self):
+        self.assertTrue(self.collector.listen.startswith('tcp://127.0.0.1:'))
+        self.assertNotIn('*', self.collector.listen)
+        self.assertNotIn('*', self.collector.publish)
+
+    def test_collector_relays_subscriptions_and_events(self):
+        context = zmq.Context.instance()
+        plugin = context.socket(zmq.XPUB)
+        plugin.connect(self.collector.listen)
+        consumer = context.socket(zmq.SUB)
+        consumer.connect(self.collector.publish)
+        consumer.setsockopt(zmq.SUBSCRIBE, b'run-1/')
+        try:
+            # The subscription reaches the plugin through the collector
+            self.assertTrue(plugin.poll(5000))
+            self.assertEquals(plugin.recv(), b'\x01run-1/')
+
+            plugin.send_multipart([b'run-1/hello', b'json'])
+            self.assertTrue(consumer.poll(5000))
+            self.assertEquals(consumer.recv_multipart(),
+                              [b'run-1/hello', b'json'])
+        finally:
+            plugin.close(linger=0)
+            consumer.close(linger=0)
+
+    def test_collector_two_nodes_over_tcp(self):
+        feed = zmq.Context.instance().socket(zmq.SUB)
+        feed.connect(self.collector.publish)
+        feed.setsockopt(zmq.SUBSCRIBE, b'')
+
+        playbooks, events = [], {}
+        for node in ('node-a', 'node-b'):
+            p = ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"),
+                            collector=(self.collector.listen,
+                                       self.collector.publish),
+                            node=node)
+            p.logger = mock.MagicMock(return_value=None)
+            events[node] = []
+            p.add_hook('v2_runner_on_ok', events[node].append, lazy=True)
+            playbooks.append(p)
+
+        threads = [threading.Thread(target=p.run,
+                                    args=(Inventory(["localhost"]),))
+                   for p in playbooks]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        runs = set()
+        for p, node in zip(playbooks, ('node-a', 'node-b')):
+            self.assertEquals(p.result.returncode, 0)
+            self.assertEquals(p._env['DAUBER_SOCKET_URI'],
+                              self.collector.listen)
+            # Each run only sees its own events
+            self.assertEquals(len(events[node]), 2)
+            for e in events[node]:
+                self.assertEquals(e.topic, 'v2_runner_on_ok')
+                self.assertEquals(e.node, node)
+                self.assertEquals(e.run, p._env['DAUBER_RUN_ID'])
+                self.assertTrue(e.run.startswith(node + '-'))
+            runs.add(p._env['DAUBER_RUN_ID'])
+        self.assertEquals(len(runs), 2)
+
+        # A consumer of the whole feed sees both runs
+        seen = set()
+        while feed.poll(1000):
+            seen.add(feed.recv_multipart()[0].partition(b'/')[0])
+        feed.close(linger=0)
+        self.assertEquals(seen, runs)
+
+
+class TransportTestCase(unittest.TestCase):
+
+    def test_bind_defaults_to_ipc(self):
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        uri, directory = transport.bind(socket)
+        self.assertTrue(uri.startswith('ipc://' + directory))
+        transport.unbind(socket, uri, directory)
+        socket.close(linger=0)
+        self.assertFalse(os.path.exists(directory))
+
+    def test_bind_inproc(self):
+        socket = zmq.Context.instance().socket(zmq.SUB)
+        uri, directory = transport.bind(socket, 'inproc://dauber-test')
+        self.assertEquals(uri, 'inproc://dauber-test')
+        self.assertIsNone(directory)
+        socket.close(linger=0)
+
+    @mock.patch.dict(os.environ, {'DAUBER_NODE': 'ctl-1'})
+    def test_new_run_id(self):
+        self.assertTrue(transport.new_run_id().startswith('ctl-1-'))
+        self.assertNotEquals(transport.new_run_id(), transport.new_run_id())
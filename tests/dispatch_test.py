@@ -0,0 +1,142 @@
+import unittest
+import mock
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.dispatch as dispatch
+
+class HookDispatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.gate = threading.Event()
+        self.calls = []
+
+    def record(self, value):
+        self.calls.append(value)
+
+    def wait_for_gate(self, value):
+        self.gate.wait(5)
+        self.calls.append(value)
+
+    def test_dispatcher_per_key_order(self):
+        with dispatch.HookDispatcher(workers=4) as d:
+            for i in range(200):
+                host = "host%d" % (i % 7)
+                d.submit(host, 'v2_runner_on_ok', self.record, (host, i))
+            d.join()
+
+        self.assertEquals(len(self.calls), 200)
+        for n in range(7):
+            host = "host%d" % n
+            seen = [i for h, i in self.calls if h == host]
+            self.assertEquals(seen, sorted(seen))
+
+    def test_dispatcher_block(self):
+        d = dispatch.HookDispatcher(workers=1, maxsize=1)
+        d.submit('a', 'hook', self.wait_for_gate, 1)
+        time.sleep(0.05)
+        d.submit('a', 'hook', self.record, 2)
+
+        submitter = threading.Thread(target=d.submit,
+                                     args=('a', 'hook', self.record, 3))
+        submitter.start()
+        submitter.join(0.1)
+        self.assertTrue(submitter.is_alive())
+
+        self.gate.set()
+        submitter.join(5)
+        d.close()
+
+        self.assertEquals(self.calls, [1, 2, 3])
+        self.assertEquals(d.stats()['dropped'], 0)
+
+    def test_dispatcher_drop_oldest(self):
+        d = dispatch.HookDispatcher(workers=1, maxsize=2,
+                                    policy=dispatch.DROP_OLDEST)
+        d.submit('a', 'hook', self.wait_for_gate, 0)
+        time.sleep(0.05)
+        for i in range(1, 5):
+            d.submit('a', 'hook', self.record, i)
+
+        self.gate.set()
+        d.close()
+
+        self.assertEquals(self.calls, [0, 3, 4])
+        stats = d.stats()
+        self.assertEquals(stats['dropped'], 2)
+        self.assertEquals(stats['submitted'], 5)
+        self.assertEquals(stats['completed'], 3)
+        self.assertEquals(stats['depth'], 0)
+        self.assertEquals(stats['max_depth'], 3)
+
+    def test_dispatcher_coalesce(self):
+        d = dispatch.HookDispatcher(workers=1, policy=dispatch.COALESCE)
+        d.submit('a', 'hook', self.wait_for_gate, 'first')
+        time.sleep(0.05)
+        d.submit('a', 'hook', self.record, 'a1')
+        d.submit('b', 'hook', self.record, 'b1')
+        d.submit('a', 'hook', self.record, 'a2')
+        d.submit('a', 'other', self.record, 'a-other')
+
+        self.gate.set()
+        d.close()
+
+        self.assertEquals(self.calls, ['first', 'b1', 'a2', 'a-other'])
+        self.assertEquals(d.stats()['coalesced'], 1)
+
+    def test_dispatcher_counts_errors(self):
+        d = dispatch.HookDispatcher(workers=2, logger=mock.Mock())
+        d.submit('a', 'hook', self.record, 1)
+        d.submit('a', 'hook', mock.Mock(side_effect=ValueError))
+        d.submit('a', 'hook', self.record, 2)
+        d.close()
+
+        self.assertEquals(self.calls, [1, 2])
+        self.assertEquals(d.stats()['errors'], 1)
+        self.assertTrue(d.logger.exception.called)
+
+    def test_dispatcher_hostless_calls_are_barriers(self):
+        with dispatch.HookDispatcher(workers=4) as d:
+            d.submit('a', 'hook', self.wait_for_gate, 'a1')
+            d.submit(None, 'task_start', self.record, 'task')
+            d.submit('b', 'hook', self.record, 'b1')
+            # Nothing overtakes the barrier while 'a1' is held up
+            time.sleep(0.1)
+            self.assertEquals(self.calls, [])
+
+            self.gate.set()
+            d.join()
+
+        self.assertEquals(self.calls, ['a1', 'task', 'b1'])
+        self.assertEquals(d.stats()['submitted'], 3)
+        self.assertEquals(d.stats()['completed'], 3)
+        self.assertEquals(d.stats()['depth'], 0)
+
+    def test_dispatcher_barrier_does_not_block_submit(self):
+        d = dispatch.HookDispatcher(workers=2, maxsize=2,
+                                    policy=dispatch.DROP_OLDEST)
+        for i in range(4):
+            d.submit('host%d' % i, 'hook', self.wait_for_gate, i)
+
+        start = time.time()
+        d.submit(None, 'task_start', self.record, 'task')
+        self.assertLess(time.time() - start, 0.1)
+
+        # Dropping makes room by discarding calls,  never the barrier
+        for i in range(4, 8):
+            d.submit('host%d' % i, 'hook', self.record, i)
+        self.gate.set()
+        d.close()
+
+        self.assertIn('task', self.calls)
+        task = self.calls.index('task')
+        self.assertTrue(all(i < 4 for i in self.calls[:task]))
+        self.assertTrue(all(i >= 4 for i in self.calls[task + 1:]))
+
+    def test_dispatcher_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            dispatch.HookDispatcher(policy='drop-newest')
@@ -0,0 +1,46 @@
+import unittest
+import mock
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.event as event
+import dauber.wire as wire
+
+class EventTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.serializer = mock.Mock(wraps=wire.get_serializer('json'))
+
+    def test_event_decodes_on_access(self):
+        e = event.Event('v2_runner_on_ok', '{"host": "localhost"}',
+                        '[{"_result": {}}]', '{}', self.serializer)
+        self.assertFalse(self.serializer.loads.called)
+
+        self.assertEquals(e.host, 'localhost')
+        self.assertEquals(self.serializer.loads.call_count, 1)
+
+        self.assertEquals(e.result, {"_result": {}})
+        self.assertEquals(e.result, {"_result": {}})
+        self.assertEquals(e.kwargs, {})
+        self.assertEquals(self.serializer.loads.call_count, 3)
+
+    def test_event_without_header(self):
+        e = event.Event('v2_playbook_on_stats', '', '[]', '{}',
+                        self.serializer)
+        self.assertEquals(e.host, None)
+        self.assertEquals(e.time, None)
+        self.assertEquals(e.result, None)
+
+    def test_event_time(self):
+        e = event.Event('v2_runner_on_ok', '{"time": 1.5}', '[]', '{}',
+                        self.serializer)
+        self.assertEquals(e.time, 1.5)
+
+    def test_event_node_and_run(self):
+        e = event.Event('v2_runner_on_ok',
+                        '{"node": "ctl-1", "run": "ctl-1-abc"}', '[]', '{}',
+                        self.serializer)
+        self.assertEquals(e.node, 'ctl-1')
+        self.assertEquals(e.run, 'ctl-1-abc')
@@ -0,0 +1,23 @@
+# Builders for dauber.event.Event objects and the (projected) task and
+# result dicts the callback plugin sends,  shared by the tests of modules
+# that consume events.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.wire as wire
+from dauber.event import Event
+
+JSON = wire.get_serializer('json')
+
+def event(topic, header=None, args=(), kwargs=None):
+    return Event(topic, JSON.dumps(header or {}), JSON.dumps(list(args)),
+                 JSON.dumps(kwargs or {}), JSON)
+
+def task(uuid, name, action='debug'):
+    return {'_uuid': uuid, 'name': name, 'action': action}
+
+def result(uuid, name, action='debug', **values):
+    return {'_task': task(uuid, name, action), '_result': values}
@@ -1,6 +1,7 @@
 import unittest
 import os
 import sys
+import json
 sys.path.insert(0, os.path.abspath('..'))
 
 import dauber.inventory as inventory
@@ -310,3 +311,126 @@ localhost
             {"test": ["localhost", "localhost2"]})
 
         self.assertEquals(source.to_string(), target.to_string())
+
+    def test_ansible_inventory_hosts(self):
+        i = inventory.Inventory.from_string('''localhost foo=bar
+
+[some_group]
+localhost foo=other
+192.168.1.10
+
+[another group]
+192.168.1.11
+''')
+        self.assertEquals(i.hosts, ['localhost', '192.168.1.10', '192.168.1.11'])
+
+    def test_ansible_inventory_shard(self):
+        i = inventory.Inventory.from_string('''host1 foo=bar
+host2
+
+[some_group]
+host1 foo=other
+host3
+
+[another group]
+host4
+host2
+''')
+        shards = i.shard(2)
+        self.assertEquals(len(shards), 2)
+
+        self.assertEquals(shards[0].to_string(), '''host1 foo=bar
+
+[some_group]
+host1 foo=other
+host3
+
+[another group]
+
+
+''')
+        self.assertEquals(shards[1].to_string(), '''host2
+
+[some_group]
+
+
+[another group]
+host4
+host2
+
+''')
+
+    def test_ansible_inventory_shard_expands_ranges(self):
+        i = inventory.Inventory.from_string('''web[001:500] role=web
+
+[db]
+db[1:4]
+''')
+        shards = i.shard(8)
+        self.assertEquals(len(shards), 8)
+
+        names = [name for s in shards for name in s.hosts]
+        self.assertEquals(len(names), 504)
+        self.assertEquals(len(set(names)), 504)
+        for s in shards:
+            self.assertIn(len(s.hosts), (63, 64))
+            for host in s.global_hosts:
+                self.assertEquals(host.variables, {'role': 'web'})
+
+        self.assertEquals(shards[0].global_hosts[0].host, 'web001')
+        self.assertEquals([h.host for h in shards[4].sections[0].items],
+                          ['db1'])
+
+    def test_ansible_inventory_shard_more_shards_than_hosts(self):
+        i = inventory.Inventory(['host1', 'host2'])
+        shards = i.shard(8)
+        self.assertEquals(len(shards), 2)
+        self.assertEquals([s.hosts for s in shards], [['host1'], ['host2']])
+
+    def test_ansible_inventory_to_json_with_ungrouped(self):
+        i = inventory.Inventory.from_string('''localhost foo=bar
+192.168.1.10
+
+[some_group]
+localhost foo=other
+''')
+        d = json.loads(i.to_json(with_ungrouped=True))
+
+        self.assertEquals(d['ungrouped'], ['localhost', '192.168.1.10'])
+        self.assertEquals(d['some_group'], ['localhost'])
+        self.assertEquals(d['_meta']['hostvars']['localhost'], {'foo': 'other'})
+
+        # Merging group variables must not modify the hosts themselves
+        self.assertEquals(i.global_hosts[0].variables, {'foo': 'bar'})
+
+        # Nor the variables of a host in several groups
+        i = inventory.Inventory.from_string('[a]\nh x=1\n\n[b]\nh y=2\n')
+        d = json.loads(i.to_json(with_ungrouped=True))
+
+        self.assertEquals(d['_meta']['hostvars']['h'], {'x': '1', 'y': '2'})
+        self.assertEquals(i.sections[0].items[0].variables, {'x': '1'})
+        self.assertEquals(i.sections[1].items[0].variables, {'y': '2'})
+
+    def test_ansible_inventory_to_json_expands_ranges(self):
+        i = inventory.Inventory.from_string('''web[01:02].example.com n=1
+
+[db]
+db-[a:c:2]
+''')
+        d = json.loads(i.to_json(with_ungrouped=True))
+
+        self.assertEquals(d['ungrouped'],
+                          ['web01.example.com', 'web02.example.com'])
+        self.assertEquals(d['db'], ['db-a', 'db-c'])
+        self.assertEquals(d['_meta']['hostvars']['web02.example.com'],
+                          {'n': '1'})
+
+    def test_expand_host_pattern(self):
+        self.assertEquals(inventory.expand_host_pattern('localhost'),
+                          ['localhost'])
+        self.assertEquals(inventory.expand_host_pattern('h[8:10]'),
+                          ['h8', 'h9', 'h10'])
+        self.assertEquals(inventory.expand_host_pattern('h[1:2]-[a:b]'),
+                          ['h1-a', 'h1-b', 'h2-a', 'h2-b'])
+        with self.assertRaises(ValueError):
+            inventory.expand_host_pattern('h[01:100]')
@@ -0,0 +1,93 @@
+import unittest
+import mock
+import os
+import stat
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.inventorycache as inventorycache
+import dauber.playbook as playbook
+from dauber import Inventory
+
+class InventoryCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = inventorycache.InventoryCache(max_entries=2)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_inventory_cache_shares_identical_content(self):
+        a = self.cache.acquire(Inventory(['localhost']))
+        b = self.cache.acquire(Inventory(['localhost']))
+        c = self.cache.acquire(Inventory(['otherhost']))
+
+        self.assertEquals(a, b)
+        self.assertNotEquals(a, c)
+        self.assertEquals(len(self.cache), 2)
+
+        with open(a, 'rb') as fh:
+            self.assertEquals(fh.read(), 'localhost\n')
+
+    def test_inventory_cache_files_are_read_only(self):
+        path = self.cache.acquire(Inventory(['localhost']))
+        self.assertEquals(stat.S_IMODE(os.stat(path).st_mode), stat.S_IRUSR)
+
+    def test_inventory_cache_keeps_referenced_entries(self):
+        paths = [self.cache.acquire(Inventory(['host%s' % i]))
+                 for i in range(3)]
+
+        # Over max_entries,  but everything is still in use
+        self.assertEquals(len(self.cache), 3)
+        for path in paths:
+            self.assertTrue(os.path.exists(path))
+
+        self.cache.release(paths[1])
+        self.assertEquals(len(self.cache), 2)
+        self.assertFalse(os.path.exists(paths[1]))
+
+    def test_inventory_cache_evicts_least_recently_used(self):
+        paths = [self.cache.acquire(Inventory(['host%s' % i]))
+                 for i in range(2)]
+        for path in paths:
+            self.cache.release(path)
+
+        # Touch host0 so host1 is the least recently used
+        self.cache.release(self.cache.acquire(Inventory(['host0'])))
+        self.cache.release(self.cache.acquire(Inventory(['host2'])))
+
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[1]))
+
+    def test_inventory_cache_max_bytes(self):
+        cache = inventorycache.InventoryCache(max_entries=None, max_bytes=12)
+        try:
+            a = cache.acquire(Inventory(['localhost']))
+            cache.release(a)
+            b = cache.acquire(Inventory(['otherhost']))
+            self.assertFalse(os.path.exists(a))
+            self.assertTrue(os.path.exists(b))
+        finally:
+            cache.close()
+
+    def test_playbook_uses_inventory_cache(self):
+        def check_inventory(pb_obj):
+            self.assertEquals(os.path.dirname(pb_obj.inventory_path),
+                              self.cache.directory)
+            self.assertTrue(os.path.exists(pb_obj.inventory_path))
+            paths.append(pb_obj.inventory_path)
+
+        paths = []
+        with mock.patch.object(playbook.Playbook, '_run', autospec=True) as _run:
+            _run.side_effect = check_inventory
+
+            p = playbook.Playbook("some_playbook.yml", inventory_cache=self.cache)
+            p.run(Inventory(['localhost']))
+            p.run(Inventory(['localhost']))
+
+        self.assertEquals(len(paths), 2)
+        self.assertEquals(paths[0], paths[1])
+        # Unreferenced,  but kept for the next run
+        self.assertTrue(os.path.exists(paths[0]))
+        self.assertEquals(len(self.cache), 1)
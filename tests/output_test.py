@@ -0,0 +1,119 @@
+import unittest
+import mock
+import os
+import sys
+import tempfile
+import resource
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.output as output
+
+class LineReaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.r, self.w = os.pipe()
+
+    def tearDown(self):
+        for fd in (self.r, self.w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def test_line_reader_complete_lines(self):
+        reader = output.LineReader(self.r)
+        os.write(self.w, "foo\nbar\n")
+        self.assertEquals(reader.read(), ["foo", "bar"])
+        self.assertFalse(reader.closed)
+
+    def test_line_reader_partial_line_does_not_block(self):
+        reader = output.LineReader(self.r)
+        os.write(self.w, "foo\nba")
+        self.assertEquals(reader.read(), ["foo"])
+
+        os.write(self.w, "r\r\n")
+        self.assertEquals(reader.read(), ["bar"])
+
+    def test_line_reader_small_chunks(self):
+        reader = output.LineReader(self.r, chunk_size=3)
+        os.write(self.w, "abcdef\ngh\n")
+        lines = []
+        while len(lines) < 2:
+            lines.extend(reader.read())
+        self.assertEquals(lines, ["abcdef", "gh"])
+
+    def test_line_reader_returns_tail_at_eof(self):
+        reader = output.LineReader(self.r)
+        os.write(self.w, "foo\nno newline")
+        os.close(self.w)
+        self.assertEquals(reader.read(), ["foo"])
+        self.assertEquals(reader.read(), ["no newline"])
+        self.assertTrue(reader.closed)
+
+
+    def test_line_reader_long_line_over_many_chunks(self):
+        reader = output.LineReader(self.r, chunk_size=4)
+        os.write(self.w, "x" * 4002 + "\r\nend\n")
+        lines = []
+        while len(lines) < 2:
+            lines.extend(reader.read())
+        self.assertEquals(lines, ["x" * 4002, "end"])
+
+    def test_line_reader_drain(self):
+        reader = output.LineReader(self.r)
+        os.write(self.w, "foo\nbar")
+        os.close(self.w)
+        self.assertEquals(reader.drain(), ["foo", "bar"])
+        self.assertTrue(reader.closed)
+
+    def test_line_reader_drain_high_descriptor(self):
+        # select() cannot watch descriptors numbered 1024 or above
+        if resource.getrlimit(resource.RLIMIT_NOFILE)[0] <= 1100:
+            self.skipTest("too few file descriptors allowed")
+        fd = os.dup2(self.r, 1100) or 1100
+        try:
+            reader = output.LineReader(fd)
+            os.write(self.w, "foo\n")
+            self.assertEquals(reader.drain(), ["foo"])
+        finally:
+            os.close(fd)
+
+class OutputSinkTestCase(unittest.TestCase):
+
+    def test_logging_sink(self):
+        logger = mock.MagicMock()
+        sink = output.LoggingSink(logger)
+        sink.write('stdout', "ok: [localhost] ")
+        sink.write('stdout', "fatal: [localhost]: FAILED! => {}")
+        sink.write('stderr', "an error")
+
+        logger.info.assert_called_once_with("ok: [localhost]")
+        self.assertEquals(logger.error.call_args_list,
+                          [mock.call("fatal: [localhost]: FAILED! => {}"),
+                           mock.call("an error")])
+
+    def test_ring_buffer_sink_keeps_tail(self):
+        sink = output.RingBufferSink(maxlen=2)
+        for i in range(5):
+            sink.write('stdout', str(i))
+        sink.write('stderr', "err")
+
+        self.assertEquals(sink.tail('stdout'), ["3", "4"])
+        self.assertEquals(sink.tail('stderr'), ["err"])
+
+        sink.clear()
+        self.assertEquals(sink.tail('stdout'), [])
+
+    def test_file_sink(self):
+        _, path = tempfile.mkstemp()
+        try:
+            sink = output.FileSink(path, streams=('stdout',))
+            sink.write('stdout', "foo")
+            sink.write('stderr', "not written")
+            sink.write('stdout', "bar")
+            sink.close()
+
+            with open(path, 'rb') as fh:
+                self.assertEquals(fh.read(), "foo\nbar\n")
+        finally:
+            os.remove(path)
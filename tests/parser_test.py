@@ -0,0 +1,116 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.parser as parser
+import dauber.playbook as playbook
+import dauber.output as output
+from dauber import Inventory
+
+OUTPUT = '''No config file found; using defaults
+
+PLAY [localhost] ***************************************************************
+
+TASK [setup] *******************************************************************
+ok: [localhost]
+
+TASK [debug] *******************************************************************
+ok: [localhost] => {
+    "msg": "Success!"
+}
+changed: [web -> localhost] => (item=foo) => {"changed": true, "item": "foo"}
+failed: [web] (item=bar) => {"failed": true, "item": "bar"}
+skipping: [db] => {"changed": false, "skip_reason": "Conditional check failed", "skipped": true}
+fatal: [other]: FAILED! => {"failed": true, "msg": "'missing' is undefined"}
+fatal: [gone]: UNREACHABLE! => {"changed": false, "unreachable": true}
+
+NO MORE HOSTS LEFT *************************************************************
+	to retry, use: --limit @playbooks/missing_variable.retry
+
+PLAY RECAP *********************************************************************
+localhost                  : ok=2    changed=0    unreachable=0    failed=0   
+web                        : ok=0    changed=1    unreachable=0    failed=1   
+
+'''
+
+class OutputParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = parser.OutputParser()
+        self.events = []
+        for hook in parser.PARSER_HOOK_TOPICS:
+            self.parser.add_hook(
+                hook, lambda e, hook=hook: self.events.append((hook, e)))
+
+    def feed(self, text):
+        for line in text.split('\n'):
+            self.parser.write('stdout', line)
+        self.parser.flush()
+
+    def results(self):
+        return [(hook, e['host'], e['status'])
+                for hook, e in self.events if 'host' in e]
+
+    def test_parser_banners(self):
+        self.feed(OUTPUT)
+        self.assertEquals(
+            [(hook, e.get('task')) for hook, e in self.events
+             if hook.endswith('_start')],
+            [('v2_playbook_on_play_start', None),
+             ('v2_playbook_on_task_start', 'setup'),
+             ('v2_playbook_on_task_start', 'debug')])
+
+    def test_parser_results(self):
+        self.feed(OUTPUT)
+        self.assertEquals(self.results(), [
+            ('v2_runner_on_ok', 'localhost', 'ok'),
+            ('v2_runner_on_ok', 'localhost', 'ok'),
+            ('v2_runner_on_ok', 'web', 'changed'),
+            ('v2_runner_on_failed', 'web', 'failed'),
+            ('v2_runner_on_skipped', 'db', 'skipping'),
+            ('v2_runner_on_failed', 'other', 'fatal'),
+            ('v2_runner_on_unreachable', 'gone', 'unreachable')])
+
+    def test_parser_result_payloads(self):
+        self.feed(OUTPUT)
+        events = [e for hook, e in self.events if 'host' in e]
+
+        self.assertEquals(events[0]['result'], None)
+        self.assertEquals(events[1]['result'], {"msg": "Success!"})
+        self.assertEquals(events[1]['play'], 'localhost')
+        self.assertEquals(events[1]['task'], 'debug')
+        self.assertEquals(events[2]['item'], 'foo')
+        self.assertEquals(events[2]['result']['changed'], True)
+        self.assertEquals(events[3]['item'], 'bar')
+
+    def test_parser_stats(self):
+        self.feed(OUTPUT)
+        hook, stats = self.events[-1]
+        self.assertEquals(hook, 'v2_playbook_on_stats')
+        self.assertEquals(stats['localhost'],
+                          {'ok': 2, 'changed': 0, 'unreachable': 0,
+                           'failed': 0})
+        self.assertEquals(stats['web']['failed'], 1)
+
+    def test_parser_ignores_stderr(self):
+        self.parser.write('stderr', "ok: [localhost]")
+        self.parser.flush()
+        self.assertEquals(self.events, [])
+
+    def test_parser_unknown_hook(self):
+        with self.assertRaises(AssertionError):
+            self.parser.add_hook('v2_on_any', lambda e: None)
+
+    def test_parser_as_playbook_sink(self):
+        p = playbook.Playbook(
+            os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                         "playbooks", "missing_variable.yml"),
+            sinks=[self.parser, output.DiscardSink()])
+        code = p.run(Inventory(["localhost"]))
+
+        self.assertNotEquals(code, 0)
+        self.assertIn(('v2_runner_on_failed', 'localhost', 'fatal'),
+                      self.results())
+        self.assertEquals(self.parser.stats['localhost']['failed'], 1)
@@ -7,6 +7,8 @@ import subprocess
 sys.path.insert(0, os.path.abspath('..'))
 
 import dauber.playbook as playbook
+import dauber.output as output
+from dauber.parser import OutputParser
 
 class PlaybookTestCase(unittest.TestCase):
 
@@ -43,6 +45,11 @@ class PlaybookTestCase(unittest.TestCase):
             os.path.dirname(os.path.realpath(__file__)),
             "playbooks", f)
 
+    def get_bin_path(self, f):
+        return os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            "bin", f)
+
     def test_playbook_inventory_constructor_argument(self):
         p = playbook.Playbook(self.get_playbook_path("successful.yml"),
                               playbook.Inventory("localhost"))
@@ -70,6 +77,64 @@ class PlaybookTestCase(unittest.TestCase):
         code = p.run(playbook.Inventory("localhost"))
         self.assertNotEquals(code, 0)
 
+    def test_playbook_drains_output(self):
+        p = playbook.Playbook("some_playbook.yml", "some_inventory",
+                              ansible_playbook_bin=self.get_bin_path(
+                                  "chatty-ansible-playbook"))
+        p.logger = mock.MagicMock(return_value=None)
+        code = p.run()
+
+        self.assertEquals(code, 0)
+        self.assertEquals(p.logger.info.call_count, 5001)
+        p.logger.info.assert_called_with("last line without newline")
+        p.logger.error.assert_called_with("an error on stderr")
+
+    def test_playbook_run_timings(self):
+        # A process that exits at once often closes its pipes before the
+        # loop sees it exit
+        for _ in range(10):
+            p = playbook.Playbook("some_playbook.yml", "some_inventory",
+                                  ansible_playbook_bin="/bin/true")
+            p.logger = mock.MagicMock(return_value=None)
+            self.assertEquals(p.run(), 0)
+
+            timings = p.result.timings
+            for phase in ('render', 'spawn', 'cleanup'):
+                self.assertIn(phase, timings.durations)
+            self.assertLessEqual(timings.marks['spawn'],
+                                 timings.marks['exit'])
+            self.assertLessEqual(timings.marks['exit'],
+                                 timings.marks['cleanup'])
+
+    def test_playbook_ring_buffer_sink(self):
+        sink = output.RingBufferSink(maxlen=10)
+        p = playbook.Playbook("some_playbook.yml", "some_inventory",
+                              ansible_playbook_bin=self.get_bin_path(
+                                  "chatty-ansible-playbook"),
+                              sinks=[sink])
+        p.logger = mock.MagicMock(return_value=None)
+        code = p.run()
+
+        self.assertEquals(code, 0)
+        self.assertFalse(p.logger.info.called)
+        self.assertEquals(p.result.returncode, 0)
+        self.assertEquals(len(p.result.stdout), 10)
+        self.assertEquals(p.result.stdout[-1], "last line without newline")
+        self.assertEquals(p.result.stderr, ["an error on stderr"])
+
+    def test_playbook_multiple_sinks(self):
+        discard = mock.MagicMock(wraps=output.DiscardSink())
+        p = playbook.Playbook("some_playbook.yml", "some_inventory",
+                              ansible_playbook_bin=self.get_bin_path(
+                                  "chatty-ansible-playbook"),
+                              sinks=[discard,
+                                     output.LoggingSink(mock.MagicMock())])
+        p.run()
+
+        self.assertEquals(discard.write.call_count, 5002)
+        self.assertTrue(discard.flush.called)
+        self.assertEquals(p.result.stdout, [])
+
 
     ############
     ## Test prduction of playbook command list
@@ -218,6 +283,86 @@ class PlaybookTestCase(unittest.TestCase):
         p.run()
 
 
+    @mock.patch("dauber.playbook.subprocess")
+    def test_construction_does_not_spawn(self, subprocess):
+        playbook.Playbook("some_playbook.yml", "some_inventory")
+        self.assertFalse(subprocess.call.called)
+        self.assertFalse(subprocess.Popen.called)
+
+    def test_env_copy_on_write(self):
+        base = {"FOO": "foo", "BAR": "bar"}
+        env = playbook.CopyOnWriteEnv(base, {"BAZ": "baz"})
+        env["FOO"] = "other"
+        del env["BAR"]
+
+        self.assertEquals(base, {"FOO": "foo", "BAR": "bar"})
+        self.assertEquals(env.to_dict(), {"FOO": "other", "BAZ": "baz"})
+        self.assertEquals(dict(env), env.to_dict())
+        self.assertNotIn("BAR", env)
+        with self.assertRaises(KeyError):
+            env["BAR"]
+
+        env["BAR"] = "again"
+        self.assertEquals(env["BAR"], "again")
+
+    def test_env_snapshot_on_first_write(self):
+        base = {"FOO": "foo"}
+        env = playbook.CopyOnWriteEnv(base)
+        base["BAR"] = "bar"
+        # Read through until written to
+        self.assertEquals(env["BAR"], "bar")
+
+        env["BAZ"] = "baz"
+        base["FOO"] = "changed"
+        base["QUX"] = "qux"
+        self.assertEquals(env.to_dict(),
+                          {"FOO": "foo", "BAR": "bar", "BAZ": "baz"})
+
+        copy = env.copy()
+        copy["COPY"] = "copy"
+        self.assertNotIn("COPY", env)
+        self.assertEquals(copy["FOO"], "foo")
+
+    def test_env_snapshot_at_spawn(self):
+        with mock.patch.dict(os.environ, {"DAUBER_TEST_VAR": "before"}):
+            p = playbook.Playbook("some_playbook.yml", "some_inventory")
+            env = p._env.to_dict()
+            os.environ["DAUBER_TEST_VAR"] = "after"
+            self.assertEquals(env["DAUBER_TEST_VAR"], "before")
+            self.assertEquals(p._env["DAUBER_TEST_VAR"], "before")
+
+    ############
+    ## Test ansible-playbook binary resolution
+    #####
+
+    def test_find_executable(self):
+        bin_dir = os.path.dirname(self.get_bin_path("chatty-ansible-playbook"))
+        path = os.pathsep.join(["/nonexistent", bin_dir])
+
+        self.assertEquals(playbook.find_executable("chatty-ansible-playbook", path),
+                          self.get_bin_path("chatty-ansible-playbook"))
+        self.assertIsNone(playbook.find_executable("chatty-ansible-playbook", "/nonexistent"))
+        self.assertIsNone(playbook.find_executable("not-a-real-binary", path))
+
+        # Paths are checked directly rather than searched for
+        self.assertEquals(playbook.find_executable(
+            self.get_bin_path("chatty-ansible-playbook"), "/nonexistent"),
+            self.get_bin_path("chatty-ansible-playbook"))
+
+    @mock.patch("dauber.playbook.os.access")
+    def test_find_executable_cached_per_path(self, access):
+        access.return_value = True
+        playbook._executable_cache['path'] = None
+        bin_dir = os.path.dirname(self.get_bin_path("chatty-ansible-playbook"))
+
+        playbook.find_executable("chatty-ansible-playbook", bin_dir)
+        playbook.find_executable("chatty-ansible-playbook", bin_dir)
+        self.assertEquals(access.call_count, 1)
+
+        playbook.find_executable("chatty-ansible-playbook",
+                                 os.pathsep.join([bin_dir, "/nonexistent"]))
+        self.assertEquals(access.call_count, 2)
+
     ############
     ## Test Inventory temporary file creation
     #####
@@ -250,3 +395,47 @@ class PlaybookTestCase(unittest.TestCase):
         # Once run is complete we ensure that temp_inventory no longer exists
         # i.e.,  it has been cleaned up by the run() function
         self.assertFalse(os.path.exists("/tmp/temp_inventory"))
+
+
+    ############
+    ## Test diskless Inventory delivery
+    #####
+
+    def test_cmd_diskless_inventory(self):
+        p = playbook.Playbook("some_playbook.yml", playbook.Inventory(['localhost']),
+                              diskless_inventory=True)
+        self.assertTupleInList(("-i", playbook.InventoryPipe.script), p.cmd)
+
+    @mock.patch("dauber.playbook.tempfile")
+    def test_diskless_inventory_run(self, tempfile):
+        p = playbook.Playbook(self.get_playbook_path("successful.yml"),
+                              diskless_inventory=True)
+        p.logger = mock.MagicMock(return_value=None)
+
+        code = p.run(playbook.Inventory(['localhost']))
+
+        self.assertEquals(code, 0)
+        self.assertFalse(tempfile.mkstemp.called)
+        self.assertNotIn('DAUBER_INVENTORY_FD', p._env)
+        self.assertIn(mock.call("localhost                  : ok=2    changed=0    unreachable=0    failed=0"),
+                      p.logger.info.call_args_list)
+
+    def test_diskless_inventory_expands_host_ranges(self):
+        inv = playbook.Inventory.from_string(
+            "web[01:02].example.com n=1\n\n[db]\ndb-[a:b]\n")
+
+        hosts = {}
+        for diskless in (False, True):
+            parser = OutputParser()
+            seen = hosts[diskless] = []
+            parser.add_hook('v2_runner_on_ok',
+                            lambda event: seen.append(event['host']))
+            p = playbook.Playbook(self.get_playbook_path("all_hosts.yml"),
+                                  diskless_inventory=diskless,
+                                  sinks=[parser])
+            self.assertEquals(p.run(inv), 0)
+
+        self.assertEquals(sorted(hosts[True]), sorted(hosts[False]))
+        self.assertEquals(sorted(hosts[True]),
+                          ['db-a', 'db-b',
+                           'web01.example.com', 'web02.example.com'])
@@ -0,0 +1,101 @@
+import unittest
+import mock
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.pool as pool
+from dauber import Playbook, Inventory
+from dauber.zmqplaybook import ZMQPlaybook
+
+class PlaybookPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def get_playbook_path(self, f):
+        return os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            "playbooks", f)
+
+    def get_bin_path(self, f):
+        return os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            "bin", f)
+
+    def chatty_playbook(self):
+        p = Playbook("some_playbook.yml", "some_inventory",
+                     ansible_playbook_bin=self.get_bin_path(
+                         "chatty-ansible-playbook"))
+        p.logger = mock.MagicMock(return_value=None)
+        return p
+
+    def test_pool_map_results_in_order(self):
+        p = Playbook(self.get_playbook_path("successful.yml"))
+        failing = Playbook(self.get_playbook_path("missing_variable.yml"))
+        failing.logger = mock.MagicMock(return_value=None)
+
+        with pool.PlaybookPool(max_workers=2) as pl:
+            results = list(pl.map([(p, Inventory(["localhost"])),
+                                   (failing, Inventory(["localhost"])),
+                                   (p, Inventory(["localhost"]))]))
+
+        self.assertEquals([r.returncode == 0 for r in results],
+                          [True, False, True])
+
+    def test_pool_captures_output(self):
+        pl = pool.PlaybookPool(max_workers=2)
+        run = pl.submit(self.chatty_playbook())
+        result = run.result()
+
+        self.assertEquals(result.returncode, 0)
+        self.assertEquals(len(result.stdout), 5001)
+        self.assertEquals(result.stdout[-1], "last line without newline")
+        self.assertEquals(result.stderr, ["an error on stderr"])
+
+    def test_pool_respects_max_workers(self):
+        pl = pool.PlaybookPool(max_workers=2)
+        p = self.chatty_playbook()
+        runs = [pl.submit(p) for _ in range(5)]
+
+        self.assertEquals(len([r for r in runs if r.process is not None]), 2)
+
+        completed = list(pl.as_completed())
+        self.assertEquals(len(completed), 5)
+        self.assertEquals(set(completed), set(runs))
+        for run in runs:
+            self.assertEquals(run.result().returncode, 0)
+
+    def test_pool_does_not_share_playbook_state(self):
+        pl = pool.PlaybookPool(max_workers=3)
+        p = Playbook(self.get_playbook_path("successful.yml"))
+        runs = [pl.submit(p, Inventory(["localhost"])) for _ in range(3)]
+
+        paths = set(run.playbook.inventory_path for run in runs)
+        self.assertEquals(len(paths), 3)
+        pl.wait()
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+        self.assertIsNone(p.inventory)
+
+    def test_pool_many_jobs_failing_to_launch(self):
+        missing = Playbook("some_playbook.yml", "some_inventory",
+                           ansible_playbook_bin="/nonexistent/ansible-playbook")
+        missing.logger = mock.MagicMock(return_value=None)
+
+        with pool.PlaybookPool(max_workers=1) as p:
+            first = p.submit(self.chatty_playbook())
+            runs = [p.submit(missing) for _ in range(sys.getrecursionlimit())]
+
+        self.assertEquals(first.result().returncode, 0)
+        for run in runs:
+            self.assertIsInstance(run.exception(), OSError)
+
+    def test_pool_rejects_zmq_playbook(self):
+        pl = pool.PlaybookPool()
+        with self.assertRaises(TypeError):
+            pl.submit(ZMQPlaybook(self.get_playbook_path("successful.yml")))
@@ -0,0 +1,107 @@
+import unittest
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+from dauber.profiler import TaskProfiler, TaskProfile, percentile
+from dauber.zmqplaybook import ZMQPlaybook
+from dauber.dispatch import HookDispatcher
+from dauber import Inventory
+from fixtures import event, task, result
+
+class TaskProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = TaskProfiler()
+        p = self.profiler
+        p._on_play_start(event('v2_playbook_on_play_start', {'time': 0.0},
+                               [{'name': 'rollout'}]))
+        p._on_task_start(event('v2_playbook_on_task_start', {'time': 10.0},
+                               [task('t1', 'install')]))
+        p._on_result(event('v2_runner_on_ok', {'time': 11.0, 'host': 'web1'},
+                           [result('t1', 'install')]))
+        p._on_result(event('v2_runner_on_ok', {'time': 14.0, 'host': 'web2'},
+                           [result('t1', 'install')]))
+        p._on_task_start(event('v2_playbook_on_task_start', {'time': 20.0},
+                               [task('t2', 'restart')]))
+        p._on_result(event('v2_runner_on_failed',
+                           {'time': 25.0, 'host': 'web1'},
+                           [result('t2', 'restart')]))
+        p._on_result(event('v2_runner_on_ok', {'time': 21.0, 'host': 'web2'},
+                           [result('t2', 'restart')]))
+
+    def test_percentile(self):
+        self.assertEquals(percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEquals(percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertEquals(percentile([1, 2, 3, 4], 100), 4)
+        self.assertEquals(percentile([7], 90), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_histogram(self):
+        t = TaskProfile('t', 'name', None, 0, {'a': 0.005, 'b': 0.02,
+                                                'c': 0.02, 'd': 5000})
+        histogram = t.histogram(buckets=(0.01, 0.1, 1))
+        self.assertEquals(histogram, [[0.01, 1], [0.1, 2], [1, 0], [None, 1]])
+
+    def test_task_durations(self):
+        report = self.profiler.report()
+        install, restart = report.tasks
+        self.assertEquals(install.name, 'install')
+        self.assertEquals(install.play, 'rollout')
+        self.assertEquals(install.durations, {'web1': 1.0, 'web2': 4.0})
+        self.assertEquals(install.percentile(50), 2.5)
+        self.assertEquals(restart.slowest, ('web1', 5.0))
+
+    def test_slowest_hosts_and_critical_path(self):
+        report = self.profiler.report()
+        self.assertEquals(report.slowest_hosts(), [('web1', 6.0),
+                                                   ('web2', 5.0)])
+        self.assertEquals(report.slowest_hosts(1), [('web1', 6.0)])
+        self.assertEquals([t.name for t in report.slowest_tasks()],
+                          ['restart', 'install'])
+        self.assertEquals(report.critical_path(),
+                          (9.0, [('install', 'web2', 4.0),
+                                 ('restart', 'web1', 5.0)]))
+
+    def test_to_json(self):
+        data = json.loads(self.profiler.report().to_json())
+        self.assertEquals(data['critical_path']['seconds'], 9.0)
+        self.assertEquals(data['tasks'][0]['percentiles']['100'], 4.0)
+        self.assertEquals(data['tasks'][0]['count'], 2)
+        self.assertEquals(data['slowest_hosts'][0], ['web1', 6.0])
+
+    def test_result_without_task_start(self):
+        self.profiler._on_result(event('v2_runner_on_ok',
+                                       {'time': 30.0, 'host': 'web1'},
+                                       [result('t3', 'orphan')]))
+        report = self.profiler.report()
+        self.assertEquals(report.tasks[2].durations, {})
+        self.assertEquals(len(report.critical_path()[1]), 2)
+
+    def test_attached_to_playbook(self):
+        p = ZMQPlaybook(os.path.join(os.path.dirname(
+            os.path.realpath(__file__)), "playbooks", "zmq_runner_on_ok.yml"))
+        profiler = p.add_profiler()
+        p.run(Inventory(["localhost"]))
+
+        report = profiler.report()
+        self.assertEquals([t.name for t in report.tasks], ['setup', 'debug'])
+        for t in report.tasks:
+            self.assertGreaterEqual(t.durations['localhost'], 0)
+        self.assertEquals(report.slowest_hosts()[0][0], 'localhost')
+
+    def test_attached_to_playbook_with_dispatcher(self):
+        with HookDispatcher(workers=4) as dispatcher:
+            p = ZMQPlaybook(os.path.join(os.path.dirname(
+                os.path.realpath(__file__)), "playbooks",
+                "zmq_runner_on_ok.yml"), dispatcher=dispatcher)
+            profiler = p.add_profiler()
+            p.run(Inventory(["localhost"]))
+
+        # Each task start is seen before the results that follow it
+        report = profiler.report()
+        self.assertEquals([t.name for t in report.tasks], ['setup', 'debug'])
+        for t in report.tasks:
+            self.assertIn('localhost', t.durations)
@@ -0,0 +1,83 @@
+import unittest
+import mock
+import io
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.record as record
+
+MESSAGES = [["hello", "json"],
+            ["v2_runner_on_ok", '{"host": "localhost"}', "[{}]", "{}"],
+            ["v2_playbook_on_stats", "{}", "[{}]", "{}"]]
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+class RecordTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "run.rec")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def record(self, messages, clock=None, step=1.0):
+        clock = clock or FakeClock()
+        recorder = record.Recorder(self.path, clock=clock)
+        for frames in messages:
+            recorder.write(frames)
+            clock.now += step
+        recorder.close()
+
+    def test_round_trip(self):
+        self.record(MESSAGES)
+        recorded = list(record.read_recording(self.path))
+        self.assertEquals([frames for _, frames in recorded], MESSAGES)
+        self.assertEquals([offset for offset, _ in recorded], [0.0, 1.0, 2.0])
+
+    def test_append(self):
+        self.record(MESSAGES[:1])
+        self.record(MESSAGES[1:])
+        self.assertEquals(
+            [frames for _, frames in record.read_recording(self.path)],
+            MESSAGES)
+
+    def test_truncated_record(self):
+        self.record(MESSAGES)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        recorded = list(record.read_recording(io.BytesIO(data[:-3])))
+        self.assertEquals([frames for _, frames in recorded], MESSAGES[:2])
+
+    def test_not_a_recording(self):
+        with self.assertRaises(ValueError):
+            list(record.read_recording(io.BytesIO(b"v2_runner_on_ok")))
+
+    def test_replay_full_speed(self):
+        self.record(MESSAGES)
+        playbook = mock.Mock()
+        sleep = mock.Mock()
+        self.assertEquals(record.replay(self.path, playbook, sleep=sleep), 3)
+        self.assertEquals([c[0][0] for c in
+                           playbook._dispatch_frames.call_args_list],
+                          MESSAGES)
+        self.assertFalse(sleep.called)
+
+    def test_replay_at_speed(self):
+        self.record(MESSAGES)
+        clock = FakeClock()
+        record.replay(self.path, mock.Mock(), speed=2.0, clock=clock,
+                      sleep=clock.sleep)
+        self.assertEquals(clock.now, 1.0)
@@ -0,0 +1,56 @@
+import unittest
+import mock
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.shard as shard
+from dauber import Inventory
+
+class ShardTestCase(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def get_playbook_path(self, f):
+        return os.path.join(
+            os.path.dirname(os.path.realpath(__file__)),
+            "playbooks", f)
+
+    def test_merge_stats(self):
+        merged = shard.merge_stats([
+            {'ok': {'host1': 2}, 'changed': {'host1': 1}},
+            {'ok': {'host2': 3}, 'failures': {'host2': 1}},
+            {'ok': {'host1': 1}}])
+
+        self.assertEquals(merged, {'ok': {'host1': 3, 'host2': 3},
+                                   'changed': {'host1': 1},
+                                   'failures': {'host2': 1}})
+
+    def test_sharded_playbook_requires_inventory(self):
+        p = shard.ShardedPlaybook(self.get_playbook_path("sharded.yml"))
+        with self.assertRaises(TypeError):
+            p.run("some_inventory")
+
+    def test_sharded_playbook_run(self):
+        p = shard.ShardedPlaybook(self.get_playbook_path("sharded.yml"),
+                                  shards=2)
+        m = mock.Mock()
+        p.add_hook('v2_runner_on_ok', m)
+
+        result = p.run(Inventory.from_string('''host1
+host2
+
+[group]
+host3
+'''))
+
+        self.assertEquals(result.returncode, 0)
+        self.assertEquals(len(result.results), 2)
+        self.assertEquals(m.call_count, 3)
+        self.assertEquals(result.stats['ok'],
+                          {'host1': 1, 'host2': 1, 'host3': 1})
@@ -0,0 +1,42 @@
+import unittest
+import mock
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.timing as timing
+
+class TimingTestCase(unittest.TestCase):
+
+    def test_monotonic_does_not_go_backwards(self):
+        samples = [timing.monotonic() for _ in range(1000)]
+        self.assertEquals(samples, sorted(samples))
+
+    def test_clock_gettime_monotonic(self):
+        clock = timing._clock_gettime_monotonic()
+        a = clock()
+        b = clock()
+        self.assertLessEqual(a, b)
+
+    def test_run_timings(self):
+        clock = mock.Mock(side_effect=[10.0, 10.5, 11.0, 12.0, 12.25, 13.0])
+        timings = timing.RunTimings(clock=clock)
+
+        with timings.phase('render'):
+            pass
+        timings.event()
+        timings.event()
+        timings.mark('exit')
+
+        self.assertEquals(timings.marks, {'render': 0.5,
+                                          'first_event': 2.0,
+                                          'last_event': 2.25,
+                                          'exit': 3.0})
+        self.assertEquals(timings.durations, {'render': 0.5})
+        self.assertEquals(timings.to_dict()['durations'], {'render': 0.5})
+
+    def test_run_timings_end_without_begin(self):
+        timings = timing.RunTimings()
+        timings.end('connect')
+        self.assertEquals(timings.durations, {})
@@ -0,0 +1,38 @@
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath('..'))
+
+import dauber.wire as wire
+
+PAYLOAD = [{"_result": {"changed": False, "msg": "Success!",
+                        "results": [1, 2.5, None, True]},
+            "_task": {"action": "debug", "tags": []}}]
+
+class WireTestCase(unittest.TestCase):
+
+    def test_json_round_trip(self):
+        s = wire.get_serializer('json')
+        self.assertEquals(s.loads(s.dumps(PAYLOAD)), PAYLOAD)
+
+    @unittest.skipIf(wire.msgpack is None, "msgpack is not installed")
+    def test_msgpack_round_trip(self):
+        s = wire.get_serializer('msgpack')
+        decoded = s.loads(s.dumps(PAYLOAD))
+        self.assertEquals(decoded, PAYLOAD)
+        self.assertIsInstance(decoded[0]["_result"]["msg"], unicode)
+
+    def test_unknown_serializer(self):
+        with self.assertRaises(RuntimeError):
+            wire.get_serializer('pickle')
+
+    def test_pack_unpack_frames(self):
+        frames = ["topic", "", "x" * 70000, "\x00\xff"]
+        self.assertEquals(wire.unpack_frames(wire.pack_frames(frames)), frames)
+
+    def test_unpack_batch(self):
+        events = [["v2_runner_on_ok", "{}", "[]", "{}"],
+                  ["v2_playbook_on_stats", "", "[{}]", "{}"]]
+        data = wire.pack_frames([f for e in events for f in e])
+        self.assertEquals(wire.unpack_batch(data), events)
@@ -3,11 +3,20 @@ import mock
 import os
 import sys
 import subprocess
-import mock
+import json
+import imp
+import time
+import threading
+import shutil
+import tempfile
+import pkg_resources as pr
+import zmq
 
 sys.path.insert(0, os.path.abspath('..'))
 
 import dauber.zmqplaybook as playbook
+import dauber.wire as wire
+from dauber.dispatch import HookDispatcher
 from dauber import Inventory
 
 class ZMQPlaybookTestCase(unittest.TestCase):
@@ -23,6 +32,13 @@ class ZMQPlaybookTestCase(unittest.TestCase):
             os.path.dirname(os.path.realpath(__file__)),
             "playbooks", f)
 
+    def load_plugin(self):
+        # Normally imported by ansible before it loads callback plugins
+        import ansible.plugins.callback
+        return imp.load_source(
+            'dauber_zmq_callback',
+            pr.resource_filename('dauber', 'ansible/callback_plugins/zmq.py'))
+
     def check_task_result(self, result, **kwargs):
         self.assertIn('_result', result)
         self.assertIn('_task', result)
@@ -46,6 +62,22 @@ class ZMQPlaybookTestCase(unittest.TestCase):
         p.run(Inventory(["localhost"]))
 
 
+    def test_tcp_endpoint(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"),
+                                 endpoint='tcp://127.0.0.1:*', node='ctl-1')
+        uri = p._env['DAUBER_SOCKET_URI']
+        self.assertTrue(uri.startswith('tcp://127.0.0.1:'))
+        self.assertNotIn('*', uri)
+
+        events = []
+        p.add_hook('v2_runner_on_ok', events.append, lazy=True)
+        p.run(Inventory(["localhost"]))
+        self.assertTrue(events)
+        self.assertEquals(events[0].node, 'ctl-1')
+        self.assertIsNone(events[0].run)
+        self.assertIsNone(p.socket_dir)
+
+
     def test_v2_runner_on_failed_called(self):
         p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_failed.yml"))
         m = mock.Mock()
@@ -142,8 +174,489 @@ class ZMQPlaybookTestCase(unittest.TestCase):
         p.run(Inventory(["localhost"]))
 
 
+    def test_lazy_hook(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"))
+        events = []
+        p.add_hook('v2_runner_on_ok', events.append, lazy=True)
+        p.run(Inventory(["localhost"]))
+
+        self.assertEquals(len(events), 2)
+        self.assertEquals(events[0].topic, 'v2_runner_on_ok')
+        self.assertEquals(events[0].host, 'localhost')
+        self.check_task_result(events[0].result)
+
+    def test_dispatch_decodes_only_what_is_used(self):
+        p = playbook.ZMQPlaybook("some_playbook.yml", serializer='json')
+        p.logger = mock.MagicMock(return_value=None)
+        hosts = []
+        p.add_hook('v2_runner_on_ok', lambda e: hosts.append(e.host),
+                   lazy=True)
+
+        # Neither the payload of an unhooked topic nor the arguments of a
+        # lazy hook that only reads the host are decoded
+        p._dispatch('v2_runner_on_failed', '{', 'not json', 'not json')
+        p._dispatch('v2_runner_on_ok', '{"host": "localhost"}',
+                    'not json', 'not json')
+        self.assertEquals(hosts, ['localhost'])
+
+    def test_hook_fields(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"))
+        m = mock.Mock()
+        p.add_hook('v2_runner_on_ok', m,
+                   fields=['_result.msg', '_host.name', '_task.action'])
+        p.run(Inventory(["localhost"]))
+
+        self.assertTrue(m.called)
+        result = m.call_args[0][0]
+        self.assertEquals(result, {'_result': {'msg': 'Should trigger on_ok'},
+                                   '_host': {'name': 'localhost'},
+                                   '_task': {'action': 'debug'}})
+
+    def test_hook_fields_environment(self):
+        p = playbook.ZMQPlaybook("some_playbook.yml")
+        p.add_hook('v2_runner_on_ok', mock.Mock(), fields=['_host.name'])
+        p.add_hook('v2_runner_on_ok', mock.Mock(), fields=['_result.changed'])
+        p.add_hook('v2_runner_on_failed', mock.Mock(), fields=['_host.name'])
+        p.add_hook('v2_runner_on_failed', mock.Mock())
+
+        # A hook without fields needs the whole argument
+        self.assertEquals(json.loads(p._env['DAUBER_FIELDS']),
+                          {'v2_runner_on_ok': ['_host.name',
+                                               '_result.changed']})
+
+    def record_topics(self, p, topics):
+        for hook in ('v2_playbook_on_play_start', 'v2_playbook_on_task_start',
+                     'v2_runner_on_ok', 'v2_playbook_on_stats'):
+            p.add_hook(hook, lambda e: topics.append(e.topic), lazy=True)
+
+    def test_batched_events_keep_order(self):
+        expected = []
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"))
+        self.record_topics(p, expected)
+        p.run(Inventory(["localhost"]))
+
+        topics = []
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"),
+                                 batch_size=100, batch_interval=60)
+        self.record_topics(p, topics)
+        p.run(Inventory(["localhost"]))
+
+        self.assertEquals(topics, expected)
+        self.assertEquals(topics[-1], 'v2_playbook_on_stats')
+
+    def test_batch_size(self):
+        topics = []
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"),
+                                 batch_size=2, batch_interval=60)
+        self.record_topics(p, topics)
+        p.run(Inventory(["localhost"]))
+        self.assertEquals(len(topics), 6)
+
+    def test_plugin_batcher(self):
+        plugin = self.load_plugin()
+        publisher = mock.Mock()
+        sent = threading.Event()
+        publisher.send.side_effect = lambda frames, events: sent.set()
+
+        batcher = plugin.Batcher(publisher, size=10, interval=0.05)
+        batcher.add(["a", "b"])
+        batcher.add(["c", "d"])
+        self.assertFalse(publisher.send.called)
+
+        # Flushed by the interval
+        self.assertTrue(sent.wait(5))
+        (topic, data), events = publisher.send.call_args[0]
+        self.assertEquals(topic, 'batch')
+        self.assertEquals(wire.unpack_frames(data), ["a", "b", "c", "d"])
+        self.assertEquals(events, 2)
+
+        # Flushed right away when asked to
+        batcher.add(["e"], flush=True)
+        self.assertEquals(publisher.send.call_count, 2)
+
+        batcher.close()
+        self.assertFalse(batcher.thread.is_alive())
+
+    def test_hook_topics_environment(self):
+        p = playbook.ZMQPlaybook("some_playbook.yml")
+        self.assertNotIn('DAUBER_TOPICS', p._env)
+        p.add_hook('v2_runner_on_ok', mock.Mock())
+        p.add_hook('v2_playbook_on_stats', mock.Mock())
+        self.assertEquals(p._env['DAUBER_TOPICS'],
+                          'v2_playbook_on_stats,v2_runner_on_ok')
+
+    def test_handshake_timeout(self):
+        p = playbook.ZMQPlaybook(
+            "some_playbook.yml", "some_inventory", handshake_timeout=0.2,
+            ansible_playbook_bin=os.path.join(
+                os.path.dirname(os.path.realpath(__file__)),
+                "bin", "silent-ansible-playbook"))
+        p.logger = mock.MagicMock(return_value=None)
+
+        start = time.time()
+        with self.assertRaisesRegexp(RuntimeError, "did not connect"):
+            p.run()
+        self.assertLess(time.time() - start, 5)
+
+    def test_process_exits_before_handshake(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("no_such_playbook.yml"))
+        p.logger = mock.MagicMock(return_value=None)
+        self.assertNotEquals(p.run(Inventory(["localhost"])), 0)
+
+    def test_plugin_handshake_timeout(self):
+        plugin = self.load_plugin()
+
+        env = {'DAUBER_SOCKET_URI': 'ipc:///nonexistent/dauber.socket',
+               'DAUBER_HANDSHAKE_TIMEOUT': '0.1'}
+        with mock.patch.dict(os.environ, env):
+            with self.assertRaisesRegexp(RuntimeError, "waiting for dauber"):
+                plugin.CallbackModule()
+
+    def test_hook_dispatcher(self):
+        calls = []
+        def slow_hook(result):
+            time.sleep(0.2)
+            calls.append(threading.current_thread())
+
+        with HookDispatcher(workers=2) as dispatcher:
+            p = playbook.ZMQPlaybook(
+                self.get_playbook_path("zmq_runner_on_ok.yml"),
+                dispatcher=dispatcher)
+            p.add_hook('v2_runner_on_ok', slow_hook)
+            p.run(Inventory(["localhost"]))
+
+            # Every hook has run by the time run() returns
+            self.assertEquals(len(calls), 2)
+            self.assertNotIn(threading.current_thread(), calls)
+            self.assertEquals(dispatcher.stats()['completed'], 2)
+
+    def test_json_serializer(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"),
+                                 serializer='json')
+        self.assertEquals(p._env['DAUBER_SERIALIZER'], 'json')
+        m = mock.Mock()
+        p.add_hook('v2_playbook_on_stats', m)
+        p.run(Inventory(["localhost"]))
+        self.assertIn('ok', m.call_args[0][0])
+
+    @unittest.skipIf(wire.msgpack is None, "msgpack is not installed")
+    def test_msgpack_serializer(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"),
+                                 serializer='msgpack')
+        p.add_hook('v2_runner_on_ok', self.check_task_result)
+        m = mock.Mock()
+        p.add_hook('v2_playbook_on_stats', m)
+        p.run(Inventory(["localhost"]))
+        self.assertEquals(p._serializer.name, 'msgpack')
+        self.assertIn('ok', m.call_args[0][0])
+
+    def test_serializer_from_environment(self):
+        with mock.patch.dict(os.environ, {'DAUBER_SERIALIZER': 'json'}):
+            p = playbook.ZMQPlaybook("some_playbook.yml")
+        self.assertEquals(p._serializer.name, 'json')
+
+    def test_unknown_serializer(self):
+        with self.assertRaises(RuntimeError):
+            playbook.ZMQPlaybook("some_playbook.yml", serializer='pickle')
+
+    def test_run_timings(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"))
+        p.add_hook('v2_runner_on_ok', mock.Mock())
+        m = mock.Mock()
+        p.add_metrics_hook(m)
+        p.run(Inventory(["localhost"]))
+
+        timings = p.result.timings
+        m.assert_called_once_with(p.result)
+        for phase in ('render', 'spawn', 'connect', 'cleanup'):
+            self.assertIn(phase, timings.durations)
+        self.assertLessEqual(timings.marks['connect'],
+                             timings.marks['first_event'])
+        self.assertLessEqual(timings.marks['first_event'],
+                             timings.marks['last_event'])
+        self.assertLessEqual(timings.marks['last_event'],
+                             timings.marks['exit'])
+        self.assertLessEqual(timings.marks['exit'],
+                             timings.marks['cleanup'])
+
+    def test_final_stats_received(self):
+        for _ in range(3):
+            p = playbook.ZMQPlaybook(
+                self.get_playbook_path("zmq_runner_on_ok.yml"))
+            m = mock.Mock()
+            p.add_hook('v2_playbook_on_stats', m)
+            p.run(Inventory(["localhost"]))
+            self.assertEquals(m.call_count, 1)
+            self.assertTrue(p._finished)
+
+    def test_drain_timeout(self):
+        p = playbook.ZMQPlaybook("some_playbook.yml", drain_timeout=0.1)
+        p.logger = mock.MagicMock(return_value=None)
+        p._connected = True
+
+        start = time.time()
+        p._drain_socket(mock.Mock(returncode=0))
+        self.assertLess(time.time() - start, 5)
+        self.assertTrue(p.logger.warning.called)
+
+    def test_poll_dispatches_ready_items(self):
+        p = playbook.ZMQPlaybook("some_playbook.yml")
+        r, w = os.pipe()
+        try:
+            ready, idle = mock.Mock(), mock.Mock()
+            p._register_socket(r, ready)
+            p._register_socket(p.socket, idle)
+            os.write(w, "x")
+
+            p._poll(1)
+            ready.assert_called_once_with(p, r)
+            self.assertFalse(idle.called)
+
+            p._unregister_socket(r)
+            p._poll(0)
+            self.assertEquals(ready.call_count, 1)
+        finally:
+            os.close(r)
+            os.close(w)
+
+    def test_plugin_says_bye(self):
+        plugin = self.load_plugin()
+
+        callback = plugin.CallbackModule.__new__(plugin.CallbackModule)
+        callback.batcher = mock.Mock()
+        callback.socket = mock.Mock()
+        callback.context = mock.Mock()
+        callback.publisher = plugin.Publisher(callback.socket)
+        callback.dumps = plugin.json_dumps
+        callback.prefix = '3/'
+        callback.timeout = 1
+
+        callback.close()
+        self.assertTrue(callback.batcher.close.called)
+        (topic, data), flags = callback.socket.send_multipart.call_args[0]
+        self.assertEquals(topic, '3/bye')
+        self.assertEquals(json.loads(data),
+                          {'sent': 0, 'dropped': 0, 'spilled': 0})
+        self.assertTrue(callback.socket.close.called)
+
+        # Under 'drop' neither the bye nor the linger waits for dauber
+        self.assertEquals(flags, zmq.NOBLOCK)
+        callback.socket.setsockopt.assert_called_with(
+            zmq.LINGER, int(plugin.DROP_LINGER * 1000))
+
+        callback.publisher.policy = 'block'
+        callback.close()
+        self.assertEquals(callback.socket.send_multipart.call_args[0][1], 0)
+        callback.socket.setsockopt.assert_called_with(zmq.LINGER, 1000)
+
+    def full_socket(self, room):
+        # A socket with room for 'room' more messages
+        socket = mock.Mock()
+        socket.sent = []
+        def send_multipart(frames, flags=0):
+            if len(socket.sent) >= room[0]:
+                raise zmq.Again()
+            socket.sent.append(frames)
+        socket.send_multipart.side_effect = send_multipart
+        return socket
+
+    def test_plugin_publisher_drop(self):
+        plugin = self.load_plugin()
+        room = [1]
+        socket = self.full_socket(room)
+        publisher = plugin.Publisher(socket, 'drop')
+        socket.setsockopt.assert_called_with(zmq.XPUB_NODROP, 1)
+
+        publisher.send(["a"])
+        publisher.send(["b"], events=3)
+        self.assertEquals(socket.sent, [["a"]])
+        self.assertEquals(publisher.stats(),
+                          {'sent': 1, 'dropped': 3, 'spilled': 0})
+
+    def test_plugin_publisher_spill(self):
+        plugin = self.load_plugin()
+        room = [1]
+        socket = self.full_socket(room)
+        publisher = plugin.Publisher(socket, 'spill', spill_limit=2)
+
+        for frames in (["a"], ["b"], ["c"], ["d"]):
+            publisher.send(frames)
+        self.assertEquals(publisher.stats(),
+                          {'sent': 1, 'dropped': 1, 'spilled': 2})
+
+        # Spilled messages are sent first,  in order
+        room[0] = 10
+        publisher.send(["e"])
+        self.assertEquals(socket.sent, [["a"], ["b"], ["c"], ["e"]])
+        self.assertEquals(publisher.stats(),
+                          {'sent': 4, 'dropped': 1, 'spilled': 2})
+
+    def test_plugin_publisher_close_sends_spill(self):
+        plugin = self.load_plugin()
+        room = [0]
+        socket = self.full_socket(room)
+        publisher = plugin.Publisher(socket, 'spill')
+        publisher.send(["a"])
+        publisher.send(["b"])
+
+        room[0] = 1
+        publisher.close(0.1)
+        self.assertEquals(socket.sent, [["a"]])
+        self.assertEquals(publisher.stats(),
+                          {'sent': 1, 'dropped': 1, 'spilled': 2})
+
+    def test_publish_stats(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"),
+                                 sndhwm=100, rcvhwm=100, publish_policy='spill')
+        self.assertEquals(p._env['DAUBER_SNDHWM'], '100')
+        self.assertEquals(p._env['DAUBER_PUBLISH_POLICY'], 'spill')
+
+        headers = []
+        p.add_hook('v2_playbook_on_stats', lambda e: headers.append(e.header),
+                   lazy=True)
+        p.run(Inventory(["localhost"]))
+
+        self.assertEquals(p.result.publish_stats['dropped'], 0)
+        self.assertEquals(p.result.publish_stats['sent'], 1)
+        self.assertEquals(headers[0]['publish'],
+                          {'sent': 0, 'dropped': 0, 'spilled': 0})
+
+    def test_unknown_publish_policy(self):
+        with self.assertRaises(ValueError):
+            playbook.ZMQPlaybook("some_playbook.yml", publish_policy='maybe')
+
+    def test_sndhwm_too_small(self):
+        with self.assertRaises(ValueError):
+            playbook.ZMQPlaybook("some_playbook.yml", sndhwm=1)
+
+    def test_plugin_encoders(self):
+        plugin = self.load_plugin()
 
+        class Base(object):
+            pass
 
+        class Derived(Base):
+            pass
+
+        plugin.register_encoder(Base, lambda obj: "base")
+        self.assertEquals(json.loads(plugin.json_dumps([Derived()])),
+                          ["base"])
+
+        # Registering clears the cached lookups
+        plugin.register_encoder(Derived, lambda obj: "derived")
+        self.assertEquals(json.loads(plugin.json_dumps([Derived(), Base()])),
+                          ["derived", "base"])
+
+        self.assertIsNone(plugin.encoder_for(threading.Thread))
+        with self.assertRaises(TypeError):
+            plugin.json_dumps(threading.Thread())
+
+    def test_plugin_encoder_modules(self):
+        plugin = self.load_plugin()
+
+        module = imp.new_module('dauber_test_encoders')
+        module.register = lambda register: register(
+            threading.Thread, lambda obj: obj.name)
+        with mock.patch.dict(sys.modules, {'dauber_test_encoders': module}):
+            plugin.load_encoders(['dauber_test_encoders'])
+
+        thread = threading.Thread(name="worker")
+        self.assertEquals(json.loads(plugin.json_dumps(thread)), "worker")
+
+    def test_encoders_environment(self):
+        p = playbook.ZMQPlaybook("some_playbook.yml",
+                                 encoders=['site.encoders', 'more.encoders'])
+        self.assertEquals(p._env['DAUBER_ENCODERS'],
+                          'site.encoders,more.encoders')
+
+    def test_events(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"))
+        topics = [e.topic for e in p.events(Inventory(["localhost"]))]
+
+        self.assertEquals(topics.count('v2_runner_on_ok'), 2)
+        self.assertEquals(topics[-1], 'v2_playbook_on_stats')
+        self.assertNotIn('v2_on_any', topics)
+        self.assertEquals(p.result.returncode, 0)
+        # The generator's hooks are gone
+        self.assertEquals(p._hooks, {})
+        self.assertNotIn('DAUBER_TOPICS', p._env)
+
+        # And the playbook still runs without them
+        p.logger = mock.MagicMock(return_value=None)
+        self.assertEquals(p.run(Inventory(["localhost"])), 0)
+
+    def test_events_backpressure(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_runner_on_ok.yml"))
+        events = []
+        for e in p.events(Inventory(["localhost"]), maxsize=1,
+                          topics=['v2_playbook_on_task_start',
+                                  'v2_runner_on_ok', 'v2_playbook_on_stats']):
+            time.sleep(0.1)
+            events.append(e)
+
+        self.assertEquals([e.topic for e in events],
+                          ['v2_playbook_on_task_start', 'v2_runner_on_ok',
+                           'v2_playbook_on_task_start', 'v2_runner_on_ok',
+                           'v2_playbook_on_stats'])
+        self.assertEquals(events[1].host, 'localhost')
+
+    def test_events_stop_early(self):
+        p = playbook.ZMQPlaybook(self.get_playbook_path("zmq_slow.yml"))
+        p.logger = mock.MagicMock(return_value=None)
+
+        start = time.time()
+        events = p.events(Inventory(["localhost"]))
+        for e in events:
+            if e.topic == 'v2_runner_on_ok':
+                break
+        events.close()
+
+        self.assertLess(time.time() - start, 30)
+        self.assertNotEquals(p.result.returncode, 0)
+
+    def test_events_error(self):
+        p = playbook.ZMQPlaybook(
+            "some_playbook.yml", "some_inventory", handshake_timeout=0.2,
+            ansible_playbook_bin=os.path.join(
+                os.path.dirname(os.path.realpath(__file__)),
+                "bin", "silent-ansible-playbook"))
+        p.logger = mock.MagicMock(return_value=None)
+
+        with self.assertRaisesRegexp(RuntimeError, "did not connect"):
+            list(p.events())
+
+    def test_remove_hook(self):
+        p = playbook.ZMQPlaybook("some_playbook.yml")
+        a, b = mock.Mock(), mock.Mock()
+        p.add_hook('v2_runner_on_ok', a, fields=['_host.name'])
+        p.add_hook('v2_runner_on_ok', b)
+        self.assertEquals(json.loads(p._env['DAUBER_FIELDS']), {})
+
+        p.remove_hook('v2_runner_on_ok', b)
+        self.assertEquals(json.loads(p._env['DAUBER_FIELDS']),
+                          {'v2_runner_on_ok': ['_host.name']})
+
+        p.remove_hook('v2_runner_on_ok', a)
+        self.assertNotIn('DAUBER_TOPICS', p._env)
+
+    def test_record_and_replay(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "run.rec")
+            p = playbook.ZMQPlaybook(
+                self.get_playbook_path("zmq_runner_on_ok.yml"), record=path)
+            live = mock.Mock()
+            p.add_hook('v2_runner_on_ok', live)
+            p.run(Inventory(["localhost"]))
+
+            replayed = mock.Mock()
+            p = playbook.ZMQPlaybook("some_playbook.yml")
+            p.add_hook('v2_runner_on_ok', replayed)
+            self.assertTrue(p.replay(path) > 0)
+
+            self.assertEquals(replayed.call_args_list, live.call_args_list)
+        finally:
+            shutil.rmtree(tmpdir)
 
 #     def test_v2_playbook_on_include_called(self):
 #         pass